@@ -1,6 +1,127 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
+from catalog import get_catalog
+from charts import bar_figure, frame_key, line_figure, pie_figure, show_figure
+from query_cache import get_query_cache
+from registry import get_registry
+from versioning import current_version
+
+# Окно скользящего среднего (месяцев)
+ROLLING_MONTHS = 3
+
+
+class MonthlySales:
+    """
+    Плотные помесячные продажи: месяц × продукт × ресторан.
+    Ось месяцев непрерывна (без пропусков), поэтому сдвиг на 12 — тот же месяц прошлого года.
+    """
+
+    def __init__(self, months: pd.DatetimeIndex, products: list[str], restaurants: list[str], values: np.ndarray):
+        self.months = months
+        self.products = products
+        self.restaurants = restaurants
+        self.values = values
+        self.product_index = {name: i for i, name in enumerate(products)}
+        self.restaurant_index = {name: i for i, name in enumerate(restaurants)}
+        self.years = np.unique(months.year)
+        # Годовые суммы (год × продукт × ресторан) для долей и сравнения по городу
+        year_codes = np.searchsorted(self.years, months.year)
+        self.yearly = np.zeros((len(self.years),) + values.shape[1:])
+        np.add.at(self.yearly, year_codes, values)
+
+    def year_totals(self, year: int) -> np.ndarray:
+        """Суммы за год: продукт × ресторан (нули, если года нет в данных)."""
+        pos = np.searchsorted(self.years, year)
+        if pos >= len(self.years) or self.years[pos] != year:
+            return np.zeros(self.values.shape[1:])
+        return self.yearly[pos]
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def monthly_sales(_df: pd.DataFrame, version: str, registry: str) -> MonthlySales | None:
+    """
+    Помесячные продажи всех ресторанов по продуктам порционного набора: суммы по
+    (год, месяц, продукт) для всех ресторанных столбцов из кэша запросов по годам
+    (при дописанных неделях пересчитывается только последний год), затем раскладка в плотный массив.
+    """
+    restaurants = get_registry().layout(_df).names
+    if not restaurants:
+        return None
+    sums = get_query_cache().aggregate_years(_df, ["Month", "Product"], list(restaurants), scope="portion")
+    if sums.empty:
+        return None
+
+    month_key = (pd.to_numeric(sums["Year"], errors="coerce").fillna(0).to_numpy(np.int64) * 12
+                 + pd.to_numeric(sums["Month"], errors="coerce").fillna(1).to_numpy(np.int64) - 1)
+    first = month_key.min()
+    n_months = int(month_key.max() - first + 1)
+    products, product_codes = np.unique(sums["Product"].astype(str).to_numpy(), return_inverse=True)
+    flat = (month_key - first) * len(products) + product_codes
+    size = n_months * len(products)
+
+    # Строки без числового значения дают NaN в сумме — считаются нулём
+    values = sums[list(restaurants)].to_numpy(np.float64, na_value=0)
+    tensor = np.zeros((size, len(restaurants)))
+    np.add.at(tensor, flat, values)
+
+    keys = first + np.arange(n_months)
+    months = pd.to_datetime(pd.DataFrame({"year": keys // 12, "month": keys % 12 + 1, "day": 1}))
+    return MonthlySales(pd.DatetimeIndex(months), products.tolist(), list(restaurants),
+                        tensor.reshape(n_months, len(products), len(restaurants)))
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Скользящее среднее по оси месяцев (NaN, пока окно не заполнено)."""
+    cumsum = np.cumsum(values, axis=0)
+    result = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        result[window - 1:] = cumsum[window - 1:]
+        result[window:] -= cumsum[:-window]
+        result[window - 1:] /= window
+    return result
+
+
+def yoy_growth(values: np.ndarray) -> np.ndarray:
+    """Рост к тому же месяцу прошлого года, % (NaN без базы сравнения)."""
+    result = np.full(values.shape, np.nan)
+    if len(values) > 12:
+        prev = values[:-12]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result[12:] = np.where(prev > 0, (values[12:] - prev) / prev * 100, np.nan)
+    return result
+
+
+def ranks(values: np.ndarray) -> np.ndarray:
+    """Место ресторана по продажам среди ресторанов города (1 — лучший) по последней оси."""
+    order = np.argsort(-values, axis=-1, kind="stable")
+    result = np.empty_like(order)
+    np.put_along_axis(result, order, np.arange(1, values.shape[-1] + 1), axis=-1)
+    return result
+
+
+def city_dynamics(monthly: MonthlySales, restaurants: list[str]) -> pd.DataFrame:
+    """
+    Динамика всех ресторанов и продуктов города за один проход по массиву:
+    продажи, скользящее среднее, рост г/г, место в городе и его изменение за месяц.
+    """
+    cols = [monthly.restaurant_index[name] for name in restaurants]
+    sales = monthly.values[:, :, cols]
+    rank = ranks(sales)
+    rank_change = np.full(sales.shape, np.nan)
+    rank_change[1:] = rank[:-1] - rank[1:]
+
+    n_months, n_products, n_rests = sales.shape
+    return pd.DataFrame({
+        "Дата": np.repeat(monthly.months.to_numpy(), n_products * n_rests),
+        "Продукт": np.tile(np.repeat(monthly.products, n_rests), n_months),
+        "Ресторан": np.tile(restaurants, n_months * n_products),
+        "Продажи": sales.ravel(),
+        "Скользящее среднее": rolling_mean(sales, ROLLING_MONTHS).ravel(),
+        "Рост г/г, %": yoy_growth(sales).ravel(),
+        "Место в городе": rank.ravel(),
+        "Изменение места": rank_change.ravel(),
+    })
 
 
 def analyze_restaurants(df: pd.DataFrame):
@@ -10,47 +131,21 @@ def analyze_restaurants(df: pd.DataFrame):
     st.title("Анализ продаж в ресторанах")
 
     # --- Список продуктов для анализа ---
-    selected_products = [
-        "П/Ф Говядина",
-        "П/Ф Гагава",
-        "П/Ф Курица в соусе",
-        "П/Ф Лакомство от шефа",
-        "П/Ф Цезарь",
-        "П/Ф Чили",
-        "П/Ф Кекиклим",
-        "П/Ф Курица на суп",
-        "П/Ф Картофель Фри 2,5 кг",
-        "П/Ф Луковые кольца 1 кг",
-        "Мозаика",
-        "Пюре из баклажанов",
-        "Соус Баффало",
-        "Соус Песто",
-        "Соус Сладкий перец"
-    ]
-
-    # Фильтруем данные только по указанным продуктам
-    df_filtered = df[df["Product"].isin(selected_products)]
-    if df_filtered.empty:
-        st.warning("Нет данных по указанным продуктам.")
-        return
-
-    # --- Определяем ресторанные столбцы ---
-    base_cols = {"Year", "Month", "Product", "Total", "Week", "Case kg", "SeasonFlag", "Date"}
-    restaurant_cols = [col for col in df.columns if col not in base_cols]
+    selected_products = get_catalog().names_in("portion")
 
-    if not restaurant_cols:
-        st.warning("В данных не обнаружено столбцов с ресторанами. Проверьте формат данных.")
+    # Помесячные продажи по всем ресторанам и продуктам (кэш по версии данных и справочника ресторанов)
+    version = current_version(df)
+    monthly = monthly_sales(df, version, get_registry().fingerprint)
+    if monthly is None:
+        st.warning("Нет данных по указанным продуктам или ресторанам. Проверьте формат данных.")
         return
 
     # --- Фильтры: выбор года, города, ресторана и продукта ---
+    layout = get_registry().layout(df)
     st.sidebar.header("Фильтры анализа")
     selected_year = st.sidebar.selectbox("Выберите год", sorted(df["Year"].unique()))
 
-    cities = set()
-    for col in restaurant_cols:
-        city_name = col.split()[0]
-        cities.add(city_name)
-    cities = list(cities)
+    cities = layout.cities
 
     if not cities:
         st.warning("Не удалось определить города из данных.")
@@ -58,72 +153,92 @@ def analyze_restaurants(df: pd.DataFrame):
 
     selected_city = st.sidebar.selectbox("Выберите город", cities)
 
-    city_cols = [col for col in restaurant_cols if col.startswith(selected_city)]
+    city_cols = layout.city_columns(selected_city)
     if not city_cols:
         st.warning(f"В городе {selected_city} не найдено ресторанов.")
         return
 
     selected_restaurant = st.sidebar.selectbox("Выберите ресторан", city_cols)
     selected_product = st.sidebar.selectbox("Выберите продукт для анализа", selected_products)
+    if selected_product not in monthly.product_index:
+        st.warning(f"Нет продаж продукта '{selected_product}' в загруженных данных.")
+        return
+
+    dynamics = city_dynamics(monthly, city_cols)
+    product_dynamics = dynamics[dynamics["Продукт"] == selected_product]
 
     # --- Анализ динамики ресторана ---
     st.subheader(f"Динамика продаж продукта '{selected_product}' в ресторане: {selected_restaurant}")
 
-    df_rest = df_filtered[(df_filtered["Product"] == selected_product)]
-
-    # Преобразуем столбец ресторана в числовой формат
-    if not pd.api.types.is_numeric_dtype(df_rest[selected_restaurant]):
-        df_rest[selected_restaurant] = pd.to_numeric(df_rest[selected_restaurant], errors='coerce')
-
-    df_rest = df_rest.groupby(["Year", "Month"])[selected_restaurant].sum().reset_index()
-    df_rest["Дата"] = pd.to_datetime(df_rest[["Year", "Month"]].assign(DAY=1))
-
-    fig_line = px.line(
+    df_rest = product_dynamics[product_dynamics["Ресторан"] == selected_restaurant]
+    show_figure("restaurant_dynamics", version, lambda: line_figure(
         df_rest,
         x="Дата",
-        y=selected_restaurant,
+        y=["Продажи", "Скользящее среднее"],
         title=f"Динамика продаж продукта '{selected_product}' в ресторане {selected_restaurant}",
-        labels={"Дата": "Месяц", selected_restaurant: "Продажи"},
+        labels={"Дата": "Месяц", "value": "Продажи", "variable": ""},
         markers=True
-    )
-    st.plotly_chart(fig_line, use_container_width=True)
+    ), params=(selected_product, selected_restaurant, frame_key(df_rest)))
+
+    # --- Динамика всех ресторанов города ---
+    st.subheader(f"Рестораны города {selected_city}: продукт '{selected_product}'")
+
+    show_figure("city_dynamics", version, lambda: line_figure(
+        product_dynamics,
+        x="Дата",
+        y="Продажи",
+        color="Ресторан",
+        title=f"Помесячные продажи продукта '{selected_product}' в ресторанах города {selected_city}",
+        labels={"Дата": "Месяц", "Продажи": "Продажи"}
+    ), params=(selected_product, selected_city, frame_key(product_dynamics)))
+
+    # Последний месяц выбранного года: рост, место в городе и его изменение
+    year_rows = product_dynamics[product_dynamics["Дата"].dt.year == selected_year]
+    if not year_rows.empty:
+        last_month = year_rows["Дата"].max()
+        st.write(f"Показатели за {last_month:%m.%Y}:")
+        st.dataframe(
+            year_rows[year_rows["Дата"] == last_month]
+            .drop(columns=["Дата", "Продукт"])
+            .sort_values("Место в городе")
+            .round(1),
+            hide_index=True
+        )
 
     # --- Круговая диаграмма продаж продуктов в ресторане ---
     st.subheader("Доля продуктов в продажах ресторана")
 
-    df_dynamic = df_filtered.groupby(["Year", "Product"])[selected_restaurant].sum(numeric_only=True).reset_index()
-    fig_pie = px.pie(
-        df_dynamic[df_dynamic["Year"] == selected_year],
+    year_totals = monthly.year_totals(selected_year)
+    df_dynamic = pd.DataFrame({
+        "Product": monthly.products,
+        selected_restaurant: year_totals[:, monthly.restaurant_index[selected_restaurant]],
+    })
+    show_figure("product_share", version, lambda: pie_figure(
+        df_dynamic,
         names="Product",
         values=selected_restaurant,
         title=f"Доля продаж продуктов в ресторане {selected_restaurant} за {selected_year} год",
         hole=0.3,
         width=800,
         height=800
-    )
-    st.plotly_chart(fig_pie, use_container_width=True)
+    ), params=(selected_restaurant, selected_year, frame_key(df_dynamic)))
 
     # --- Сравнительный анализ по городам ---
     st.subheader("Сравнительный анализ по городам")
 
-    if city_cols:
-        df_city = (
-            df_filtered[(df_filtered["Product"] == selected_product) & (df_filtered["Year"] == selected_year)]
-            .groupby(city_cols)
-            .sum(numeric_only=True)
-            .reset_index()
-        )
-
-        df_city = df_city.melt(value_vars=city_cols, var_name="Ресторан", value_name="Продажи")
-
-        fig_city = px.bar(
-            df_city,
-            x="Ресторан",
-            y="Продажи",
-            title=f"Продажи продукта '{selected_product}' в ресторанах города {selected_city} за {selected_year} год",
-            labels={"Ресторан": "Ресторан", "Продажи": "Сумма продаж"}
-        )
-        st.plotly_chart(fig_city, use_container_width=True)
+    # Сумма продаж каждого ресторана города за год из готовых годовых агрегатов
+    product_pos = monthly.product_index[selected_product]
+    df_city = pd.DataFrame({
+        "Ресторан": city_cols,
+        "Продажи": [year_totals[product_pos, monthly.restaurant_index[name]] for name in city_cols],
+    })
+
+    show_figure("city_comparison", version, lambda: bar_figure(
+        df_city,
+        x="Ресторан",
+        y="Продажи",
+        title=f"Продажи продукта '{selected_product}' в ресторанах города {selected_city} за {selected_year} год",
+        labels={"Ресторан": "Ресторан", "Продажи": "Сумма продаж"}
+    ), params=(selected_product, selected_city, selected_year, frame_key(df_city)))
 
     st.success("Анализ завершён! Вы можете выбрать другие параметры.")
-
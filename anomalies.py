@@ -0,0 +1,245 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from array_store import week_axis
+from registry import get_registry
+
+# --- Параметры детектора ---
+WINDOW = 13            # окно скользящей медианы (недель, по центру)
+Z_THRESHOLD = 3.5      # порог робастного z-score
+MAD_SCALE = 1.4826     # MAD -> стандартное отклонение для нормального распределения
+MIN_SCALE_SHARE = 0.1  # нижняя граница масштаба: доля медианы (для почти постоянных рядов)
+CHUNK_BYTES = 64 * 2**20  # предел памяти на блок окон скользящей медианы
+
+# Допуск расхождения Total и суммы ресторанов: max(абсолютный, доля от Total)
+TOTAL_ABS_TOL = 0.5
+TOTAL_REL_TOL = 0.01
+
+# --- Типы аномалий (битовые флаги) ---
+SPIKE, NEGATIVE, ZERO, STORE_ZERO, TOTAL_MISMATCH = 1, 2, 4, 8, 16
+FLAG_LABELS = {
+    SPIKE: "Выброс (z-score)",
+    NEGATIVE: "Отрицательное значение",
+    ZERO: "Нулевая неделя продукта",
+    STORE_ZERO: "Ресторан без продаж за неделю",
+    TOTAL_MISMATCH: "Total ≠ сумме ресторанов",
+}
+
+# Политики очистки: ключ -> подпись в интерфейсе
+POLICIES = {
+    "none": "Не очищать",
+    "cap": "Ограничить выбросы",
+    "interpolate": "Интерполировать",
+    "exclude": "Исключить недели с аномалиями",
+}
+
+
+def total_residual(df: pd.DataFrame, restaurants: list[str]) -> np.ndarray:
+    """Total минус сумма ресторанных столбцов для каждой строки."""
+    values = df[restaurants].apply(pd.to_numeric, errors="coerce").to_numpy(np.float64, na_value=0)
+    total = pd.to_numeric(df["Total"], errors="coerce").to_numpy(np.float64, na_value=0)
+    return total - values.sum(axis=1)
+
+
+def total_mismatch(df: pd.DataFrame, restaurants: list[str], residual: np.ndarray | None = None) -> np.ndarray:
+    """Маска строк, в которых Total расходится с суммой ресторанов больше допуска."""
+    if residual is None:
+        residual = total_residual(df, restaurants)
+    total = pd.to_numeric(df["Total"], errors="coerce").to_numpy(np.float64, na_value=0)
+    return np.abs(residual) > np.maximum(TOTAL_ABS_TOL, TOTAL_REL_TOL * np.abs(total))
+
+
+def rolling_median_mad(values: np.ndarray, window: int = WINDOW) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Скользящие медиана и MAD по оси недель для всех рядов (края дополняются крайним значением).
+    Окна материализуются блоками по оси продуктов: память на блок не больше CHUNK_BYTES,
+    а не недели × продукты × рестораны × окно на весь массив.
+    """
+    half = window // 2
+    series = values.reshape(values.shape[0], -1)
+    median = np.empty(series.shape)
+    mad = np.empty(series.shape)
+    step = max(1, CHUNK_BYTES // max(1, series.shape[0] * window * series.itemsize))
+    for start in range(0, series.shape[1], step):
+        block = np.pad(series[:, start:start + step], [(half, window - 1 - half), (0, 0)], mode="edge")
+        windows = sliding_window_view(block, window, axis=0)
+        median[:, start:start + step] = block_median = np.median(windows, axis=-1)
+        mad[:, start:start + step] = np.median(np.abs(windows - block_median[..., None]), axis=-1)
+    return median.reshape(values.shape), mad.reshape(values.shape)
+
+
+class AnomalyResult:
+    """
+    Результат проверки: плотные массивы неделя × продукт × ресторан (значения, медиана, масштаб, флаги)
+    и привязка строк исходной таблицы к ячейкам (row_cell = -1 для строк с некорректной неделей).
+    """
+
+    def __init__(self, dates, products, restaurants, values, median, scale, flags, total_flags, row_cell, cell_rows):
+        self.dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        self.products = products
+        self.restaurants = restaurants
+        self.values = values
+        self.median = median
+        self.scale = scale
+        self.flags = flags
+        self.total_flags = total_flags
+        self.row_cell = row_cell
+        self.cell_rows = cell_rows
+
+    @property
+    def z(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.scale > 0, (self.values - self.median) / self.scale, 0.0)
+
+    def table(self) -> pd.DataFrame:
+        """Таблица флагов: одна строка на (неделя, продукт, ресторан, тип аномалии)."""
+        parts = []
+        z = self.z
+        for flag, label in FLAG_LABELS.items():
+            if flag == TOTAL_MISMATCH:
+                w, p = np.nonzero(self.total_flags)
+                parts.append(pd.DataFrame({
+                    "Дата": self.dates[w], "Продукт": np.asarray(self.products)[p], "Ресторан": "Total",
+                    "Значение": np.nan, "Медиана": np.nan, "z": np.nan, "Тип": label,
+                }))
+                continue
+            w, p, r = np.nonzero(self.flags & flag)
+            parts.append(pd.DataFrame({
+                "Дата": self.dates[w],
+                "Продукт": np.asarray(self.products)[p],
+                "Ресторан": np.asarray(self.restaurants)[r],
+                "Значение": self.values[w, p, r],
+                "Медиана": self.median[w, p, r],
+                "z": z[w, p, r].round(1),
+                "Тип": label,
+            }))
+        return pd.concat(parts, ignore_index=True).sort_values(["Дата", "Продукт", "Ресторан"], ignore_index=True)
+
+    def summary(self) -> pd.DataFrame:
+        counts = {label: int(np.count_nonzero(self.flags & flag)) for flag, label in FLAG_LABELS.items()}
+        counts[FLAG_LABELS[TOTAL_MISMATCH]] = int(self.total_flags.sum())
+        return pd.DataFrame({"Тип": list(counts), "Количество": list(counts.values())})
+
+    @property
+    def count(self) -> int:
+        return int(np.count_nonzero(self.flags) + self.total_flags.sum())
+
+
+def detect_anomalies(df: pd.DataFrame, restaurants: list[str]) -> AnomalyResult:
+    """
+    Один проход по всем рядам ресторан × продукт: данные раскладываются в плотный массив
+    неделя × продукт × ресторан, после чего все проверки выполняются векторно.
+    """
+    week_codes, dates, valid = week_axis(df)
+    products, product_codes = np.unique(df.loc[valid, "Product"].astype(str).to_numpy(), return_inverse=True)
+    n_dates, n_products, n_rests = len(dates), len(products), len(restaurants)
+    size = n_dates * n_products
+
+    row_cell = np.full(len(df), -1, dtype=np.int64)
+    row_cell[valid] = week_codes * n_products + product_codes
+    cells = row_cell[valid]
+    cell_rows = np.bincount(cells, minlength=size).reshape(n_dates, n_products)
+
+    row_values = df.loc[valid, restaurants].apply(pd.to_numeric, errors="coerce").to_numpy(np.float64, na_value=0)
+    values = np.empty((size, n_rests))
+    for i in range(n_rests):
+        values[:, i] = np.bincount(cells, weights=row_values[:, i], minlength=size)
+    values = values.reshape(n_dates, n_products, n_rests)
+    present = (cell_rows > 0)[:, :, None]
+
+    median, mad = rolling_median_mad(values)
+    # Нижние границы масштаба: доля медианы и пуассоновский шум штучных продаж (√медианы)
+    scale = np.maximum.reduce([MAD_SCALE * mad, MIN_SCALE_SHARE * np.abs(median), np.sqrt(np.abs(median))])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(scale > 0, (values - median) / scale, 0.0)
+
+    flags = np.zeros(values.shape, dtype=np.uint8)
+    flags |= np.where((np.abs(z) > Z_THRESHOLD) & (values != 0) & present, SPIKE, 0).astype(np.uint8)
+    flags |= np.where(values < 0, NEGATIVE, 0).astype(np.uint8)
+
+    # Ресторан без продаж по всем продуктам за неделю, хотя обычно продаёт — закрытие или потеря выгрузки
+    store_week = values.sum(axis=1)
+    store_median, _ = rolling_median_mad(store_week)
+    store_zero = (store_week == 0) & (store_median > 0)
+    flags |= np.where(store_zero[:, None, :] & present, STORE_ZERO, 0).astype(np.uint8)
+    # Нулевая неделя отдельного продукта при ненулевой медиане ряда
+    flags |= np.where((values == 0) & (median > 0) & present & ~store_zero[:, None, :], ZERO, 0).astype(np.uint8)
+
+    total_flags = np.zeros((n_dates, n_products), dtype=bool)
+    if n_rests:
+        mismatch = total_mismatch(df.loc[valid], restaurants)
+        total_flags.ravel()[cells[mismatch]] = True
+
+    return AnomalyResult(dates, products.tolist(), list(restaurants), values, median, scale, flags,
+                         total_flags, row_cell, cell_rows)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def cached_anomalies(_df: pd.DataFrame, version: str, registry: str) -> AnomalyResult:
+    """Проверка набора данных — один раз на версию данных и справочника ресторанов (его fingerprint)."""
+    return detect_anomalies(_df, get_registry().restaurant_columns(_df))
+
+
+def clean_anomalies(df: pd.DataFrame, result: AnomalyResult, policy: str) -> pd.DataFrame:
+    """
+    Применяет политику очистки:
+    cap — выбросы ограничиваются коридором медиана ± Z_THRESHOLD × масштаб, отрицательные — нулём;
+    interpolate — помеченные значения заменяются линейной интерполяцией по неделям;
+    exclude — удаляются строки (неделя, продукт) с любой аномалией.
+    Total пересчитывается на величину изменения ресторанных столбцов.
+    Ячейки, собранные из нескольких строк (дубликаты недели), не изменяются.
+    """
+    if policy == "none" or result.count == 0:
+        return df
+
+    flat_flags = result.flags.reshape(-1, len(result.restaurants))
+    if policy == "exclude":
+        bad_cells = flat_flags.any(axis=1) | result.total_flags.ravel()
+        keep = (result.row_cell < 0) | ~bad_cells[np.maximum(result.row_cell, 0)]
+        return df[keep].reset_index(drop=True)
+
+    values = result.values
+    flagged = result.flags > 0
+    if policy == "cap":
+        bound = Z_THRESHOLD * result.scale
+        cleaned = np.clip(values, result.median - bound, result.median + bound)
+        cleaned = np.where(result.flags & SPIKE, cleaned, values)
+        cleaned = np.maximum(cleaned, 0)
+    elif policy == "interpolate":
+        n_dates = len(result.dates)
+        masked = pd.DataFrame(np.where(flagged, np.nan, values).reshape(n_dates, -1))
+        cleaned = masked.interpolate(limit_direction="both").to_numpy().reshape(values.shape)
+        cleaned = np.where(np.isnan(cleaned), result.median, cleaned)
+    else:
+        raise ValueError(f"Неизвестная политика очистки: {policy}")
+
+    # Переносим ячейки обратно в строки (только однозначно сопоставленные)
+    rows = np.flatnonzero(result.row_cell >= 0)
+    cells = result.row_cell[rows]
+    single = result.cell_rows.ravel()[cells] == 1
+    changed = flat_flags[cells].any(axis=1) & single
+    rows, cells = rows[changed], cells[changed]
+    if not len(rows):
+        return df
+
+    new_values = cleaned.reshape(-1, len(result.restaurants))[cells]
+    old_values = values.reshape(-1, len(result.restaurants))[cells]
+    df = df.copy()
+    rest_pos = [df.columns.get_loc(name) for name in result.restaurants]
+    df[result.restaurants] = df[result.restaurants].astype(np.float64)
+    df.iloc[rows, rest_pos] = new_values
+    total_pos = df.columns.get_loc("Total")
+    df["Total"] = pd.to_numeric(df["Total"], errors="coerce").astype(np.float64)
+    df.iloc[rows, total_pos] = df["Total"].to_numpy()[rows] + (new_values - old_values).sum(axis=1)
+    return df
+
+
+def show_anomalies(result: AnomalyResult):
+    """Сводка и таблица флагов для страницы загрузки."""
+    if result.count == 0:
+        st.success("Аномалий в недельных продажах не обнаружено.")
+        return
+    st.warning(f"Обнаружено аномалий: {result.count}")
+    st.dataframe(result.summary(), hide_index=True)
+    st.dataframe(result.table(), hide_index=True)
@@ -0,0 +1,207 @@
+# HTTP API для внешних систем (ERP, BI): опубликованные прогнозы, планы порций и агрегаты продаж.
+# Работает отдельно от Streamlit и читает те же SQLite и хранилище массивов: python api_server.py --port 8600
+import argparse
+import gzip
+import hashlib
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from api_store import PERIODS, POOL_SIZE, ApiStore, ConnectionPool
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8600
+
+# Пагинация: размер страницы по умолчанию и максимальный
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Ответы короче этого размера не сжимаются: выигрыш меньше накладных расходов gzip
+GZIP_MIN_BYTES = 1024
+
+# Ответ, закреплённый за неизменяемым набором (версия данных, для прогнозов — run_key), не меняется;
+# остальные могут смениться с публикацией новых данных или нового прогноза
+IMMUTABLE_MAX_AGE = 86400
+LATEST_MAX_AGE = 60
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _int_param(params: dict, name: str, default: int | None = None, minimum: int = 0,
+               maximum: int | None = None) -> int | None:
+    value = params.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ApiError(400, f"Параметр {name} должен быть целым числом")
+    if number < minimum or (maximum is not None and number > maximum):
+        raise ApiError(400, f"Параметр {name} вне допустимого диапазона")
+    return number
+
+
+def _page(params: dict) -> tuple[int, int]:
+    page = _int_param(params, "page", 1, minimum=1)
+    size = _int_param(params, "page_size", PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+    return page, size
+
+
+def _paged(version: str, page: int, size: int, total: int, items: list[dict], **extra) -> dict:
+    return {"version": version, **extra, "page": page, "page_size": size, "total": total,
+            "pages": (total + size - 1) // size, "items": items}
+
+
+def _dataset(store: ApiStore, params: dict) -> dict:
+    dataset = store.dataset(params.get("version"))
+    if dataset is None:
+        raise ApiError(404, "Нет опубликованных данных для этой версии")
+    return dataset
+
+
+# Обработчики маршрутов: по параметрам возвращают метку данных (для ETag), функцию построения ответа
+# и признак неизменяемости ответа (для Cache-Control). Метка — ключ неизменяемого опубликованного набора,
+# поэтому повторный запрос с If-None-Match получает 304 без обращения к массивам.
+
+def route_datasets(store: ApiStore, params: dict):
+    datasets = store.datasets()
+    return json.dumps(datasets), lambda: {"items": datasets}, False
+
+
+def route_forecasts(store: ApiStore, params: dict):
+    dataset = _dataset(store, params)
+    grain = params.get("grain", "W")
+    run = store.forecast_run(dataset["version"], grain, params.get("run_key"))
+    if run is None:
+        raise ApiError(404, "Для этой версии данных нет опубликованного пакетного прогноза")
+    page, size = _page(params)
+
+    def build():
+        total, items = store.forecasts(run["run_key"], params.get("restaurant"), params.get("product"),
+                                       params.get("from"), params.get("to"), (page - 1) * size, size)
+        return _paged(dataset["version"], page, size, total, items, grain=grain, horizon=run["horizon"],
+                      run_key=run["run_key"])
+    # По версии отдаётся её последний прогноз, который может смениться; неизменен только ответ по run_key
+    return run["run_key"], build, bool(params.get("version") and params.get("run_key"))
+
+
+def route_portions(store: ApiStore, params: dict):
+    dataset = _dataset(store, params)
+    year, week = _int_param(params, "year"), _int_param(params, "week")
+    page, size = _page(params)
+
+    def build():
+        total, items = store.portions(dataset["version"], year, week, params.get("product"), (page - 1) * size, size)
+        return _paged(dataset["version"], page, size, total, items)
+    return dataset["version"], build, bool(params.get("version"))
+
+
+def route_sales(store: ApiStore, params: dict):
+    dataset = _dataset(store, params)
+    period = params.get("period", "W")
+    if period not in PERIODS:
+        raise ApiError(400, f"period: одно из {', '.join(PERIODS)}")
+    group_by = tuple(part for part in params.get("group_by", "").split(",") if part)
+    if set(group_by) - {"restaurant", "product"}:
+        raise ApiError(400, "group_by: restaurant и/или product")
+    page, size = _page(params)
+
+    def build():
+        total, items = store.sales(dataset["history_key"], params.get("restaurant"), params.get("product"),
+                                   params.get("from"), params.get("to"), period, group_by, (page - 1) * size, size)
+        return _paged(dataset["version"], page, size, total, items, period=period)
+    return dataset["history_key"], build, bool(params.get("version"))
+
+
+ROUTES = {
+    "/api/datasets": route_datasets,
+    "/api/forecasts": route_forecasts,
+    "/api/portions": route_portions,
+    "/api/sales": route_sales,
+}
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Только GET и JSON; соединения keep-alive (HTTP/1.1), ответы со сжатием и ETag."""
+
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят отдельными записями: без TCP_NODELAY keep-alive упирается в задержку ACK
+    disable_nagle_algorithm = True
+    store: ApiStore = None
+    verbose = False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            route = ROUTES.get(url.path.rstrip("/"))
+            if route is None:
+                raise ApiError(404, "Неизвестный адрес")
+            tag, build, immutable = route(self.store, params)
+            etag = '"' + hashlib.sha1(
+                repr((tag, url.path, sorted(params.items()))).encode("utf-8")).hexdigest()[:20] + '"'
+            max_age = IMMUTABLE_MAX_AGE if immutable else LATEST_MAX_AGE
+            headers = {"ETag": etag, "Cache-Control": f"max-age={max_age}"}
+            if etag in self.headers.get("If-None-Match", ""):
+                self._send(304, b"", headers)
+                return
+            body = json.dumps(build(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self._send(200, body, headers)
+        except ApiError as e:
+            self._send(e.status, json.dumps({"error": e.message}, ensure_ascii=False).encode("utf-8"))
+        except Exception as e:
+            self.log_error("Ошибка обработки %s: %r", self.path, e)
+            self._send(500, json.dumps({"error": "Внутренняя ошибка сервера"}, ensure_ascii=False).encode("utf-8"))
+
+    def _send(self, status: int, body: bytes, headers: dict | None = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            if len(body) >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body, compresslevel=5)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Журнал каждого запроса заметно замедляет сервер под нагрузкой — только по флагу --verbose
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, pool_size: int = POOL_SIZE,
+                verbose: bool = False) -> ThreadingHTTPServer:
+    handler = type("Handler", (ApiHandler,), {"store": ApiStore(ConnectionPool(pool_size)), "verbose": verbose})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API ForecastGGW")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--pool-size", type=int, default=POOL_SIZE, help="соединений с БД в пуле")
+    parser.add_argument("--verbose", action="store_true", help="журналировать каждый запрос")
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, args.pool_size, args.verbose)
+    print(f"API: http://{args.host}:{args.port}/api/datasets")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
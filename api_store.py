@@ -0,0 +1,295 @@
+import pandas as pd
+import numpy as np
+import datetime
+import queue
+from contextlib import contextmanager
+from array_store import FORECAST, HISTORY, HISTORY_TOTAL, ArrayStore, history_key, history_views
+from catalog import get_catalog, product_codes
+from database import get_connection
+from registry import get_registry
+from versioning import current_version
+
+# Опубликованные для внешних систем данные: версии наборов, пакетные прогнозы и планы порций.
+# Сами массивы истории и прогноза лежат в хранилище массивов, в БД — только их реестр и порции.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS api_datasets (
+    version      TEXT PRIMARY KEY,
+    history_key  TEXT NOT NULL,
+    published    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS api_forecast_runs (
+    run_key    TEXT PRIMARY KEY,
+    version    TEXT NOT NULL,
+    grain      TEXT NOT NULL,
+    horizon    INTEGER NOT NULL,
+    published  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS api_forecast_runs_version ON api_forecast_runs (version, grain, published);
+CREATE TABLE IF NOT EXISTS api_portions (
+    version     TEXT NOT NULL,
+    year        INTEGER NOT NULL,
+    week        INTEGER NOT NULL,
+    product     TEXT NOT NULL,
+    total_kg    REAL NOT NULL,
+    portion_kg  REAL NOT NULL,
+    portions    INTEGER NOT NULL,
+    PRIMARY KEY (version, year, week, product)
+);
+"""
+
+# Число соединений с БД в пуле сервера API
+POOL_SIZE = 8
+
+# Шаги агрегации продаж: код -> единица numpy datetime64
+PERIODS = {"W": None, "M": "M", "Y": "Y"}
+
+
+def ensure_api_tables(conn):
+    conn.executescript(SCHEMA)
+    conn.commit()
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+# --- Публикация (вызывается из приложения Streamlit) ---
+
+def publish_dataset(df: pd.DataFrame):
+    """
+    Регистрирует версию данных и её массивы истории (массивы строятся, если их ещё нет).
+    Версия публикуется один раз: повторные вызовы (перезапуски страницы загрузки в любой сессии)
+    ничего не пишут, поэтому «последней» для API остаётся последняя новая версия, а не последняя открытая.
+    """
+    version = current_version(df)
+    conn = get_connection()
+    try:
+        ensure_api_tables(conn)
+        if conn.execute("SELECT 1 FROM api_datasets WHERE version = ?", (version,)).fetchone():
+            return
+        history_views(df)
+        conn.execute(
+            "INSERT OR IGNORE INTO api_datasets (version, history_key, published) VALUES (?, ?, ?)",
+            (version, history_key(df, get_registry().restaurant_columns(df)), _now())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def publish_forecast(run_key: str, version: str, grain: str, horizon: int):
+    """Регистрирует пакетный прогноз, массив которого уже записан в хранилище под ключом run_key."""
+    conn = get_connection()
+    try:
+        ensure_api_tables(conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO api_forecast_runs (run_key, version, grain, horizon, published) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (run_key, version, grain, int(horizon), _now())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def publish_portions(df: pd.DataFrame):
+    """План порций по всем неделям версии: суммы Total по (год, неделя, продукт) для продуктов с весом порции."""
+    version = current_version(df)
+    conn = get_connection()
+    try:
+        ensure_api_tables(conn)
+        if conn.execute("SELECT 1 FROM api_portions WHERE version = ? LIMIT 1", (version,)).fetchone():
+            return
+        catalog = get_catalog()
+        codes = product_codes(df, version)
+        mask = catalog.mask_from_codes(codes, "portion")
+        totals = (
+            pd.DataFrame({
+                "year": pd.to_numeric(df["Year"], errors="coerce").to_numpy()[mask],
+                "week": pd.to_numeric(df["Week"], errors="coerce").to_numpy()[mask],
+                "code": codes[mask],
+                "kg": pd.to_numeric(df["Total"], errors="coerce").fillna(0).to_numpy()[mask],
+            })
+            .dropna(subset=["year", "week"])
+            .groupby(["year", "week", "code"], as_index=False)["kg"].sum()
+        )
+        portion_kg = catalog.portion_kg[totals["code"].to_numpy()]
+        conn.executemany(
+            "INSERT OR REPLACE INTO api_portions (version, year, week, product, total_kg, portion_kg, portions) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            zip([version] * len(totals), totals["year"].astype(int).tolist(), totals["week"].astype(int).tolist(),
+                [catalog.names[code] for code in totals["code"]], totals["kg"].round(3).tolist(),
+                portion_kg.tolist(), np.floor(totals["kg"].to_numpy() / portion_kg + 1e-9).astype(int).tolist())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# --- Чтение (сервер API, без Streamlit) ---
+
+class ConnectionPool:
+    """Пул соединений SQLite для потоков сервера: соединения открываются один раз и переиспользуются."""
+
+    def __init__(self, size: int = POOL_SIZE, db_path: str | None = None):
+        conn = get_connection(db_path)
+        try:
+            ensure_api_tables(conn)
+        finally:
+            conn.close()
+        self._pool = queue.LifoQueue()
+        for _ in range(size):
+            conn = get_connection(db_path)
+            conn.execute("PRAGMA query_only = ON")
+            self._pool.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+
+def _positions(view, axis: str, label: str | None) -> np.ndarray:
+    """Номера по оси: все или одна подпись (пустой массив, если подписи нет)."""
+    if label is None:
+        return np.arange(len(view.labels(axis)))
+    return np.array([view.position(axis, label)] if view.has(axis, label) else [], dtype=np.int64)
+
+
+def _date_positions(view, date_from: str | None, date_to: str | None) -> np.ndarray:
+    dates = np.array(view.labels("date"))
+    mask = np.ones(len(dates), dtype=bool)
+    if date_from:
+        mask &= dates >= date_from
+    if date_to:
+        mask &= dates <= date_to
+    return np.flatnonzero(mask)
+
+
+class ApiStore:
+    """Запросы API: реестр — из БД через пул соединений, значения — срезами массивов из хранилища."""
+
+    def __init__(self, pool: ConnectionPool, arrays: ArrayStore | None = None):
+        self.pool = pool
+        self.arrays = arrays or ArrayStore()
+
+    def datasets(self) -> list[dict]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT version, published FROM api_datasets ORDER BY published DESC, rowid DESC"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def dataset(self, version: str | None) -> dict | None:
+        """Версия данных по идентификатору или последняя опубликованная."""
+        with self.pool.connection() as conn:
+            if version:
+                row = conn.execute("SELECT * FROM api_datasets WHERE version = ?", (version,)).fetchone()
+            else:
+                row = conn.execute("SELECT * FROM api_datasets ORDER BY published DESC, rowid DESC LIMIT 1").fetchone()
+        return dict(row) if row else None
+
+    def forecast_run(self, version: str, grain: str = "W", run_key: str | None = None) -> dict | None:
+        """Пакетный прогноз версии с нужным шагом: указанный run_key или последний опубликованный."""
+        with self.pool.connection() as conn:
+            if run_key:
+                row = conn.execute(
+                    "SELECT * FROM api_forecast_runs WHERE run_key = ? AND version = ? AND grain = ?",
+                    (run_key, version, grain)
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    "SELECT * FROM api_forecast_runs WHERE version = ? AND grain = ? "
+                    "ORDER BY published DESC, rowid DESC LIMIT 1",
+                    (version, grain)
+                ).fetchone()
+        return dict(row) if row else None
+
+    def forecasts(self, run_key: str, restaurant: str | None, product: str | None, date_from: str | None,
+                  date_to: str | None, offset: int, limit: int) -> tuple[int, list[dict]]:
+        """Строки (дата, ресторан, продукт, P10, P50, P90); из массива читается только запрошенная страница."""
+        view = self.arrays.open(run_key, FORECAST)
+        if view is None:
+            return 0, []
+        index = (_date_positions(view, date_from, date_to), _positions(view, "product", product),
+                 _positions(view, "restaurant", restaurant))
+        shape = tuple(len(i) for i in index)
+        total = int(np.prod(shape))
+        flat = np.arange(offset, min(offset + limit, total))
+        di, pi, ri = (index[axis][pos] for axis, pos in enumerate(np.unravel_index(flat, shape)))
+        values = np.asarray(view.data[di, pi, ri], dtype=np.float64).round(1)
+        dates, products, restaurants = view.labels("date"), view.labels("product"), view.labels("restaurant")
+        return total, [
+            {"date": dates[d], "restaurant": restaurants[r], "product": products[p],
+             "p10": q[0], "p50": q[1], "p90": q[2]}
+            for d, p, r, q in zip(di.tolist(), pi.tolist(), ri.tolist(), values.tolist())
+        ]
+
+    def sales(self, history: str, restaurant: str | None, product: str | None, date_from: str | None,
+              date_to: str | None, period: str = "W", group_by: tuple = (), offset: int = 0,
+              limit: int = 1000) -> tuple[int, list[dict]]:
+        """
+        Агрегаты продаж: суммы по периоду (неделя/месяц/год) и, по запросу, по ресторану и продукту.
+        Без ресторанной группировки и фильтра берётся столбец Total (продажи сети).
+        """
+        by_restaurant = restaurant is not None or "restaurant" in group_by
+        view = self.arrays.open(history, HISTORY if by_restaurant else HISTORY_TOTAL)
+        if view is None:
+            return 0, []
+        dates = _date_positions(view, date_from, date_to)
+        products = _positions(view, "product", product)
+        data = np.asarray(view.data[dates][:, products], dtype=np.float64)
+        axes = ["product"]
+        if by_restaurant:
+            restaurants = _positions(view, "restaurant", restaurant)
+            data = data[:, :, restaurants]
+            axes.append("restaurant")
+            if "restaurant" not in group_by:
+                data, axes = data.sum(axis=2), axes[:1]
+        if "product" not in group_by:
+            data, axes = data.sum(axis=1), axes[1:]
+
+        # Группировка недель в месяцы/годы — умножением на матрицу принадлежности
+        labels = np.array(view.labels("date"), dtype="datetime64[D]")[dates]
+        if PERIODS[period]:
+            periods, codes = np.unique(labels.astype(f"datetime64[{PERIODS[period]}]"), return_inverse=True)
+            onehot = np.zeros((len(periods), len(labels)))
+            onehot[codes, np.arange(len(labels))] = 1.0
+            data = np.tensordot(onehot, data, axes=1)
+            labels = periods.astype("datetime64[D]")
+
+        names = {"product": [view.labels("product")[i] for i in products]}
+        if by_restaurant:
+            names["restaurant"] = [view.labels("restaurant")[i] for i in restaurants]
+        total = int(data.size)
+        flat = np.arange(offset, min(offset + limit, total))
+        position = np.unravel_index(flat, data.shape)
+        values = data[position].round(3).tolist()
+        periods = [str(labels[i]) for i in position[0].tolist()]
+        columns = {axis: [names[axis][i] for i in index.tolist()] for axis, index in zip(axes, position[1:])}
+        rows = [{"period": period} for period in periods]
+        for axis, column in columns.items():
+            for row, name in zip(rows, column):
+                row[axis] = name
+        for row, value in zip(rows, values):
+            row["sales"] = value
+        return total, rows
+
+    def portions(self, version: str, year: int | None, week: int | None, product: str | None,
+                 offset: int, limit: int) -> tuple[int, list[dict]]:
+        where, args = ["version = ?"], [version]
+        for column, value in (("year", year), ("week", week), ("product", product)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                args.append(value)
+        condition = " AND ".join(where)
+        with self.pool.connection() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM api_portions WHERE {condition}", args).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT year, week, product, total_kg, portion_kg, portions FROM api_portions WHERE {condition} "
+                "ORDER BY year, week, product LIMIT ? OFFSET ?", [*args, limit, offset]
+            ).fetchall()
+        return total, [dict(row) for row in rows]
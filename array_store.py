@@ -0,0 +1,270 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import json
+import os
+import shutil
+import threading
+import uuid
+from calendar_features import iso_monday
+from intervals import QUANTILES
+from registry import get_registry
+from versioning import current_version, derived_version
+
+# Каталог хранилища: <STORE_DIR>/<ключ версии>/<имя>.npy + <имя>.axes.json
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "array_store")
+
+# --- Имена массивов ---
+HISTORY = "history"              # продажи: неделя × продукт × ресторан
+HISTORY_TOTAL = "history_total"  # столбец Total: неделя × продукт
+HISTORY_ROWS = "history_rows"    # число строк исходных данных: неделя × продукт (0 — продукта в неделе не было)
+FORECAST = "forecast"            # квантильный прогноз: неделя × продукт × ресторан × (P10, P50, P90)
+
+# Ключ session_state с последним пакетным прогнозом: id задачи, ключ массива прогноза, горизонт, шаг
+ALL_FORECAST_JOB = "forecast_all_job"
+
+# Сколько открытых массивов держать в процессе
+MAX_OPEN = 16
+
+# Сколько ключей держать на диске: сверх этого удаляются каталоги, которые дольше всех не открывали
+# (закреплённые — например, прогнозы из архива мониторинга — не удаляются)
+MAX_KEYS = 64
+PIN_FILE = "pinned"
+
+
+class TensorView:
+    """
+    Массив из хранилища, открытый через memory map (только чтение), и подписи его осей.
+    Выбор одного ресторана или продукта — срез без копирования, а не groupby по всей таблице.
+    """
+
+    def __init__(self, data: np.ndarray, axes: dict[str, list]):
+        self.data = data
+        self.axes = axes
+        self.axis_names = list(axes)
+        self._positions = {axis: {label: i for i, label in enumerate(labels)} for axis, labels in axes.items()}
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(pd.to_datetime(self.axes["date"]))
+
+    def labels(self, axis: str) -> list:
+        return self.axes[axis]
+
+    def has(self, axis: str, label) -> bool:
+        return label in self._positions[axis]
+
+    def position(self, axis: str, label) -> int:
+        return self._positions[axis][label]
+
+    def take(self, **labels) -> np.ndarray:
+        """Срез по подписям осей, например take(product="Курица", restaurant="Тверская")."""
+        index = tuple(
+            self._positions[axis][labels[axis]] if axis in labels else slice(None)
+            for axis in self.axis_names
+        )
+        return self.data[index]
+
+
+class ArrayStore:
+    """
+    Постоянное хранилище плотных массивов (.npy) по ключу версии данных.
+    Файлы открываются с mmap_mode="r": разные сессии и процессы читают одни и те же страницы
+    памяти, а запись идёт через временный файл и атомарную замену.
+    """
+
+    def __init__(self, root: str = STORE_DIR, max_open: int = MAX_OPEN, max_keys: int = MAX_KEYS):
+        self.root = root
+        self.max_open = max_open
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._open: dict[tuple[str, str], TensorView] = {}
+
+    def _paths(self, key: str, name: str) -> tuple[str, str]:
+        folder = os.path.join(self.root, key)
+        return os.path.join(folder, f"{name}.npy"), os.path.join(folder, f"{name}.axes.json")
+
+    def exists(self, key: str, name: str) -> bool:
+        return all(os.path.exists(path) for path in self._paths(key, name))
+
+    def write(self, key: str, name: str, array: np.ndarray, axes: dict[str, list]) -> TensorView:
+        if tuple(len(labels) for labels in axes.values()) != array.shape:
+            raise ValueError(f"Размер массива {array.shape} не совпадает с осями {list(axes)}")
+        data_path, axes_path = self._paths(key, name)
+        new_key = not os.path.isdir(os.path.dirname(data_path))
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        ident = uuid.uuid4().hex
+        with open(f"{axes_path}.{ident}.tmp", "w", encoding="utf-8") as f:
+            json.dump(axes, f, ensure_ascii=False)
+        os.replace(f"{axes_path}.{ident}.tmp", axes_path)
+        # np.save добавляет .npy к имени без этого расширения, поэтому оно остаётся в конце
+        tmp_data = f"{data_path[:-4]}.{ident}.tmp.npy"
+        np.save(tmp_data, np.ascontiguousarray(array))
+        os.replace(tmp_data, data_path)
+        with self._lock:
+            self._open.pop((key, name), None)
+        if new_key:
+            self.prune(keep=key)
+        return self.open(key, name)
+
+    def pin(self, key: str):
+        """Закрепляет ключ: его массивы не удаляются при очистке хранилища."""
+        folder = os.path.join(self.root, key)
+        os.makedirs(folder, exist_ok=True)
+        open(os.path.join(folder, PIN_FILE), "a").close()
+
+    def prune(self, keep: str | None = None):
+        """Удаляет каталоги ключей сверх max_keys — те, что дольше всех не открывали (кроме закреплённых)."""
+        try:
+            folders = [e for e in os.scandir(self.root)
+                       if e.is_dir() and e.name != keep and not os.path.exists(os.path.join(e.path, PIN_FILE))]
+        except FileNotFoundError:
+            return
+        excess = len(folders) + (keep is not None) - self.max_keys
+        if excess <= 0:
+            return
+        folders.sort(key=lambda e: e.stat().st_mtime)
+        for folder in folders[:excess]:
+            with self._lock:
+                for opened in [k for k in self._open if k[0] == folder.name]:
+                    del self._open[opened]
+            shutil.rmtree(folder.path, ignore_errors=True)
+
+    def open(self, key: str, name: str) -> TensorView | None:
+        with self._lock:
+            view = self._open.get((key, name))
+        if view is not None:
+            return view
+        if not self.exists(key, name):
+            return None
+        data_path, axes_path = self._paths(key, name)
+        with open(axes_path, encoding="utf-8") as f:
+            axes = json.load(f)
+        view = TensorView(np.load(data_path, mmap_mode="r"), axes)
+        # Время изменения каталога — время последнего открытия (по нему работает prune)
+        os.utime(os.path.dirname(data_path))
+        with self._lock:
+            self._open[(key, name)] = view
+            while len(self._open) > self.max_open:
+                self._open.pop(next(iter(self._open)))
+        return view
+
+
+@st.cache_resource
+def get_array_store() -> ArrayStore:
+    """Одно хранилище массивов на процесс."""
+    return ArrayStore()
+
+
+def week_axis(df: pd.DataFrame) -> tuple[np.ndarray, list[str], np.ndarray]:
+    """
+    Коды недель строк df, подписи оси дат (понедельники ISO-недель) и маска строк с корректной неделей.
+    Используется столбец Date, если он есть, иначе пара Year/Week.
+    """
+    if "Date" in df.columns:
+        dates = pd.to_datetime(df["Date"], errors="coerce")
+        valid = dates.notna().to_numpy()
+        uniq, codes = np.unique(dates[valid].to_numpy(), return_inverse=True)
+        return codes, [str(pd.Timestamp(d).date()) for d in uniq], valid
+
+    year_week = (pd.to_numeric(df["Year"], errors="coerce").fillna(0).astype(np.int64) * 100
+                 + pd.to_numeric(df["Week"], errors="coerce").fillna(0).astype(np.int64)).to_numpy()
+    uniq = np.unique(year_week)
+    mondays = {key: iso_monday(key // 100, key % 100) for key in uniq.tolist()}
+    valid_keys = np.array([key for key in uniq.tolist() if mondays[key] is not None], dtype=np.int64)
+    valid = np.isin(year_week, valid_keys)
+    codes = np.searchsorted(valid_keys, year_week[valid])
+    return codes, [str(mondays[key]) for key in valid_keys.tolist()], valid
+
+
+def history_key(df: pd.DataFrame, restaurants: list[str]) -> str:
+    """Ключ истории: версия данных + состав ресторанной оси (справочник может меняться)."""
+    return derived_version(current_version(df), "history", tuple(restaurants))
+
+
+def build_history(df: pd.DataFrame, restaurants: list[str]) -> dict[str, tuple[np.ndarray, dict]]:
+    """Плотные массивы истории из таблицы продаж: суммы по (неделя, продукт) через bincount."""
+    week_codes, dates, valid = week_axis(df)
+    products, product_codes = np.unique(df.loc[valid, "Product"].astype(str).to_numpy(), return_inverse=True)
+    n_dates, n_products = len(dates), len(products)
+    flat = week_codes * n_products + product_codes
+    size = n_dates * n_products
+
+    history = np.zeros((size, len(restaurants)), dtype=np.float64)
+    for i, rest in enumerate(restaurants):
+        values = pd.to_numeric(df.loc[valid, rest], errors="coerce").fillna(0).to_numpy(np.float64)
+        history[:, i] = np.bincount(flat, weights=values, minlength=size)
+    total = pd.to_numeric(df.loc[valid, "Total"], errors="coerce").fillna(0).to_numpy(np.float64)
+
+    axes_2d = {"date": dates, "product": products.tolist()}
+    axes_3d = {**axes_2d, "restaurant": list(restaurants)}
+    return {
+        HISTORY: (history.reshape(n_dates, n_products, len(restaurants)), axes_3d),
+        HISTORY_TOTAL: (np.bincount(flat, weights=total, minlength=size).reshape(n_dates, n_products), axes_2d),
+        HISTORY_ROWS: (np.bincount(flat, minlength=size).astype(np.uint32).reshape(n_dates, n_products), axes_2d),
+    }
+
+
+def history_views(df: pd.DataFrame) -> dict[str, TensorView]:
+    """Массивы истории для df: открываются из хранилища, при первом обращении строятся и сохраняются."""
+    store = get_array_store()
+    restaurants = get_registry().restaurant_columns(df)
+    key = history_key(df, restaurants)
+    names = (HISTORY, HISTORY_TOTAL, HISTORY_ROWS)
+    if not all(store.exists(key, name) for name in names):
+        for name, (array, axes) in build_history(df, restaurants).items():
+            store.write(key, name, array, axes)
+    return {name: store.open(key, name) for name in names}
+
+
+def history_series(views: dict[str, TensorView], product: str, restaurant: str | None = None) -> pd.DataFrame:
+    """
+    Недельный ряд продукта (ds, y) по ресторану или по столбцу Total (restaurant=None).
+    Берутся только недели, в которых продукт присутствует в исходных данных.
+    """
+    product = str(product)
+    rows = views[HISTORY_ROWS]
+    if not rows.has("product", product):
+        return pd.DataFrame(columns=["ds", "y"])
+    present = rows.take(product=product) > 0
+    if restaurant is None:
+        values = views[HISTORY_TOTAL].take(product=product)
+    else:
+        values = views[HISTORY].take(product=product, restaurant=restaurant)
+    return pd.DataFrame({"ds": rows.dates[present], "y": values[present]})
+
+
+def forecast_tensor(df_long: pd.DataFrame) -> tuple[np.ndarray, dict]:
+    """
+    Длинный прогноз (Дата, Ресторан, Продукт, P10, P50, P90) ->
+    массив неделя × продукт × ресторан × квантиль (float32).
+    """
+    date_codes, dates = pd.factorize(pd.to_datetime(df_long["Дата"]), sort=True)
+    product_codes, products = pd.factorize(df_long["Продукт"], sort=True)
+    rest_codes, restaurants = pd.factorize(df_long["Ресторан"], sort=False)
+    tensor = np.zeros((len(dates), len(products), len(restaurants), len(QUANTILES)), dtype=np.float32)
+    tensor[date_codes, product_codes, rest_codes] = df_long[QUANTILES].to_numpy(np.float32)
+    axes = {
+        "date": [str(d.date()) for d in dates],
+        "product": [str(p) for p in products],
+        "restaurant": [str(r) for r in restaurants],
+        "quantile": list(QUANTILES),
+    }
+    return tensor, axes
+
+
+def session_forecast(grain: str = "W") -> TensorView | None:
+    """Массив последнего пакетного прогноза текущей сессии (если он построен с нужным шагом)."""
+    info = st.session_state.get(ALL_FORECAST_JOB)
+    if not info or info.get("grain", "W") != grain:
+        return None
+    return get_array_store().open(info["key"], FORECAST)
+
+
+def forecast_view(df_long: pd.DataFrame, key: str) -> TensorView:
+    """Прогноз в хранилище массивов по ключу задачи прогноза (запись — один раз)."""
+    store = get_array_store()
+    view = store.open(key, FORECAST)
+    if view is None:
+        view = store.write(key, FORECAST, *forecast_tensor(df_long))
+    return view
@@ -1,6 +1,74 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
+from calendar_features import REGULAR_SEASON, SEASONS, calendar_for
+from catalog import get_catalog
+from charts import bar_figure, frame_key, pie_figure, show_figure
+from query_cache import get_query_cache
+from registry import get_registry
+from versioning import current_version
+
+
+@st.cache_data(show_spinner=False)
+def tag_seasons(_df: pd.DataFrame, version: str) -> pd.DataFrame:
+    """
+    Недельные продажи продуктов с классификацией продукта и сезоном недели.
+    Суммы по (год, неделя, продукт) берутся из кэша запросов по годам — при дописанных неделях
+    пересчитывается только последний год; разметка выполняется на этой небольшой таблице.
+    Строки с продуктами вне классификаций отбрасываются.
+    """
+    catalog = get_catalog()
+    weekly = get_query_cache().aggregate_years(_df, ["Week", "Product"], ["Total"], scope="classified")
+    codes = catalog.encode(weekly["Product"])
+    class_codes = np.where(codes >= 0, catalog.class_codes[np.clip(codes, 0, None)], -1)
+    mask = class_codes >= 0
+
+    years = weekly["Year"].to_numpy()[mask]
+    weeks = weekly["Week"].to_numpy()[mask].astype(np.int64)
+    # Сезон недели берётся из общего календаря (праздники РФ, летние/зимние месяцы)
+    season_codes = calendar_for(_df).season_codes(years, weeks)
+
+    tagged = pd.DataFrame({
+        "Year": years,
+        "Week": weeks,
+        "Classification": pd.Categorical.from_codes(class_codes[mask], categories=catalog.classifications),
+        "Season": pd.Categorical.from_codes(season_codes, categories=SEASONS),
+        "Total": weekly["Total"].to_numpy()[mask],
+    })
+    return tagged
+
+
+@st.cache_data(show_spinner=False)
+def seasonal_indices(_tagged: pd.DataFrame, version: str) -> pd.DataFrame:
+    """
+    Сезонные индексы для всех лет и классификаций одной группировкой.
+    Для каждой пары (год, классификация) считаются: сумма продаж по сезону, число недель
+    сезона, средняя неделя и индекс в процентах относительно обычных недель.
+    Строки с Classification = "Все классификации" — агрегат по всем продуктам.
+    """
+    # Один проход по данным: дальше работаем только с маленькой таблицей (год × неделя × классификация)
+    weekly = (
+        _tagged.groupby(["Year", "Week", "Classification", "Season"], observed=True)["Total"]
+        .sum()
+        .reset_index()
+    )
+
+    all_classes = weekly.groupby(["Year", "Week", "Season"], observed=True)["Total"].sum().reset_index()
+    all_classes["Classification"] = "Все классификации"
+    weekly = pd.concat([weekly.astype({"Classification": str}), all_classes], ignore_index=True)
+
+    stats = (
+        weekly.groupby(["Year", "Classification", "Season"], observed=True)
+        .agg(Total=("Total", "sum"), Weeks=("Week", "nunique"))
+        .reset_index()
+    )
+    stats["Среднее значение за неделю"] = stats["Total"] / stats["Weeks"]
+
+    regular = stats[stats["Season"] == REGULAR_SEASON].set_index(["Year", "Classification"])[
+        "Среднее значение за неделю"]
+    base = pd.MultiIndex.from_frame(stats[["Year", "Classification"]]).map(regular.to_dict().get)
+    stats["Среднее значение (в процентах)"] = stats["Среднее значение за неделю"] / np.asarray(base, dtype=float) * 100
+    return stats
 
 
 def analyze_seasonal_trends(df: pd.DataFrame):
@@ -10,131 +78,80 @@ def analyze_seasonal_trends(df: pd.DataFrame):
     """
     st.title("Анализ сезонных трендов заказов продуктов по классификациям")
 
-    # --- Классификации продуктов ---
-    classifications = {
-        "Мясные ПФ собственного производства": [
-            "П/Ф Говядина", "П/Ф Гагава", "П/Ф Курица в соусе", "П/Ф Лакомство от шефа",
-            "П/Ф Цезарь", "П/Ф Чили", "П/Ф Кекиклим", "П/Ф Курица на суп"
-        ],
-        "Соуса собственного производства": [
-            "Пюре из баклажанов", "Соус Баффало", "Соус Песто", "Соус Сладкий перец", "Соус Тайский сладкий чили"
-        ],
-        "Горячие напитки": [
-            "Кофе", "Чай зеленый Гринфилд Хармони Лэнд 250гр. ( класс-ий )",
-            "Чай зеленый Гринфилд Флаинг Драгон 100пак. ( класс-ий )",
-            "Чай зеленый Гринфилд Гарден Минт 250гр.(мятный)",
-            "Чай черный Гринфилд Рич Цейлон 250гр. (класс-ий)",
-            "Чай черный Гринфилд Карибиан Фрут 250гр. ( фруктовый )",
-            "Чай черный Гринфилд Маунтэн Тайм 250гр. ( чабрец )", "Чай черный Гринфилд Голден Цейлон 100пак. (класс-ий)"
-        ],
-        "Холодные напитки": [
-            "Добрый Кола ЖБ 0,33", "Добрый Кола Zero ЖБ 0,33", "Добрый Апельсин ЖБ 0,33",
-            "Добрый Лимон-Лайм ЖБ 0,33", "Rich чай черный персик ПЭТ 0,5", "Rich чай черный лимон ПЭТ 0,5",
-            "Бон-Аква нгаз пэт 0.5", "Бон-Аква сгаз пэт 0.5"
-        ],
-        "Десерты": [
-            "Торт манго-маракуйя", "Торт медовик", "Десерт фруктовый \"Сорбет\" манго",
-            "Мороженое \"Пломбир-ваниль\"", "Мороженое с клубникой",
-            "Мороженое шоколаденое с кус.шоколада", "Мозаика"
-        ]
-    }
-
-    # --- Фильтрация данных ---
-    all_products = [product for products in classifications.values() for product in products]
-    df_filtered = df[df["Product"].isin(all_products)]
-    if df_filtered.empty:
+    version = current_version(df)
+
+    # --- Разметка сезонов и классификаций (один раз на версию данных) ---
+    tagged = tag_seasons(df, version)
+    if tagged.empty:
         st.warning("Нет данных по указанным продуктам.")
         return
 
-    # --- Выбор года ---
-    selected_year = st.sidebar.selectbox("Выберите год для анализа", sorted(df["Year"].unique()))
-    df_year = df_filtered[df_filtered["Year"] == selected_year]
-
     # --- Фильтрация ресторанов ---
-    restaurants = [
-        "Samara Cosmoport", "Samara Mega", "Nijniy Novgorod Mega", "Nijniy Novgorod 7 Nebo",
-        "Nijniy Novgorod Fantastika", "Nijniy Novgorod Nebo", "Kazan Mall", "Kazan Tandem", "Kazan Mega",
-        "Kazan Koltso", "Kazan Yujniy", "Kazan Park House", "Moscow Metropolis", "Moscow Gagarinskiy",
-        "Moscow Erevan Plaza", "Moscow Mega Tyopliy Stan", "Moscow Aviapark", "Moscow Afimall", "Khimki Mega",
-        "Moscow RIO", "Moscow Fillion", "Moscow Columbus", "Moscow Kashirskoye Plaza", "Moscow Kaleydoscop",
-        "Moscow Europolis", "Zelenograd Zelenopark", "Moscow Vegas", "Moscow Vodniy", "Moscow Mozaika",
-        "Moscow Gorod", "Moscow Kuzminki Mall", "Moscow Mega Kotelniki", "Moscow Mega Kommunarka",
-        "Moscow Salaris", "Nijnevartovsk GreenPark", "Ufa Mega", "Chelny Kvartal", "Ekaterinburg Veer Mall",
-        "Ekaterinburg Greenvich", "Voronej Galereya Chijova", "Voronej Grad"
-    ]
-
-    restaurant_cols = [col for col in df_year.columns if col in restaurants]
+    restaurant_cols = get_registry().restaurant_columns(df, numeric_only=False)
     if not restaurant_cols:
         st.warning("В данных нет ресторанов из списка.")
         return
 
-    # --- Определяем сезоны ---
-    winter_weeks = {1, 2, 3, 4, 5, 6, 7, 8, 9, 47, 48, 49, 50, 51, 52}
-    summer_weeks = {21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32}
-    holiday_weeks = {1, 2, 7, 8, 10, 19, 20, 23, 25, 47, 51, 52}
-    regular_weeks = {11, 12, 13, 14, 15, 16, 17, 18, 33, 34, 35, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46}
-
-    df_year["Season"] = df_year["Week"].apply(
-        lambda x: "Зима" if x in winter_weeks else
-        "Лето" if x in summer_weeks else
-        "Праздники" if x in holiday_weeks else
-        "Обычные недели"
-    )
+    stats = seasonal_indices(tagged, version)
+
+    # --- Выбор года ---
+    selected_year = st.sidebar.selectbox("Выберите год для анализа", sorted(df["Year"].unique()))
+    year_stats = stats[stats["Year"] == selected_year]
 
     # --- Подсчёт общей суммы ---
     st.subheader(f"Общее количество продаж по классификациям за {selected_year} год")
-    classification_totals = []
-
-    for classification, products in classifications.items():
-        total_sales = df_year[df_year["Product"].isin(products)]["Total"].sum()
-        classification_totals.append({"Классификация": classification, "Общее количество": total_sales})
-
-    totals_df = pd.DataFrame(classification_totals)
+    totals_df = (
+        year_stats[year_stats["Classification"] != "Все классификации"]
+        .groupby("Classification", observed=True)["Total"].sum()
+        .reindex(get_catalog().classifications, fill_value=0)
+        .reset_index()
+    )
+    totals_df.columns = ["Классификация", "Общее количество"]
     st.dataframe(totals_df)
 
     # --- График по классификациям ---
-    fig_totals = px.bar(
+    show_figure("season_totals", version, lambda: bar_figure(
         totals_df,
         x="Классификация",
         y="Общее количество",
         title="Общее количество продаж по классификациям",
         labels={"Общее количество": "Сумма продаж", "Классификация": "Классификация"}
-    )
-    st.plotly_chart(fig_totals, use_container_width=True)
-
-    # --- Средние продажи за одну неделю ---
-    week_counts = {
-        "Зима": len(winter_weeks),
-        "Лето": len(summer_weeks),
-        "Праздники": len(holiday_weeks),
-        "Обычные недели": len(regular_weeks)
-    }
-
-    season_sales = df_year.groupby("Season")["Total"].sum().reset_index()
-    season_sales["Среднее значение за неделю"] = season_sales.apply(
-        lambda row: row["Total"] / week_counts[row["Season"]], axis=1
-    )
-
-    avg_regular_week = season_sales[season_sales["Season"] == "Обычные недели"]["Среднее значение за неделю"].values[0]
+    ), params=(selected_year, frame_key(totals_df)))
 
-    # Преобразуем в проценты относительно обычных недель
-    season_sales["Среднее значение (в процентах)"] = (
-                                                             season_sales[
-                                                                 "Среднее значение за неделю"] / avg_regular_week
-                                                     ) * 100
+    # --- Средние продажи за одну неделю (в процентах относительно обычных недель) ---
+    season_sales = year_stats[year_stats["Classification"] == "Все классификации"]
 
     # --- Круговая диаграмма ---
     st.subheader(f"Средние продажи по сезонам за одну неделю ({selected_year})")
-    fig_season = px.pie(
+    show_figure("season_pie", version, lambda: pie_figure(
         season_sales,
         names="Season",
         values="Среднее значение (в процентах)",
-        title=f"Средние продажи по сезонам за одну неделю ({selected_year})"
-    )
-    fig_season.update_layout(
+        title=f"Средние продажи по сезонам за одну неделю ({selected_year})",
         width=600,
         height=600
+    ), params=(selected_year, frame_key(season_sales)), use_container_width=False)
+
+    # --- Сравнение сезонности по годам ---
+    st.subheader("Сравнение сезонных индексов по годам")
+    selected_class = st.selectbox(
+        "Классификация для сравнения",
+        ["Все классификации"] + get_catalog().classifications,
+        key="seasonal_compare_class"
     )
-    st.plotly_chart(fig_season, use_container_width=False)
+    compare = stats[stats["Classification"] == selected_class].copy()
+    compare["Год"] = compare["Year"].astype(str)
+    show_figure("season_compare", version, lambda: bar_figure(
+        compare,
+        x="Season",
+        y="Среднее значение (в процентах)",
+        color="Год",
+        barmode="group",
+        title=f"Сезонный индекс (обычные недели = 100%): {selected_class}",
+        labels={"Season": "Сезон", "Среднее значение (в процентах)": "Индекс, %"}
+    ), params=(selected_class, frame_key(compare)))
+
+    pivot = compare.pivot(index="Season", columns="Год", values="Среднее значение (в процентах)").round(1)
+    st.dataframe(pivot)
 
     st.success("Анализ завершён! Вы можете выбрать другие параметры.")
@@ -0,0 +1,186 @@
+import pandas as pd
+import numpy as np
+import datetime
+import os
+from functools import lru_cache
+
+# --- Государственные праздники РФ: (название, месяц, день, число дней) ---
+RU_HOLIDAYS = [
+    ("Новогодние каникулы", 1, 1, 8),
+    ("День защитника Отечества", 2, 23, 1),
+    ("Международный женский день", 3, 8, 1),
+    ("Праздник Весны и Труда", 5, 1, 1),
+    ("День Победы", 5, 9, 1),
+    ("День России", 6, 12, 1),
+    ("День народного единства", 11, 4, 1),
+    ("Канун Нового года", 12, 31, 1),
+]
+
+# Локальная таблица промо-недель (Year, Week, Name); если файла нет — только встроенные акции
+PROMO_WEEKS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "promo_weeks.csv")
+
+# --- Сезоны (порядок задаёт код сезона) ---
+SEASONS = ["Зима", "Лето", "Праздники", "Обычные недели"]
+REGULAR_SEASON = "Обычные недели"
+WINTER_MONTHS = {12, 1, 2}
+SUMMER_MONTHS = {6, 7, 8}
+
+# Максимальный номер ISO-недели + 1 (индекс 0 не используется)
+WEEK_SLOTS = 54
+
+
+def iso_monday(year: int, week: int) -> datetime.date | None:
+    """Понедельник ISO-недели (None, если такой недели в году нет)."""
+    try:
+        return datetime.date.fromisocalendar(int(year), int(week), 1)
+    except ValueError:
+        return None
+
+
+def _black_friday(year: int) -> datetime.date:
+    """Последняя пятница ноября."""
+    day = datetime.date(year, 11, 30)
+    return day - datetime.timedelta(days=(day.weekday() - 4) % 7)
+
+
+def holiday_dates(years) -> pd.DataFrame:
+    """Все праздничные дни за указанные годы: столбцы holiday, date."""
+    rows = []
+    for year in years:
+        for name, month, day, length in RU_HOLIDAYS:
+            start = datetime.date(year, month, day)
+            for offset in range(length):
+                rows.append((name, start + datetime.timedelta(days=offset)))
+    return pd.DataFrame(rows, columns=["holiday", "date"])
+
+
+def promo_weeks(years) -> pd.DataFrame:
+    """Промо-недели: встроенные акции плюс локальная таблица promo_weeks.csv."""
+    rows = []
+    for year in years:
+        iso = _black_friday(year).isocalendar()
+        rows.append((iso[0], iso[1], "Чёрная пятница"))
+    promo = pd.DataFrame(rows, columns=["Year", "Week", "Name"])
+
+    if os.path.exists(PROMO_WEEKS_FILE):
+        local = pd.read_csv(PROMO_WEEKS_FILE, usecols=["Year", "Week", "Name"])
+        promo = pd.concat([promo, local[local["Year"].isin(list(years))]], ignore_index=True)
+    return promo.drop_duplicates(subset=["Year", "Week", "Name"])
+
+
+class WeekCalendar:
+    """
+    Календарь ISO-недель за диапазон лет в виде плотных массивов [год - first_year, неделя].
+    Признаки любой строки (Year, Week) получаются индексацией, без apply по строкам.
+    """
+
+    def __init__(self, first_year: int, last_year: int):
+        self.first_year = first_year
+        self.years = list(range(first_year, last_year + 1))
+        shape = (len(self.years), WEEK_SLOTS)
+
+        self.month = np.zeros(shape, dtype=np.int8)
+        self.holiday_flag = np.zeros(shape, dtype=np.int8)
+        self.promo_flag = np.zeros(shape, dtype=np.int8)
+        self.valid = np.zeros(shape, dtype=bool)
+
+        for i, year in enumerate(self.years):
+            for week in range(1, WEEK_SLOTS):
+                monday = iso_monday(year, week)
+                if monday is None:
+                    continue
+                self.valid[i, week] = True
+                # Месяц недели определяем по четвергу (как и сам номер ISO-недели)
+                self.month[i, week] = (monday + datetime.timedelta(days=3)).month
+
+        # Праздники и промо расставляем только на недели из диапазона календаря
+        holidays = holiday_dates(self.years)
+        for day in holidays["date"]:
+            iso_year, iso_week, _ = day.isocalendar()
+            if first_year <= iso_year <= last_year:
+                self.holiday_flag[iso_year - first_year, iso_week] = 1
+
+        for year, week in promo_weeks(self.years)[["Year", "Week"]].itertuples(index=False):
+            if first_year <= year <= last_year and 0 < week < WEEK_SLOTS:
+                self.promo_flag[year - first_year, week] = 1
+
+        self.season_flag = np.isin(self.month, list(SUMMER_MONTHS)).astype(np.int8)
+
+        # Код сезона (индекс в SEASONS): праздничная неделя остаётся праздничной и зимой, и летом
+        # (новогодние недели, 23 февраля, 12 июня), остальные делятся на зиму, лето и обычные
+        season = np.full(shape, SEASONS.index(REGULAR_SEASON), dtype=np.int8)
+        season[np.isin(self.month, list(SUMMER_MONTHS))] = SEASONS.index("Лето")
+        season[np.isin(self.month, list(WINTER_MONTHS))] = SEASONS.index("Зима")
+        season[self.holiday_flag == 1] = SEASONS.index("Праздники")
+        self.season = season
+
+    def index(self, years, weeks) -> tuple[np.ndarray, np.ndarray]:
+        """Индексы строк (Year, Week) в массивах календаря."""
+        year_idx = np.clip(np.asarray(years, dtype=np.int64) - self.first_year, 0, len(self.years) - 1)
+        week_idx = np.clip(np.asarray(weeks, dtype=np.int64), 0, WEEK_SLOTS - 1)
+        return year_idx, week_idx
+
+    def flags(self, years, weeks) -> pd.DataFrame:
+        """SeasonFlag / HolidayFlag / PromoFlag для массивов годов и недель."""
+        yi, wi = self.index(years, weeks)
+        return pd.DataFrame({
+            "SeasonFlag": self.season_flag[yi, wi],
+            "HolidayFlag": self.holiday_flag[yi, wi],
+            "PromoFlag": self.promo_flag[yi, wi],
+        })
+
+    def season_codes(self, years, weeks) -> np.ndarray:
+        yi, wi = self.index(years, weeks)
+        return self.season[yi, wi]
+
+
+@lru_cache(maxsize=8)
+def get_calendar(first_year: int, last_year: int) -> WeekCalendar:
+    """Календарь строится один раз на диапазон лет и переиспользуется всеми модулями."""
+    return WeekCalendar(first_year, last_year)
+
+
+def calendar_for(df: pd.DataFrame) -> WeekCalendar:
+    """Календарь, покрывающий все годы из столбца Year (с запасом на год прогноза)."""
+    years = pd.to_numeric(df["Year"], errors="coerce").dropna()
+    if years.empty:
+        this_year = datetime.date.today().year
+        return get_calendar(this_year, this_year + 1)
+    return get_calendar(int(years.min()), int(years.max()) + 1)
+
+
+def add_calendar_flags(df: pd.DataFrame) -> pd.DataFrame:
+    """Добавляет в df векторные признаки SeasonFlag, HolidayFlag, PromoFlag."""
+    cal = calendar_for(df)
+    flags = cal.flags(df["Year"].to_numpy(), df["Week"].to_numpy())
+    df = df.copy()
+    for col in flags.columns:
+        df[col] = flags[col].to_numpy()
+    return df
+
+
+def prophet_holidays(first_year: int, last_year: int) -> pd.DataFrame:
+    """
+    Таблица праздников для Prophet (holiday, ds, lower_window, upper_window) на недельной сетке:
+    ds — понедельник ISO-недели, в которую попадает праздник или акция.
+    """
+    return _prophet_holidays(first_year, last_year).copy()
+
+
+@lru_cache(maxsize=8)
+def _prophet_holidays(first_year: int, last_year: int) -> pd.DataFrame:
+    years = list(range(first_year, last_year + 1))
+    rows = []
+    for name, day in holiday_dates(years).itertuples(index=False):
+        iso_year, iso_week, _ = day.isocalendar()
+        rows.append((name, iso_monday(iso_year, iso_week)))
+    for year, week, name in promo_weeks(years).itertuples(index=False):
+        monday = iso_monday(year, week)
+        if monday is not None:
+            rows.append((name, monday))
+
+    holidays = pd.DataFrame(rows, columns=["holiday", "ds"]).drop_duplicates()
+    holidays["ds"] = pd.to_datetime(holidays["ds"])
+    holidays["lower_window"] = 0
+    holidays["upper_window"] = 0
+    return holidays.reset_index(drop=True)
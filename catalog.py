@@ -0,0 +1,300 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import json
+from database import get_connection
+from versioning import version_from_frame
+
+MEAT = "Мясные ПФ собственного производства"
+SAUCES = "Соуса собственного производства"
+HOT_DRINKS = "Горячие напитки"
+COLD_DRINKS = "Холодные напитки"
+DESSERTS = "Десерты"
+
+CLASSIFICATIONS = [MEAT, SAUCES, HOT_DRINKS, COLD_DRINKS, DESSERTS]
+
+# Исходный каталог: (продукт, псевдонимы, классификация, кг на порцию, в отчётах, в подсказках ИИ).
+# Используется только для первичного заполнения таблицы products.
+DEFAULT_PRODUCTS = [
+    ("П/Ф Говядина", [], MEAT, 0.2, True, True),
+    ("П/Ф Гагава", [], MEAT, 0.2, True, True),
+    ("П/Ф Курица в соусе", [], MEAT, 0.2, True, True),
+    ("П/Ф Лакомство от шефа", [], MEAT, 0.2, True, True),
+    ("П/Ф Цезарь", [], MEAT, 0.2, True, True),
+    ("П/Ф Чили", [], MEAT, 0.2, True, True),
+    ("П/Ф Кекиклим", [], MEAT, 0.2, True, True),
+    ("П/Ф Курица на суп", [], MEAT, 0.25, True, True),
+    ("П/Ф Картофель Фри 2,5 кг", [], None, 0.1, True, True),
+    ("П/Ф Луковые кольца 1 кг", [], None, 0.1, True, True),
+    ("Мозаика", [], DESSERTS, 0.09, True, True),
+    ("Пюре из баклажанов", [], SAUCES, 0.1, True, True),
+    ("Соус Баффало", [], SAUCES, 0.02, True, True),
+    ("Соус Песто", [], SAUCES, 0.04, True, True),
+    ("Соус Сладкий перец", [], SAUCES, 0.02, True, True),
+    ("Соус Тайский сладкий чили", [], SAUCES, None, True, True),
+    ("Соус Балканский", [], None, None, True, True),
+    ("Сироп малина", [], None, None, True, False),
+    ("Сироп грейпфрут", [], None, None, True, False),
+    ("Сироп карамельный", [], None, None, True, False),
+    ("Сироп ванильный", [], None, None, True, False),
+    ("Торт манго-маракуйя", [], DESSERTS, None, True, True),
+    ("Торт медовик", [], DESSERTS, None, True, True),
+    ("Десерт фруктовый \"Сорбет\" манго", ["Десерт фруктовый 'Сорбет' манго"], DESSERTS, None, True, True),
+    ("Мороженое \"Пломбир-ваниль\"", ["Мороженое 'Пломбир-ваниль'"], DESSERTS, None, True, True),
+    ("Мороженое с клубникой", [], DESSERTS, None, True, True),
+    ("Мороженое шоколаденое с кус.шоколада", [], DESSERTS, None, True, True),
+    ("Кофе", [], HOT_DRINKS, None, True, False),
+    ("Чечевица", [], None, None, True, False),
+    ("Makaroma Penne (Турция)", [], None, None, True, True),
+    ("Паста Bavette Barilla (Россия), 450г", [], None, None, True, True),
+    ("Паста Filini Barilla (Россия), 450г", [], None, None, True, True),
+    ("Чай зеленый Гринфилд Хармони Лэнд 250гр. ( класс-ий )", [], HOT_DRINKS, None, False, False),
+    ("Чай зеленый Гринфилд Флаинг Драгон 100пак. ( класс-ий )", [], HOT_DRINKS, None, False, False),
+    ("Чай зеленый Гринфилд Гарден Минт 250гр.(мятный)", [], HOT_DRINKS, None, False, False),
+    ("Чай черный Гринфилд Рич Цейлон 250гр. (класс-ий)", [], HOT_DRINKS, None, False, False),
+    ("Чай черный Гринфилд Карибиан Фрут 250гр. ( фруктовый )", [], HOT_DRINKS, None, False, False),
+    ("Чай черный Гринфилд Маунтэн Тайм 250гр. ( чабрец )", [], HOT_DRINKS, None, False, False),
+    ("Чай черный Гринфилд Голден Цейлон 100пак. (класс-ий)", [], HOT_DRINKS, None, False, False),
+    ("Добрый Кола ЖБ 0,33", [], COLD_DRINKS, None, False, False),
+    ("Добрый Кола Zero ЖБ 0,33", [], COLD_DRINKS, None, False, False),
+    ("Добрый Апельсин ЖБ 0,33", [], COLD_DRINKS, None, False, False),
+    ("Добрый Лимон-Лайм ЖБ 0,33", [], COLD_DRINKS, None, False, False),
+    ("Rich чай черный персик ПЭТ 0,5", [], COLD_DRINKS, None, False, False),
+    ("Rich чай черный лимон ПЭТ 0,5", [], COLD_DRINKS, None, False, False),
+    ("Бон-Аква нгаз пэт 0.5", [], COLD_DRINKS, None, False, False),
+    ("Бон-Аква сгаз пэт 0.5", [], COLD_DRINKS, None, False, False),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    product_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+    name           TEXT NOT NULL UNIQUE,
+    aliases        TEXT NOT NULL DEFAULT '[]',
+    classification TEXT,
+    portion_kg     REAL,
+    case_kg        REAL,
+    in_reports     INTEGER NOT NULL DEFAULT 0,
+    in_assistant   INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+# Наборы продуктов, с которыми работают страницы приложения
+SCOPES = ("portion", "reports", "assistant", "classified")
+
+
+def ensure_products_table(conn):
+    """Создаёт таблицу products и заполняет её исходным каталогом, если она пуста."""
+    conn.execute(SCHEMA)
+    if conn.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 0:
+        conn.executemany(
+            """
+            INSERT INTO products (name, aliases, classification, portion_kg, in_reports, in_assistant)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (name, json.dumps(aliases, ensure_ascii=False), cls, portion, int(reports), int(assistant))
+                for name, aliases, cls, portion, reports, assistant in DEFAULT_PRODUCTS
+            ]
+        )
+    conn.commit()
+
+
+def parse_aliases(text) -> list[str]:
+    """
+    Псевдонимы из ячейки каталога: JSON-список строк или перечисление через запятую
+    («Борщ, Суп»). Пустое значение — пустой список; некорректный JSON — ValueError.
+    """
+    if text is None or (isinstance(text, float) and np.isnan(text)) or not str(text).strip():
+        return []
+    text = str(text).strip()
+    if text.startswith("["):
+        aliases = json.loads(text)
+        if not isinstance(aliases, list) or not all(isinstance(a, str) for a in aliases):
+            raise ValueError("ожидается список строк")
+    else:
+        aliases = text.split(",")
+    return [a.strip() for a in aliases if a.strip()]
+
+
+class ProductCatalog:
+    """
+    Каталог продуктов из таблицы products.
+    Каждому продукту соответствует код — позиция в names. Наборы продуктов (scopes)
+    и атрибуты (классификация, вес порции, вес коробки) хранятся массивами по коду,
+    поэтому фильтр по данным сводится к индексированию: flags[codes].
+    fingerprint — отпечаток содержимого каталога, входит в ключи кэшей, зависящих от него.
+    """
+
+    def __init__(self, table: pd.DataFrame):
+        self.table = table.reset_index(drop=True)
+        self.fingerprint = version_from_frame(self.table)
+        self.names = self.table["name"].tolist()
+
+        # Название или псевдоним -> код продукта
+        self.code_of = {name: i for i, name in enumerate(self.names)}
+        for i, aliases in enumerate(self.table["aliases"]):
+            try:
+                aliases = parse_aliases(aliases)
+            except ValueError:
+                # Испорченная ячейка (сохранённая до проверки) не должна ломать все страницы
+                aliases = []
+            for alias in aliases:
+                self.code_of.setdefault(alias, i)
+
+        self.portion_kg = self.table["portion_kg"].to_numpy(dtype=float)
+        self.case_kg = self.table["case_kg"].to_numpy(dtype=float)
+
+        classification = self.table["classification"]
+        self.classifications = CLASSIFICATIONS + sorted(
+            set(classification.dropna()) - set(CLASSIFICATIONS)
+        )
+        self.class_codes = classification.map(
+            {c: i for i, c in enumerate(self.classifications)}
+        ).fillna(-1).to_numpy(dtype=np.int64)
+
+        self.scope_flags = {
+            "portion": ~np.isnan(self.portion_kg),
+            "reports": self.table["in_reports"].to_numpy(dtype=bool),
+            "assistant": self.table["in_assistant"].to_numpy(dtype=bool),
+            "classified": self.class_codes >= 0,
+        }
+
+    def names_in(self, scope: str) -> list[str]:
+        return [name for name, flag in zip(self.names, self.scope_flags[scope]) if flag]
+
+    def classification_map(self) -> dict[str, list[str]]:
+        """Классификация -> список продуктов (в порядке каталога)."""
+        return {
+            cls: [name for name, code in zip(self.names, self.class_codes) if code == i]
+            for i, cls in enumerate(self.classifications)
+        }
+
+    def encode(self, products: pd.Series) -> np.ndarray:
+        """Коды продуктов для столбца Product (-1 — продукта нет в каталоге)."""
+        categories = pd.Categorical(products)
+        cat_codes = np.array([self.code_of.get(c, -1) for c in categories.categories], dtype=np.int64)
+        return np.where(categories.codes >= 0, cat_codes[categories.codes], -1)
+
+    def mask_from_codes(self, codes: np.ndarray, scope: str) -> np.ndarray:
+        flags = self.scope_flags[scope]
+        return (codes >= 0) & flags[np.clip(codes, 0, None)]
+
+    def canonical(self, products: pd.Series) -> pd.Series:
+        """Приводит псевдонимы к каноническому названию (неизвестные продукты не меняются)."""
+        mapping = {alias: self.names[code] for alias, code in self.code_of.items() if alias != self.names[code]}
+        return products.replace(mapping) if mapping else products
+
+
+def load_products() -> pd.DataFrame:
+    conn = get_connection()
+    try:
+        ensure_products_table(conn)
+        return pd.read_sql_query("SELECT * FROM products ORDER BY product_id", conn)
+    finally:
+        conn.close()
+
+
+@st.cache_resource
+def get_catalog() -> ProductCatalog:
+    """Каталог продуктов, общий для всех страниц и сессий."""
+    return ProductCatalog(load_products())
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def product_codes(_df: pd.DataFrame, version: str) -> np.ndarray:
+    """Коды продуктов для строк df — считаются один раз на версию данных."""
+    return get_catalog().encode(_df["Product"])
+
+
+def product_mask(df: pd.DataFrame, scope: str, version: str) -> np.ndarray:
+    """Булева маска строк df, продукты которых входят в набор scope."""
+    return get_catalog().mask_from_codes(product_codes(df, version), scope)
+
+
+def save_products(table: pd.DataFrame):
+    """
+    Сохраняет отредактированный каталог и сбрасывает закэшированные индексы.
+    Псевдонимы приводятся к JSON-списку; при ошибке в них ничего не сохраняется (ValueError со списком строк).
+    """
+    aliases, bad = [], []
+    for row in table.itertuples(index=False):
+        try:
+            aliases.append(json.dumps(parse_aliases(row.aliases), ensure_ascii=False))
+        except ValueError:
+            bad.append(str(row.name))
+    if bad:
+        raise ValueError(f"Некорректные псевдонимы у продуктов: {', '.join(bad)}")
+
+    conn = get_connection()
+    try:
+        ensure_products_table(conn)
+        for row, row_aliases in zip(table.itertuples(index=False), aliases):
+            conn.execute(
+                """
+                INSERT INTO products (name, aliases, classification, portion_kg, case_kg, in_reports, in_assistant)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    aliases = excluded.aliases, classification = excluded.classification,
+                    portion_kg = excluded.portion_kg, case_kg = excluded.case_kg,
+                    in_reports = excluded.in_reports, in_assistant = excluded.in_assistant
+                """,
+                (
+                    row.name, row_aliases, row.classification or None,
+                    None if pd.isna(row.portion_kg) else float(row.portion_kg),
+                    None if pd.isna(row.case_kg) else float(row.case_kg),
+                    int(bool(row.in_reports)), int(bool(row.in_assistant))
+                )
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    get_catalog.clear()
+    product_codes.clear()
+
+
+def update_case_sizes(df: pd.DataFrame):
+    """
+    Переносит вес коробки из столбца 'Case kg' загруженных данных в каталог
+    (только для продуктов, у которых он ещё не заполнен).
+    """
+    if "Case kg" not in df.columns:
+        return
+    case_sizes = (
+        df.loc[pd.to_numeric(df["Case kg"], errors="coerce") > 0, ["Product", "Case kg"]]
+        .assign(Product=lambda d: get_catalog().canonical(d["Product"]))
+        .groupby("Product")["Case kg"].first()
+    )
+    if case_sizes.empty:
+        return
+
+    conn = get_connection()
+    try:
+        ensure_products_table(conn)
+        conn.executemany(
+            "UPDATE products SET case_kg = ? WHERE name = ? AND case_kg IS NULL",
+            [(float(kg), name) for name, kg in case_sizes.items()]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    get_catalog.clear()
+
+
+def manage_products():
+    """Редактор каталога продуктов."""
+    catalog = get_catalog()
+    edited = st.data_editor(
+        catalog.table[["name", "aliases", "classification", "portion_kg", "case_kg", "in_reports", "in_assistant"]],
+        num_rows="dynamic",
+        use_container_width=True,
+        key="products_editor"
+    )
+    if st.button("Сохранить каталог продуктов"):
+        edited = edited.dropna(subset=["name"])
+        edited[["in_reports", "in_assistant"]] = edited[["in_reports", "in_assistant"]].fillna(0)
+        try:
+            save_products(edited)
+        except ValueError as e:
+            st.error(f"{e}. Укажите псевдонимы через запятую или JSON-списком, например [\"Борщ\", \"Суп\"].")
+            return
+        st.success("Каталог продуктов сохранён.")
@@ -0,0 +1,158 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import json
+import plotly.graph_objects as go
+
+# Бюджет отрисовки: сколько точек и категорий уходит в браузер независимо от объёма данных
+MAX_POINTS = 500      # точек на линию после прореживания LTTB
+WEBGL_POINTS = 1000   # с этого числа точек на графике линии рисуются через WebGL (Scattergl)
+MARKER_POINTS = 120   # маркеры точек — только у коротких линий
+MAX_BARS = 60         # категорий на столбчатой диаграмме, остальные объединяются в «Прочие»
+MAX_SLICES = 12       # секторов круговой диаграммы
+
+OTHER = "Прочие"
+
+
+def _numeric_axis(values: np.ndarray) -> np.ndarray:
+    """Ось X в числах для расчёта площадей LTTB (даты — наносекунды)."""
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    if np.issubdtype(values.dtype, np.number):
+        return values.astype(np.float64)
+    return np.arange(len(values), dtype=np.float64)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int = MAX_POINTS) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: номера threshold точек ряда, сохраняющих его форму.
+    Первая и последняя точки остаются; из каждой корзины берётся точка с наибольшей площадью
+    треугольника с предыдущей выбранной точкой и средним следующей корзины.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.int64) + 1
+    edges = np.append(edges, n)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2]
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(x: np.ndarray, y: np.ndarray, threshold: int = MAX_POINTS) -> tuple[np.ndarray, np.ndarray]:
+    index = lttb(_numeric_axis(x), y.astype(np.float64), threshold)
+    return x[index], y[index]
+
+
+def _series(df: pd.DataFrame, x: str, y: str | list[str], color: str | None):
+    """Линии графика: (имя, x, y) — по столбцам y или по значениям color; пропуски отброшены, X отсортирован."""
+    if color is not None:
+        groups = ((str(name), part[x], part[y]) for name, part in df.groupby(color, sort=False, observed=True))
+    else:
+        groups = ((col, df[x], df[col]) for col in ([y] if isinstance(y, str) else y))
+    for name, xs, ys in groups:
+        valid = ys.notna().to_numpy()
+        xs, ys = xs.to_numpy()[valid], ys.to_numpy(dtype=np.float64)[valid]
+        order = np.argsort(xs, kind="stable")
+        yield name, xs[order], ys[order]
+
+
+def line_figure(df: pd.DataFrame, x: str, y: str | list[str], color: str | None = None, title: str | None = None,
+                labels: dict | None = None, markers: bool = False) -> go.Figure:
+    """Линейный график: каждая линия прорежена LTTB до MAX_POINTS; при большом числе точек — Scattergl."""
+    labels = labels or {}
+    series = [(name, *downsample(xs, ys)) for name, xs, ys in _series(df, x, y, color)]
+    total = sum(len(xs) for _, xs, _ in series)
+    trace = go.Scattergl if total > WEBGL_POINTS else go.Scatter
+    fig = go.Figure([
+        trace(x=xs, y=ys, name=name, mode="lines+markers" if markers and len(xs) <= MARKER_POINTS else "lines")
+        for name, xs, ys in series
+    ])
+    fig.update_layout(
+        title=title,
+        xaxis_title=labels.get(x, x),
+        yaxis_title=labels.get(y, y) if isinstance(y, str) else labels.get("value", "value"),
+        legend_title=labels.get(color, color) if color else labels.get("variable", ""),
+        showlegend=color is not None or not isinstance(y, str),
+    )
+    return fig
+
+
+def top_categories(df: pd.DataFrame, x: str, values: list[str], color: str | None = None,
+                   limit: int = MAX_BARS) -> pd.DataFrame:
+    """
+    Агрегация перед отрисовкой: суммы values по категориям x (и color);
+    если категорий больше limit, самые мелкие объединяются в одну категорию OTHER.
+    Порядок категорий сохраняется.
+    """
+    keys = [x] if color is None else [x, color]
+    grouped = df.groupby(keys, sort=False, observed=True)[values].sum().reset_index()
+    totals = grouped.groupby(x, sort=False, observed=True)[values].sum().sum(axis=1)
+    if len(totals) <= limit:
+        return grouped
+    keep = set(totals.abs().nlargest(limit - 1).index)
+    grouped[x] = grouped[x].where(grouped[x].isin(keep), OTHER)
+    grouped = grouped.groupby(keys, sort=False, observed=True)[values].sum().reset_index()
+    other = (grouped[x] == OTHER).to_numpy()
+    return pd.concat([grouped[~other], grouped[other]], ignore_index=True)
+
+
+def bar_figure(df: pd.DataFrame, x: str, y: str | list[str], color: str | None = None, title: str | None = None,
+               labels: dict | None = None, barmode: str = "relative", max_bars: int = MAX_BARS) -> go.Figure:
+    """Столбчатая диаграмма по заранее агрегированным данным (не больше max_bars категорий)."""
+    labels = labels or {}
+    columns = [y] if isinstance(y, str) else list(y)
+    data = top_categories(df, x, columns, color, max_bars)
+    if color is not None:
+        traces = [go.Bar(x=part[x], y=part[y], name=str(name))
+                  for name, part in data.groupby(color, sort=False, observed=True)]
+    else:
+        traces = [go.Bar(x=data[x], y=data[col], name=col) for col in columns]
+    fig = go.Figure(traces)
+    fig.update_layout(
+        title=title,
+        barmode=barmode,
+        xaxis_title=labels.get(x, x),
+        yaxis_title=labels.get(y, y) if isinstance(y, str) else labels.get("value", "value"),
+        legend_title=labels.get(color, color) if color else labels.get("variable", ""),
+        showlegend=len(traces) > 1,
+    )
+    return fig
+
+
+def pie_figure(df: pd.DataFrame, names: str, values: str, title: str | None = None, hole: float = 0.0,
+               max_slices: int = MAX_SLICES, width: int | None = None, height: int | None = None) -> go.Figure:
+    """Круговая диаграмма: мелкие доли сверх max_slices объединяются в «Прочие»."""
+    data = top_categories(df, names, [values], limit=max_slices)
+    fig = go.Figure(go.Pie(labels=data[names], values=data[values], hole=hole, sort=True))
+    fig.update_layout(title=title, width=width, height=height)
+    return fig
+
+
+def frame_key(df: pd.DataFrame) -> int:
+    """Отпечаток небольшой расчётной таблицы — для ключа кэша графика, построенного не из версии данных."""
+    return int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _figure_json(chart: str, version: str, params: str, _build) -> str:
+    return _build().to_json()
+
+
+def show_figure(chart: str, version: str, build, params: tuple = (), use_container_width: bool = True):
+    """
+    Отрисовка графика с кэшем JSON фигуры по (график, версия данных, параметры):
+    агрегирование и прореживание выполняются один раз, повторные запуски страницы отдают готовую фигуру.
+    Таблица графика зависит не только от версии данных (каталог, справочник ресторанов, оценки),
+    поэтому в params передаётся и её frame_key.
+    """
+    figure = json.loads(_figure_json(chart, version, repr(tuple(params)), build))
+    st.plotly_chart(figure, use_container_width=use_container_width)
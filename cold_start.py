@@ -0,0 +1,128 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+from array_store import HISTORY, history_views, session_forecast
+from registry import get_registry
+
+# Веса блоков профиля ресторана в мере сходства
+MIX_WEIGHT = 1.0      # структура продаж по продуктам
+SEASON_WEIGHT = 0.5   # помесячный сезонный профиль
+CITY_WEIGHT = 0.7     # совпадение города
+
+# Сколько последних недель истории берётся как базовый спрос аналога
+BASE_WEEKS = 13
+
+# Число аналогов по умолчанию
+DEFAULT_NEIGHBOURS = 3
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+class StoreIndex:
+    """
+    Индекс профилей действующих ресторанов для подбора аналогов новой точке.
+    Профиль = [доли продуктов | сезонный индекс по месяцам | город], блоки нормированы и взвешены;
+    сходство — скалярное произведение нормированных векторов (косинус), один matvec на запрос.
+    """
+
+    def __init__(self, restaurants: list[str], cities: list[str], city_of: list[str], products: list[str],
+                 mix: np.ndarray, season: np.ndarray, baseline: np.ndarray):
+        self.restaurants = restaurants
+        self.cities = cities
+        self.city_of = city_of
+        self.products = products
+        self.mix = _unit_rows(mix)
+        self.season = _unit_rows(season)
+        self.baseline = baseline  # продукт × ресторан, средние недельные продажи
+        self.city_onehot = np.zeros((len(restaurants), len(cities)))
+        self.city_onehot[np.arange(len(restaurants)), [cities.index(c) for c in city_of]] = 1.0
+        self.features = _unit_rows(np.hstack([
+            MIX_WEIGHT * self.mix, SEASON_WEIGHT * self.season, CITY_WEIGHT * self.city_onehot
+        ]))
+
+    def query(self, city: str | None, references: list[str] | None = None) -> np.ndarray:
+        """
+        Профиль новой точки: структура и сезонность — средние по ресторанам-ориентирам
+        (или по ресторанам города, если ориентиры не заданы; по всей сети — для нового города).
+        """
+        if references:
+            rows = [self.restaurants.index(name) for name in references]
+        elif city in self.cities:
+            rows = np.flatnonzero(self.city_onehot[:, self.cities.index(city)])
+        else:
+            rows = np.arange(len(self.restaurants))
+        city_block = np.zeros(len(self.cities))
+        if city in self.cities:
+            city_block[self.cities.index(city)] = 1.0
+        vector = np.hstack([
+            MIX_WEIGHT * _unit_rows(self.mix[rows].mean(axis=0, keepdims=True))[0],
+            SEASON_WEIGHT * _unit_rows(self.season[rows].mean(axis=0, keepdims=True))[0],
+            CITY_WEIGHT * city_block,
+        ])
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def neighbours(self, query: np.ndarray, k: int = DEFAULT_NEIGHBOURS) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Номера k ближайших ресторанов, их сходство и нормированные веса."""
+        similarity = self.features @ query
+        k = min(k, len(similarity))
+        top = np.argpartition(-similarity, k - 1)[:k]
+        top = top[np.argsort(-similarity[top])]
+        weights = np.clip(similarity[top], 0, None)
+        weights = weights / weights.sum() if weights.sum() > 0 else np.full(k, 1.0 / k)
+        return top, similarity[top], weights
+
+
+def build_store_index(history: np.ndarray, dates: pd.DatetimeIndex, products: list[str],
+                      restaurants: list[str]) -> StoreIndex:
+    """Профили всех ресторанов одним проходом по массиву истории неделя × продукт × ресторан."""
+    registry = get_registry()
+    totals = history.sum(axis=0)  # продукт × ресторан
+    store_totals = totals.sum(axis=0)
+    mix = np.divide(totals, store_totals, out=np.zeros_like(totals), where=store_totals > 0).T
+
+    # Сезонный индекс: средние недельные продажи месяца относительно среднего по году
+    month_onehot = np.zeros((len(dates), 12))
+    month_onehot[np.arange(len(dates)), dates.month - 1] = 1.0
+    weeks_per_month = month_onehot.sum(axis=0)
+    monthly = month_onehot.T @ history.sum(axis=1)  # месяц × ресторан
+    monthly = np.divide(monthly, weeks_per_month[:, None], out=np.zeros_like(monthly),
+                        where=weeks_per_month[:, None] > 0)
+    level = monthly.mean(axis=0, keepdims=True)
+    season = (np.divide(monthly, level, out=np.ones_like(monthly), where=level > 0) - 1.0).T
+
+    baseline = history[-BASE_WEEKS:].mean(axis=0)
+    city_of = [registry.city_of[name] for name in restaurants]
+    return StoreIndex(list(restaurants), sorted(set(city_of)), city_of, list(products), mix, season, baseline)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def store_index(_df: pd.DataFrame, version: str, registry: str) -> StoreIndex:
+    """Индекс аналогов — строится один раз на версию данных и справочника ресторанов."""
+    view = history_views(_df)[HISTORY]
+    return build_store_index(np.asarray(view.data), view.dates, view.labels("product"), view.labels("restaurant"))
+
+
+def demand_source(index: StoreIndex) -> tuple[np.ndarray, str]:
+    """
+    Спрос аналогов (продукт × ресторан, в неделю): средний P50 последнего недельного пакетного прогноза,
+    если он построен в этой сессии, иначе средние продажи за последние BASE_WEEKS недель.
+    """
+    forecast = session_forecast("W")
+    if forecast is not None and forecast.labels("restaurant") == index.restaurants:
+        p50 = np.asarray(forecast.data[..., 1]).mean(axis=0)
+        positions = {name: i for i, name in enumerate(forecast.labels("product"))}
+        source = np.zeros_like(index.baseline)
+        for i, product in enumerate(index.products):
+            if product in positions:
+                source[i] = p50[positions[product]]
+        return source, "прогноз P50"
+    return index.baseline, f"средние продажи за {BASE_WEEKS} недель"
+
+
+def cold_start_forecast(index: StoreIndex, demand: np.ndarray, top: np.ndarray, weights: np.ndarray,
+                        scale: float = 1.0) -> pd.Series:
+    """Недельный спрос новой точки по продуктам: взвешенное среднее спроса аналогов × масштаб."""
+    return pd.Series(demand[:, top] @ weights * scale, index=index.products)
@@ -1,5 +1,19 @@
 import streamlit as st
 import pandas as pd
+from catalog import get_catalog
+from granularity import DAILY_KEY, DAILY_REQUIRED, compact_daily, is_daily, save_daily, to_weekly
+from validation import show_validation, validation_report
+from versioning import VERSION_KEY, attach_version, derived_version, version_from_files
+
+
+def read_upload(file) -> pd.DataFrame:
+    """Чтение загруженного файла по расширению: Excel, CSV (движок pyarrow) или Parquet."""
+    name = file.name.lower()
+    if name.endswith(".csv"):
+        return pd.read_csv(file, engine="pyarrow")
+    if name.endswith(".parquet"):
+        return pd.read_parquet(file)
+    return pd.read_excel(file)
 
 
 def load_excel_files():
@@ -9,9 +23,9 @@ def load_excel_files():
     или при возникновении ошибки структуры данных.
     """
     uploaded_files = st.file_uploader(
-        "Загрузите один или несколько Excel-файлов",
+        "Загрузите один или несколько файлов (Excel — недельные данные; CSV/Parquet/Excel со столбцом Date — дневные)",
         accept_multiple_files=True,
-        type=["xlsx", "xls"]
+        type=["xlsx", "xls", "csv", "parquet"]
     )
 
     if not uploaded_files:
@@ -19,6 +33,11 @@ def load_excel_files():
 
     required_columns = ["Year", "Week", "Month", "Product", "Total"]
     combined_df = pd.DataFrame()
+    daily_frames = []
+    # Псевдонимы продуктов приводятся к названию из каталога один раз здесь, поэтому группировки
+    # на страницах не разделяют один продукт на несколько написаний
+    catalog = get_catalog()
+    renamed = False
 
     month_mapping = {
         "январь": 1, "февраль": 2, "март": 3, "апрель": 4,
@@ -31,7 +50,7 @@ def load_excel_files():
 
     for file in uploaded_files:
         try:
-            df_temp = pd.read_excel(file)
+            df_temp = read_upload(file)
             if df_temp.empty:
                 st.error(f"Файл {file.name} пустой или не содержит данных.")
                 continue
@@ -39,6 +58,18 @@ def load_excel_files():
             st.error(f"Ошибка чтения файла {file.name}: {str(e)}")
             continue
 
+        # Дневные выгрузки хранятся отдельно в компактном виде и сворачиваются в недели ниже
+        if is_daily(df_temp):
+            missing_cols = [col for col in DAILY_REQUIRED if col not in df_temp.columns]
+            if missing_cols:
+                st.error(f"Файл {file.name} не содержит столбцов: {missing_cols}")
+                continue
+            raw = df_temp["Product"].astype(str).str.strip()
+            products = catalog.canonical(raw)
+            renamed |= bool((products != raw).any())
+            daily_frames.append(compact_daily(df_temp.assign(Product=products)))
+            continue
+
         missing_cols = [col for col in required_columns if col not in df_temp.columns]
         if missing_cols:
             st.error(f"Файл {file.name} не содержит столбцов: {missing_cols}")
@@ -59,6 +90,11 @@ def load_excel_files():
 
         combined_df = pd.concat([combined_df, df_temp], ignore_index=True)
 
+    daily_df = None
+    if daily_frames:
+        daily_df = pd.concat(daily_frames, ignore_index=True)
+        combined_df = pd.concat([combined_df, to_weekly(daily_df)], ignore_index=True)
+
     if combined_df.empty:
         st.warning("Обработанные данные пусты.")
         return None
@@ -67,10 +103,30 @@ def load_excel_files():
         st.warning("Удалены дубликаты.")
         combined_df.drop_duplicates(subset=["Year", "Week", "Product"], inplace=True)
 
+    # Дубликаты ищутся по исходным названиям: строки двух написаний одного продукта в одной неделе
+    # складываются при группировке, а не отбрасываются
+    products = catalog.canonical(combined_df["Product"])
+    renamed |= bool((products != combined_df["Product"]).any())
+    combined_df["Product"] = products
+
     zero_total_ratio = (combined_df["Total"] <= 0).mean()
     if zero_total_ratio > 0.5:
         st.warning(f"Более 50% значений 'Total' некорректны. Проверьте данные.")
         return None
 
+    # Версия набора данных считается один раз — по байтам загруженных файлов
+    # (и каталогу, если его псевдонимы изменили названия продуктов)
+    version = version_from_files(uploaded_files)
+    attach_version(combined_df, derived_version(version, "canonical", catalog.fingerprint) if renamed else version)
+
+    # Дневные данные остаются на диске (Parquet); страницы читают из них только нужные столбцы
+    if daily_df is not None:
+        save_daily(daily_df, combined_df.attrs[VERSION_KEY])
+        combined_df.attrs[DAILY_KEY] = combined_df.attrs[VERSION_KEY]
+
     st.success("Файлы успешно загружены и обработаны!")
+
+    # Отчёт проверки сохраняется в БД вместе с версией и не пересчитывается при повторных запусках
+    with st.expander("Проверка данных", expanded=True):
+        show_validation(validation_report(combined_df))
     return combined_df
@@ -0,0 +1,106 @@
+import streamlit as st
+import pandas as pd
+import threading
+import time
+from collections import OrderedDict
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from versioning import VERSION_KEY, current_version
+
+# Сколько памяти процесса отводить под наборы данных: сверх этого вытесняются давно не читавшиеся версии,
+# на которые не ссылается ни одна живая сессия
+MAX_BYTES = 2 * 1024 ** 3
+
+# Сессия считается живой, пока обращалась к своим данным не позднее этого срока (секунды)
+SESSION_TTL = 3600
+
+
+class DataService:
+    """
+    Общий для всех сессий Streamlit реестр наборов данных.
+    Каждая версия хранится в процессе в единственном экземпляре; сессии держат
+    только идентификатор версии. Одинаковые загрузки разных пользователей
+    (одинаковые файлы -> одинаковая версия) разделяют одну копию.
+
+    Наружу выдаётся поверхностная копия: добавление и замена столбцов на ней общий экземпляр
+    не затрагивают, а значения остаются общими. Поэтому страницы не изменяют значения на месте
+    (df.loc[...] = ..., inplace=True) — перед такой правкой делается явный .copy().
+
+    Версии, на которые ссылаются живые сессии (обращавшиеся к данным за последние SESSION_TTL секунд),
+    не вытесняются; остальные удаляются по давности обращения, пока общий объём больше max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES, session_ttl: float = SESSION_TTL):
+        self.max_bytes = max_bytes
+        self.session_ttl = session_ttl
+        self._datasets: OrderedDict[str, pd.DataFrame] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._sessions: dict[str, tuple[str, float]] = {}  # сессия -> (версия, время последнего обращения)
+        self._lock = threading.Lock()
+
+    def publish(self, df: pd.DataFrame, session: str | None = None) -> str:
+        """Регистрирует очищенные данные и возвращает их версию (повторная публикация не копирует)."""
+        version = current_version(df)
+        size = None if version in self._sizes else int(df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            if version not in self._datasets:
+                self._datasets[version] = df
+                self._sizes[version] = size if size is not None else int(df.memory_usage(index=True, deep=True).sum())
+            self._datasets.move_to_end(version)
+            if session:
+                self._sessions[session] = (version, time.time())
+            self._evict()
+        return version
+
+    def get(self, version: str | None, session: str | None = None) -> pd.DataFrame | None:
+        if not version:
+            return None
+        with self._lock:
+            df = self._datasets.get(version)
+            if df is None:
+                return None
+            self._datasets.move_to_end(version)
+            if session:
+                self._sessions[session] = (version, time.time())
+        return df.copy(deep=False)
+
+    def _evict(self):
+        """Вытесняет давно не читавшиеся версии без живых сессий, пока объём больше max_bytes (под блокировкой)."""
+        deadline = time.time() - self.session_ttl
+        self._sessions = {s: (v, t) for s, (v, t) in self._sessions.items() if t >= deadline}
+        live = {v for v, _ in self._sessions.values()}
+        total = sum(self._sizes.values())
+        # Последняя опубликованная или прочитанная версия не вытесняется никогда
+        for version in [v for v in list(self._datasets)[:-1] if v not in live]:
+            if total <= self.max_bytes:
+                break
+            del self._datasets[version]
+            total -= self._sizes.pop(version)
+
+    def versions(self) -> list[str]:
+        with self._lock:
+            return list(self._datasets)
+
+
+@st.cache_resource
+def get_data_service() -> DataService:
+    """Один сервис данных на процесс."""
+    return DataService()
+
+
+def session_id() -> str | None:
+    """Идентификатор текущей сессии Streamlit (None вне сессии, например в фоновом потоке)."""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+def set_session_dataset(df: pd.DataFrame) -> pd.DataFrame:
+    """Публикует данные в общем сервисе и запоминает в сессии только их версию (сессия закрепляет версию)."""
+    service = get_data_service()
+    version = service.publish(df, session_id())
+    st.session_state[VERSION_KEY] = version
+    return service.get(version)
+
+
+def session_dataset() -> pd.DataFrame | None:
+    """Данные текущей сессии из общего сервиса (None, если не загружены или вытеснены)."""
+    return get_data_service().get(st.session_state.get(VERSION_KEY), session_id())
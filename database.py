@@ -0,0 +1,16 @@
+import sqlite3
+import os
+
+# SQLite-файл создаётся автоматически в корне проекта
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.db")
+
+
+def get_connection(db_path: str | None = None) -> sqlite3.Connection:
+    """
+    Подключение к локальной БД.
+    check_same_thread=False — соединение может использоваться фоновыми потоками Streamlit.
+    """
+    conn = sqlite3.connect(db_path or DB_PATH, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
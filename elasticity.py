@@ -0,0 +1,246 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import datetime
+from database import get_connection
+from jobs import Job, get_job_queue, job_status
+from registry import get_registry
+from versioning import current_version, derived_version, version_from_frame
+
+# Эластичность, если оценки нет или она ненадёжна
+DEFAULT_ELASTICITY = -1.0
+
+# Минимум наблюдений (недель с ценой и продажами) для оценки
+MIN_OBS = 8
+
+# Оценка принимается, если 95%-й интервал не шире этого значения
+MAX_CI_WIDTH = 2.0
+
+# Z-квантиль для 95%-го интервала
+Z_95 = 1.959963984540054
+
+# Код уровня «вся сеть» в столбце city
+NETWORK = ""
+
+# Ключ session_state с идентификатором задачи переоценки
+ESTIMATION_JOB = "elasticity_job"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS price_history (
+    product  TEXT NOT NULL,
+    city     TEXT NOT NULL DEFAULT '',
+    year     INTEGER NOT NULL,
+    week     INTEGER NOT NULL,
+    price    REAL NOT NULL,
+    PRIMARY KEY (product, city, year, week)
+);
+CREATE TABLE IF NOT EXISTS elasticities (
+    product       TEXT NOT NULL,
+    city          TEXT NOT NULL DEFAULT '',
+    elasticity    REAL NOT NULL,
+    std_error     REAL,
+    ci_low        REAL,
+    ci_high       REAL,
+    n_obs         INTEGER NOT NULL,
+    r2            REAL,
+    data_version  TEXT NOT NULL,
+    estimated_at  TEXT,
+    PRIMARY KEY (data_version, product, city)
+);
+"""
+
+
+def ensure_tables(conn):
+    conn.executescript(SCHEMA)
+    conn.commit()
+
+
+def load_price_history() -> pd.DataFrame:
+    conn = get_connection()
+    try:
+        ensure_tables(conn)
+        return pd.read_sql_query("SELECT product, city, year, week, price FROM price_history", conn)
+    finally:
+        conn.close()
+
+
+def save_price_history(prices: pd.DataFrame):
+    """
+    Загружает таблицу цен со столбцами Year, Week, Product, Price и необязательным City
+    (без города — цена по всей сети). Существующие записи обновляются.
+    """
+    city = prices["City"].fillna(NETWORK).astype(str) if "City" in prices.columns else NETWORK
+    rows = pd.DataFrame({
+        "product": prices["Product"].astype(str).str.strip(),
+        "city": city,
+        "year": pd.to_numeric(prices["Year"], errors="coerce"),
+        "week": pd.to_numeric(prices["Week"], errors="coerce"),
+        "price": pd.to_numeric(prices["Price"], errors="coerce"),
+    }).dropna()
+    rows = rows[rows["price"] > 0]
+    conn = get_connection()
+    try:
+        ensure_tables(conn)
+        conn.executemany(
+            "INSERT OR REPLACE INTO price_history (product, city, year, week, price) VALUES (?, ?, ?, ?, ?)",
+            rows.astype({"year": int, "week": int}).itertuples(index=False, name=None)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def load_elasticities(version: str) -> pd.DataFrame:
+    """Коэффициенты, оценённые по версии данных version (у каждой сессии — свои данные и свои оценки)."""
+    conn = get_connection()
+    try:
+        ensure_tables(conn)
+        return pd.read_sql_query("SELECT * FROM elasticities WHERE data_version = ? ORDER BY product, city",
+                                 conn, params=(version,))
+    finally:
+        conn.close()
+
+
+def save_elasticities(table: pd.DataFrame, version: str):
+    """Заменяет оценки версии данных version; оценки других версий не затрагиваются."""
+    conn = get_connection()
+    try:
+        ensure_tables(conn)
+        conn.execute("DELETE FROM elasticities WHERE data_version = ?", (version,))
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        conn.executemany(
+            """
+            INSERT INTO elasticities (product, city, elasticity, std_error, ci_low, ci_high, n_obs, r2,
+                                      data_version, estimated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [(*row, version, now) for row in table[
+                ["product", "city", "elasticity", "std_error", "ci_low", "ci_high", "n_obs", "r2"]
+            ].itertuples(index=False, name=None)]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def weekly_quantities(df: pd.DataFrame) -> pd.DataFrame:
+    """Недельные продажи по сети (Total) и по городам (сумма ресторанов города): year, week, product, city, qty."""
+    keys = pd.DataFrame({
+        "year": pd.to_numeric(df["Year"], errors="coerce").to_numpy(),
+        "week": pd.to_numeric(df["Week"], errors="coerce").to_numpy(),
+        "product": df["Product"].astype(str).to_numpy(),
+    })
+    parts = [keys.assign(city=NETWORK, qty=pd.to_numeric(df["Total"], errors="coerce").to_numpy())]
+    layout = get_registry().layout(df)
+    if layout.names:
+        by_city = layout.sum_by_city(layout.values(df))
+        for i, city in enumerate(layout.cities):
+            parts.append(keys.assign(city=city, qty=by_city[:, i]))
+    long = pd.concat(parts, ignore_index=True)
+    return long.groupby(["product", "city", "year", "week"], as_index=False)["qty"].sum()
+
+
+def estimate_elasticities(quantities: pd.DataFrame, prices: pd.DataFrame) -> pd.DataFrame:
+    """
+    Регрессия log(qty) = a + b·log(price) сразу для всех групп (продукт, город):
+    суммы Σx, Σy, Σx², Σxy, Σy² считаются через bincount по коду группы, коэффициенты —
+    по замкнутым формулам МНК. b — эластичность, со стандартной ошибкой и 95%-м интервалом.
+    """
+    data = prices.merge(quantities, on=["product", "city", "year", "week"], how="inner")
+    data = data[(data["price"] > 0) & (data["qty"] > 0)]
+    if data.empty:
+        return pd.DataFrame(columns=["product", "city", "elasticity", "std_error", "ci_low", "ci_high", "n_obs", "r2"])
+
+    codes, groups = pd.MultiIndex.from_frame(data[["product", "city"]]).factorize()
+    x = np.log(data["price"].to_numpy(np.float64))
+    y = np.log(data["qty"].to_numpy(np.float64))
+    size = len(groups)
+    n = np.bincount(codes, minlength=size).astype(np.float64)
+    sx, sy = np.bincount(codes, x, size), np.bincount(codes, y, size)
+    sxx, sxy, syy = np.bincount(codes, x * x, size), np.bincount(codes, x * y, size), np.bincount(codes, y * y, size)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var_x = sxx - sx * sx / n
+        slope = (sxy - sx * sy / n) / var_x
+        intercept = (sy - slope * sx) / n
+        sse = syy - 2 * intercept * sy - 2 * slope * sxy + n * intercept ** 2 + 2 * intercept * slope * sx \
+            + slope ** 2 * sxx
+        sst = syy - sy * sy / n
+        std_error = np.sqrt(np.clip(sse, 0, None) / (n - 2) / var_x)
+        r2 = 1 - sse / sst
+
+    table = pd.DataFrame({
+        "product": groups.get_level_values(0),
+        "city": groups.get_level_values(1),
+        "elasticity": slope,
+        "std_error": std_error,
+        "ci_low": slope - Z_95 * std_error,
+        "ci_high": slope + Z_95 * std_error,
+        "n_obs": n.astype(int),
+        "r2": r2,
+    })
+    # Группы без вариации цены или с малым числом наблюдений не оцениваются
+    valid = (table["n_obs"] >= MIN_OBS) & np.isfinite(table["elasticity"]) & np.isfinite(table["std_error"])
+    return table[valid].sort_values(["product", "city"], ignore_index=True)
+
+
+def run_estimation(job: Job | None, df: pd.DataFrame, prices: pd.DataFrame) -> pd.DataFrame:
+    """Пакетная переоценка (выполняется в очереди задач): продажи -> регрессия -> запись в БД."""
+    if job is not None:
+        job.set_total(3)
+        job.advance("Недельные продажи по сети и городам")
+    quantities = weekly_quantities(df)
+    if job is not None:
+        job.advance("Регрессия по всем продуктам")
+    table = estimate_elasticities(quantities, prices)
+    if job is not None:
+        job.advance("Сохранение коэффициентов")
+    save_elasticities(table, current_version(df))
+    return table
+
+
+class ElasticityBook:
+    """Эластичности для сценариев: город -> сеть -> значение по умолчанию; ненадёжные оценки не используются."""
+
+    def __init__(self, table: pd.DataFrame):
+        reliable = table[(table["ci_high"] - table["ci_low"]) <= MAX_CI_WIDTH]
+        self.values = {(row.product, row.city): row.elasticity for row in reliable.itertuples(index=False)}
+
+    def get(self, product: str, city: str | None = None) -> tuple[float, str]:
+        """Эластичность и её источник."""
+        if city and (product, city) in self.values:
+            return self.values[(product, city)], f"оценка ({city})"
+        if (product, NETWORK) in self.values:
+            return self.values[(product, NETWORK)], "оценка (сеть)"
+        return DEFAULT_ELASTICITY, "по умолчанию"
+
+
+def manage_elasticities(df: pd.DataFrame):
+    """Загрузка истории цен, запуск переоценки в фоне и просмотр сохранённых коэффициентов."""
+    uploaded = st.file_uploader("История цен (Year, Week, Product, Price и необязательно City)",
+                                type=["xlsx", "xls", "csv"], key="price_history_file")
+    if uploaded is not None and st.button("Сохранить историю цен"):
+        prices = pd.read_csv(uploaded) if uploaded.name.lower().endswith(".csv") else pd.read_excel(uploaded)
+        st.success(f"Сохранено цен: {save_price_history(prices)}")
+
+    prices = load_price_history()
+    st.write(f"Записей в истории цен: {len(prices)}")
+    if not prices.empty and st.button("Переоценить эластичности"):
+        key = derived_version(current_version(df), "elasticity", version_from_frame(prices))
+        job = get_job_queue().submit(key, run_estimation, df, prices, title="Оценка эластичностей")
+        st.session_state[ESTIMATION_JOB] = job.id
+        # Готовый результат с диска (та же версия данных и те же цены) задача не пересчитывает —
+        # коэффициенты этой версии переписываются из него, иначе в БД остались бы оценки по другим ценам
+        if job.finished_ok:
+            save_elasticities(job.result(), current_version(df))
+
+    job = get_job_queue().get(st.session_state.get(ESTIMATION_JOB))
+    if job is not None:
+        job_status(job)
+
+    table = load_elasticities(current_version(df))
+    if table.empty:
+        st.info(f"Оценок пока нет — используется эластичность {DEFAULT_ELASTICITY}.")
+    else:
+        st.dataframe(table.drop(columns=["data_version"]).round(3), hide_index=True)
@@ -0,0 +1,96 @@
+import streamlit as st
+import pandas as pd
+import importlib.util
+from report_cache import XLSX_MIME, get_artifact_cache
+
+# Размер порции строк при потоковой записи CSV
+CSV_CHUNK_ROWS = 100_000
+
+
+def write_xlsx(df: pd.DataFrame, path: str, sheet_name: str = "Sheet1"):
+    """Excel — для ручного просмотра; самый медленный формат."""
+    with pd.ExcelWriter(path, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False, sheet_name=sheet_name)
+
+
+def write_parquet(df: pd.DataFrame, path: str):
+    """Parquet (колоночный, сжатый) — для ERP/BI и больших таблиц."""
+    df.to_parquet(path, index=False, engine="pyarrow", compression="zstd")
+
+
+def write_arrow(df: pd.DataFrame, path: str):
+    """Arrow IPC (файловый формат) — чтение без разбора, напрямую в память."""
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=CSV_CHUNK_ROWS)
+
+
+def iter_csv_chunks(df: pd.DataFrame, chunk_rows: int = CSV_CHUNK_ROWS):
+    """Генератор CSV по частям: заголовок отдаётся только с первой порцией."""
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        yield chunk.to_csv(index=False, header=(start == 0)).encode("utf-8")
+
+
+def write_csv(df: pd.DataFrame, path: str, chunk_rows: int = CSV_CHUNK_ROWS):
+    """CSV с потоковой записью: в памяти одновременно находится только одна порция строк."""
+    with open(path, "wb") as f:
+        for part in iter_csv_chunks(df, chunk_rows):
+            f.write(part)
+
+
+# Название формата -> (расширение, MIME, нужен ли pyarrow)
+EXPORT_FORMATS = {
+    "Excel (xlsx)": ("xlsx", XLSX_MIME, False),
+    "Parquet": ("parquet", "application/vnd.apache.parquet", True),
+    "Arrow IPC": ("arrow", "application/vnd.apache.arrow.file", True),
+    "CSV": ("csv", "text/csv", False),
+}
+
+
+def available_formats() -> list[str]:
+    """Список форматов, доступных в текущем окружении (Parquet/Arrow требуют pyarrow)."""
+    has_pyarrow = importlib.util.find_spec("pyarrow") is not None
+    return [name for name, (_, _, needs_arrow) in EXPORT_FORMATS.items() if has_pyarrow or not needs_arrow]
+
+
+def export_table(df: pd.DataFrame, path: str, fmt: str, sheet_name: str = "Sheet1"):
+    """Запись таблицы в файл выбранного формата."""
+    ext = EXPORT_FORMATS[fmt][0]
+    if ext == "xlsx":
+        write_xlsx(df, path, sheet_name)
+    elif ext == "parquet":
+        write_parquet(df, path)
+    elif ext == "arrow":
+        write_arrow(df, path)
+    else:
+        write_csv(df, path)
+
+
+def download_table(df: pd.DataFrame, report_type: str, year, version: str, label: str, file_stem: str,
+                   sheet_name: str = "Sheet1", params: dict | None = None, key: str | None = None):
+    """
+    Выбор формата и кнопка скачивания таблицы.
+    Файл любого формата хранится в кэше артефактов и строится один раз на версию данных.
+    """
+    key = key or f"export_{report_type}"
+    fmt = st.radio("Формат файла", available_formats(), horizontal=True, key=f"{key}_fmt")
+    ext, mime, _ = EXPORT_FORMATS[fmt]
+
+    path = get_artifact_cache().get_path(
+        report_type, year, version,
+        writer=lambda p: export_table(df, p, fmt, sheet_name),
+        params=params,
+        ext=ext
+    )
+    with open(path, "rb") as f:
+        st.download_button(
+            label=label,
+            data=f.read(),
+            file_name=f"{file_stem}.{ext}",
+            mime=mime,
+            key=key
+        )
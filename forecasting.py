@@ -1,52 +1,65 @@
 import streamlit as st
 import pandas as pd
 import datetime
-import io
 from prophet import Prophet
 from joblib import Parallel, delayed
+from array_store import ALL_FORECAST_JOB, forecast_view, history_series, history_views
+from calendar_features import prophet_holidays
+from data_service import session_id
+from exporters import download_table
+from granularity import DAILY_KEY, GRAINS, daily_series, grain_label, has_daily, resample, resample_series
+from intervals import (INTERVAL_WIDTH, QUANTILES, city_intervals, interval_table, network_intervals,
+                       sum_intervals)
+from jobs import Job, get_job_queue, job_status
+from monitoring import DRIFT_PRESET, drifted_series, issue_forecast
+from prophet_config import (DEFAULT_PRESET, PRESETS, fit_model, make_model, preset_label, record_run, show_presets,
+                            silence_stan)
+from registry import get_registry
+from validation import validation_report
+from versioning import VERSION_KEY, attach_version, current_version, derived_version
+
+
+def iso_week_start(years: pd.Series, weeks: pd.Series) -> pd.Series:
+    """Понедельник ISO-недели для столбцов Year/Week (векторно; NaT для несуществующих недель)."""
+    years = pd.to_numeric(years, errors="coerce")
+    weeks = pd.to_numeric(weeks, errors="coerce")
+    jan4 = pd.to_datetime(years * 10000 + 104, format="%Y%m%d", errors="coerce")
+    dates = jan4 - pd.to_timedelta(jan4.dt.dayofweek, unit="D") + pd.to_timedelta((weeks - 1) * 7, unit="D")
+    # Неделя 53 существует не в каждом году — такие даты попадают в следующий ISO-год
+    return dates.where(dates.dt.isocalendar().week.astype("float") == weeks)
+
 
-# Список ресторанов
-RESTAURANT_LIST = [
-    "Samara Cosmoport", "Samara Mega", "Nijniy Novgorod Mega", "Nijniy Novgorod 7 Nebo",
-    "Nijniy Novgorod Fantastika", "Nijniy Novgorod Nebo", "Kazan Mall", "Kazan Tandem",
-    "Kazan Mega", "Kazan Koltso", "Kazan Yujniy", "Kazan Park House", "Moscow Metropolis",
-    "Moscow Gagarinskiy", "Moscow Erevan Plaza", "Moscow Mega Tyopliy Stan", "Moscow Aviapark",
-    "Moscow Afimall", "Khimki Mega", "Moscow RIO", "Moscow Fillion", "Moscow Columbus",
-    "Moscow Kashirskoye Plaza", "Moscow Kaleydoscop", "Moscow Europolis", "Zelenograd Zelenopark",
-    "Moscow Vegas", "Moscow Vodniy", "Moscow Mozaika", "Moscow Gorod", "Moscow Kuzminki Mall",
-    "Moscow Mega Kotelniki", "Moscow Mega Kommunarka", "Moscow Salaris", "Nijnevartovsk GreenPark",
-    "Ufa Mega", "Chelny Kvartal", "Ekaterinburg Veer Mall", "Ekaterinburg Greenvich",
-    "Voronej Galereya Chijova", "Voronej Grad"
-]
-
-
-@st.cache_data
 def preprocess_data(df: pd.DataFrame) -> pd.DataFrame | None:
+    """
+    Агрегация по (Date, Product). Результат кэшируется по версии набора данных и справочника ресторанов,
+    поэтому DataFrame не хэшируется целиком при каждом вызове и не изменяется.
+    """
+    return _aggregate_by_date(df, current_version(df), get_registry().fingerprint)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _aggregate_by_date(_df: pd.DataFrame, version: str, registry: str) -> pd.DataFrame | None:
+    df = _df
     required_cols = {"Year", "Week", "Total", "Product"}
     if not required_cols.issubset(df.columns):
         st.error(f"Необходимые столбцы {required_cols} отсутствуют: {required_cols - set(df.columns)}")
         return None
 
-    def year_week_to_date(y: int, w: int) -> datetime.date | None:
-        try:
-            return datetime.datetime.strptime(f"{y}-W{w}-1", "%G-W%V-%u").date()
-        except ValueError:
-            st.error(f"Некорректный формат года/недели: {y}, {w}")
-            return None
-
     if "Date" not in df.columns:
-        df["Date"] = df.apply(lambda row: year_week_to_date(int(row["Year"]), int(row["Week"])), axis=1)
-        if df["Date"].isnull().any():
+        dates = iso_week_start(df["Year"], df["Week"])
+        if dates.isnull().any():
+            bad = df.loc[dates.isnull(), ["Year", "Week"]].iloc[0]
+            st.error(f"Некорректный формат года/недели: {bad['Year']}, {bad['Week']}")
             st.error("Ошибки при преобразовании года/недели в дату. Проверьте данные.")
             return None
     else:
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-        if df["Date"].isnull().any():
+        dates = pd.to_datetime(df["Date"], errors="coerce")
+        if dates.isnull().any():
             st.error("Некорректные даты в столбце 'Date'.")
             return None
+    df = df.assign(Date=dates)
 
-    restaurant_cols_present = [col for col in RESTAURANT_LIST if
-                               col in df.columns and pd.api.types.is_numeric_dtype(df[col])]
+    restaurant_cols_present = get_registry().restaurant_columns(df)
     if not restaurant_cols_present:
         st.warning("В данных отсутствуют числовые столбцы для указанных ресторанов.")
 
@@ -61,151 +74,343 @@ def preprocess_data(df: pd.DataFrame) -> pd.DataFrame | None:
         df_rest = df.groupby(["Date", "Product"], as_index=False).agg(agg_dict_rest)
         df_agg = pd.merge(df_agg, df_rest, on=["Date", "Product"], how="left")
 
-    if "Case kg" in df_agg.columns:
-        df_agg.drop(columns=["Case kg"], inplace=True)
+    # Вес коробки — атрибут продукта, а не продажи: не суммируется, а переносится как есть (нужен для заказов)
+    if "Case kg" in df.columns:
+        case_kg = pd.to_numeric(df["Case kg"], errors="coerce").groupby(df["Product"]).max()
+        df_agg["Case kg"] = df_agg["Product"].map(case_kg)
+
+    # У агрегированной таблицы своя версия: кэши по строкам исходных данных к ней неприменимы
+    return attach_version(df_agg, derived_version(version, "by_date", registry))
+
 
-    return df_agg
+def holidays_for(df: pd.DataFrame, horizon: int, freq: str = "W-MON") -> pd.DataFrame:
+    """Праздники и промо-недели на весь период истории и горизонта (одна таблица на пакетный запуск)."""
+    dates = pd.to_datetime(df["Date"] if "Date" in df.columns else df["ds"])
+    last = dates.max() + pd.tseries.frequencies.to_offset(freq) * horizon
+    return prophet_holidays(int(dates.min().year), int(last.year))
 
 
-def forecast_prophet(df: pd.DataFrame, horizon: int) -> pd.DataFrame:
+def forecast_prophet(df: pd.DataFrame, horizon: int, holidays: pd.DataFrame | None = None,
+                     freq: str = "W-MON", preset: str = DEFAULT_PRESET) -> pd.DataFrame:
     df = df.rename(columns={"Date": "ds", "Total": "y"})
-    model = Prophet()
-    model.fit(df)
-    future = model.make_future_dataframe(periods=horizon, freq="W")
+    if holidays is None:
+        holidays = holidays_for(df, horizon, freq)
+    model = make_model(df, preset, holidays, freq)
+    fit_model(model, df, preset)
+    # Даты истории — начала периодов (понедельники ISO-недель, первые числа месяцев),
+    # поэтому будущие периоды строим с той же частотой
+    future = model.make_future_dataframe(periods=horizon, freq=freq)
     forecast = model.predict(future)
-    forecast = forecast[["ds", "yhat"]].rename(columns={"ds": "Date", "yhat": "Прогноз"})
-    forecast["Прогноз"] = forecast["Прогноз"].round().astype(int)
+    forecast = forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]].rename(
+        columns={"ds": "Date", "yhat": "Прогноз", "yhat_lower": "P10", "yhat_upper": "P90"})
+    forecast[["Прогноз", "P10", "P90"]] = forecast[["Прогноз", "P10", "P90"]].round().astype(int)
     return forecast
 
 
+def forecast_all_restaurants(job: Job | None, df: pd.DataFrame, horizon: int,
+                             restaurants: list[str], freq: str = "W-MON",
+                             preset: str = DEFAULT_PRESET, upgraded: tuple = ()) -> pd.DataFrame | None:
+    """
+    Квантильный прогноз на горизонт (без истории) по каждой паре (ресторан, продукт)
+    в длинном формате: Дата, Ресторан, Продукт, P10, P50, P90 (float32, не меньше нуля).
+    Не обращается к Streamlit, поэтому выполняется в фоновой очереди; через job сообщает
+    о прогрессе и прерывается между рядами, если задачу отменили.
+    Ряды из upgraded (продукт, ресторан) — с дрейфом ошибки — считаются профилем DRIFT_PRESET.
+    Время обучения рядов сохраняется в статистику своего профиля модели.
+    """
+    silence_stan()
+    all_rest_prod_forecast = []
+    fit_times = {}
+    upgraded = set(upgraded)
+    # Календарь праздников считаем один раз на весь пакет, а не для каждого ряда
+    batch_holidays = holidays_for(df, horizon, freq)
+    products = df["Product"].unique()
+    if job is not None:
+        job.set_total(len(restaurants) * len(products))
+    for rest_ in restaurants:
+        dtemp = df.groupby(["Date", "Product"])[rest_].sum().reset_index()
+        for prod_ in products:
+            if job is not None:
+                job.advance(f"{rest_} / {prod_}")
+            dtemp_prod = dtemp[dtemp["Product"] == prod_].copy()
+            if dtemp_prod.empty:
+                continue
+
+            dtemp_prod = dtemp_prod.rename(columns={"Date": "ds", rest_: "y"})
+            series_preset = DRIFT_PRESET if (prod_, rest_) in upgraded else preset
+            model = make_model(dtemp_prod, series_preset, batch_holidays, freq)
+            fit_times.setdefault(series_preset, []).append(fit_model(model, dtemp_prod[["ds", "y"]], series_preset))
+            future = model.make_future_dataframe(periods=horizon, freq=freq, include_history=False)
+            forecast = model.predict(future)
+            forecast = pd.DataFrame({
+                "Дата": forecast["ds"],
+                "P10": forecast["yhat_lower"].clip(lower=0).astype("float32"),
+                "P50": forecast["yhat"].clip(lower=0).astype("float32"),
+                "P90": forecast["yhat_upper"].clip(lower=0).astype("float32"),
+            })
+            forecast["Ресторан"] = rest_
+            forecast["Продукт"] = prod_
+            all_rest_prod_forecast.append(forecast)
+
+    grain = next(code for code, spec in GRAINS.items() if spec[1] == freq)
+    for run_preset, times in fit_times.items():
+        record_run(run_preset, grain, "batch", times, version=df.attrs.get(VERSION_KEY))
+    if not all_rest_prod_forecast:
+        return None
+    return pd.concat(all_rest_prod_forecast, ignore_index=True)[["Дата", "Ресторан", "Продукт"] + QUANTILES]
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def cached_forecast(_df: pd.DataFrame, horizon: int, key: str, freq: str = "W-MON",
+                    preset: str = DEFAULT_PRESET) -> pd.DataFrame:
+    """Прогноз одного ряда; key — версия данных + продукт + ресторан + шаг, поэтому df не хэшируется."""
+    return forecast_prophet(_df, horizon, freq=freq, preset=preset)
+
+
+def history_for_grain(df: pd.DataFrame, grain: str, product: str, restaurant: str | None,
+                      daily_version: str | None) -> pd.DataFrame:
+    """
+    Ряд (ds, y) с нужным шагом. Недельный и месячный шаг строятся из дневных данных, если они
+    загружены, иначе из недель (месяц недели — по её понедельнику); дневной — только из дневных данных.
+    Из дневного хранилища читается один столбец одного продукта.
+    """
+    if has_daily(daily_version, restaurant or "Total"):
+        series = daily_series(daily_version, product, restaurant)
+        return series if grain == "D" else resample_series(series, grain)
+    series = history_series(history_views(df), product, restaurant)
+    return series if grain == "W" else resample_series(series, grain)
+
+
 def build_forecast(df: pd.DataFrame):
     today = datetime.date.today()
-    st.info(f"Сегодняшняя дата: {today}. Прогнозируем недели после текущей.")
+    st.info(f"Сегодняшняя дата: {today}. Прогнозируем периоды после текущей недели.")
 
     st.subheader("Прогноз спроса на продукцию и рестораны")
 
+    report = validation_report(df)
+    dataset_version = current_version(df)
+    daily_version = df.attrs.get(DAILY_KEY)
     df = preprocess_data(df)
     if df is None or df.empty:
         st.error("Данные не прошли проверку или пусты.")
         return
 
+    # Профиль модели общий для одиночного и пакетного прогноза и входит в ключи их кэшей
+    preset = st.selectbox("Профиль модели Prophet", list(PRESETS), index=list(PRESETS).index(DEFAULT_PRESET),
+                          format_func=preset_label, key="prophet_preset")
+    with st.expander("Профили модели: параметры, скорость и точность"):
+        show_presets(df, lambda: holidays_for(df, 0))
+
     st.markdown("### Прогноз по конкретному продукту и ресторану")
 
     products = sorted(df["Product"].unique().tolist())
     sel_product = st.selectbox("Выберите продукт", products, key="sel_product")
 
-    rest_cols_present = [c for c in RESTAURANT_LIST if c in df.columns and pd.api.types.is_numeric_dtype(df[c])]
+    rest_cols_present = get_registry().active_columns(df)
     sel_restaurant = st.selectbox("Выберите ресторан", ["Суммарно"] + rest_cols_present, key="sel_restaurant")
 
-    horizon_pr = st.slider("Горизонт (недель) [продукт+ресторан]", 1, 4, 2, key="horizon_pr")
-
-    df_prod = df[df["Product"] == sel_product].copy()
-    if df_prod.empty:
-        st.warning("Нет строк с выбранным продуктом.")
-        return
-
-    if sel_restaurant == "Суммарно":
-        df_prod["Sales"] = df_prod["Total"]
-    else:
-        df_prod["Sales"] = df_prod[sel_restaurant]
-
-    df_prod_agg = df_prod.groupby("Date")["Sales"].sum().reset_index()
+    if sel_restaurant == "Суммарно" and report["total_mismatch_rows"]:
+        st.info(f"В {report['total_mismatch_rows']} строках Total не совпадает с суммой ресторанов — "
+                "суммарный прогноз может расходиться с прогнозами по ресторанам.")
+
+    # Дневной шаг доступен, только если ресторан есть в загруженных дневных выгрузках
+    restaurant = None if sel_restaurant == "Суммарно" else sel_restaurant
+    daily_available = has_daily(daily_version, restaurant or "Total")
+    if has_daily(daily_version) and not daily_available:
+        st.warning(f"Ресторана '{sel_restaurant}' нет в дневной выгрузке — ряд строится по недельным данным, "
+                   "дневной шаг недоступен.")
+    grains = [grain for grain in GRAINS if grain != "D" or daily_available]
+    grain = st.radio("Шаг прогноза", grains, index=grains.index("W"), format_func=grain_label,
+                     horizontal=True, key="grain_pr")
+    _, freq, max_horizon, default_horizon = GRAINS[grain]
+    horizon_pr = st.slider(f"Горизонт (периодов: {grain_label(grain).lower()}) [продукт+ресторан]",
+                           1, max_horizon, default_horizon, key=f"horizon_pr_{grain}")
+
+    # Недельный ряд берётся срезом из хранилища массивов, дневной — из колоночного хранилища
+    df_prod_agg = history_for_grain(df, grain, sel_product, restaurant, daily_version)
     if df_prod_agg.empty:
         st.warning("Нет данных для выбранного продукта и ресторана.")
         return
 
-    df_prod_agg = df_prod_agg.rename(columns={"Date": "ds", "Sales": "y"})
-    forecast_pr = forecast_prophet(df_prod_agg, horizon_pr)
+    forecast_pr = cached_forecast(df_prod_agg, horizon_pr,
+                                  derived_version(current_version(df), sel_product, sel_restaurant, grain, preset),
+                                  freq, preset)
 
     # Plot the forecast
-    st.write(f"Прогноз для продукта '{sel_product}' и ресторана '{sel_restaurant}' на {horizon_pr} недель:")
+    st.write(f"Прогноз для продукта '{sel_product}' и ресторана '{sel_restaurant}' "
+             f"на {horizon_pr} периодов ({grain_label(grain).lower()}):")
     st.line_chart(forecast_pr.set_index("Date")["Прогноз"])
 
-    # Sum the forecast over the selected horizon weeks and round to integer
-    sum_forecast = int(forecast_pr['Прогноз'].sum())
+    # Sum the forecast over the horizon weeks only (the frame also contains the fitted history)
+    horizon_rows = forecast_pr.tail(horizon_pr)
+    p10, p50, p90 = sum_intervals(horizon_rows[["P10", "Прогноз", "P90"]].to_numpy(), axis=0,
+                                  correlated=True).round().astype(int)
 
     # Display the sum in a table with space-separated numbers
-    st.write(pd.DataFrame({'Прогноз': [f"{sum_forecast:,}".replace(',', ' ')]}))
+    st.write(pd.DataFrame({
+        'Прогноз': [f"{p50:,}".replace(',', ' ')],
+        'Интервал P10–P90': [f"{p10:,} – {p90:,}".replace(',', ' ')],
+    }))
     st.success("Прогноз успешно построен!")
     st.markdown("---")
 
     st.markdown("## Прогноз по всем ресторанам (с суммированием по продуктам)")
 
-    horizon_all_rest_prod = st.slider("Горизонт (недель) [Все рестораны и продукты]", 1, 4, 2,
-                                      key="horizon_all_rest_prod")
+    # Пакетный прогноз — по неделям или месяцам: число обучений Prophet не зависит от шага,
+    # а дневные ряды в 7 раз длиннее и в пакетном режиме не используются
+    grain_all = st.radio("Шаг прогноза [Все рестораны и продукты]", ["W", "M"], format_func=grain_label,
+                         horizontal=True, key="grain_all")
+    _, freq_all, max_horizon_all, default_horizon_all = GRAINS[grain_all]
+    horizon_all_rest_prod = st.slider(
+        f"Горизонт (периодов: {grain_label(grain_all).lower()}) [Все рестораны и продукты]",
+        1, max_horizon_all, default_horizon_all, key=f"horizon_all_rest_prod_{grain_all}")
 
-    numeric_rest_cols = [c for c in RESTAURANT_LIST if c in df.columns and pd.api.types.is_numeric_dtype(df[c])]
+    numeric_rest_cols = rest_cols_present
 
     if not numeric_rest_cols:
         st.warning("В данных отсутствуют числовые столбцы для ресторанов.")
         return
 
+    # Ряды, у которых мониторинг точности отметил дрейф ошибки, можно посчитать более точным профилем
+    drifted = drifted_series() if preset != DRIFT_PRESET else []
+    upgraded = ()
+    if drifted and st.checkbox(f"Ряды с дрейфом ошибки ({len(drifted)}) — профилем «{preset_label(DRIFT_PRESET)}»",
+                               value=True, key="upgrade_drifted"):
+        upgraded = tuple(drifted)
+
     if st.button("Сформировать прогноз по всем ресторанам (с суммированием)"):
-        all_rest_prod_forecast = []
-        with st.spinner("Выполняется прогнозирование (все рестораны и продукты)..."):
-            for rest_ in numeric_rest_cols:
-                dtemp = df.groupby(["Date", "Product"])[rest_].sum().reset_index()
-                for prod_ in df["Product"].unique():
-                    dtemp_prod = dtemp[dtemp["Product"] == prod_].copy()
-                    if dtemp_prod.empty:
-                        continue
-
-                    dtemp_prod = dtemp_prod.rename(columns={"Date": "ds", rest_: "y"})
-                    model = Prophet()
-                    model.fit(dtemp_prod[["ds", "y"]])
-                    future = model.make_future_dataframe(periods=horizon_all_rest_prod, freq="W")
-                    forecast = model.predict(future)
-                    forecast = forecast[["ds", "yhat"]].rename(columns={"ds": "Дата", "yhat": "Прогноз"})
-                    forecast["Ресторан"] = rest_
-                    forecast["Продукт"] = prod_
-                    all_rest_prod_forecast.append(forecast)
-
-        if all_rest_prod_forecast:
-            df_all_rest_prod_forecast = pd.concat(all_rest_prod_forecast)
-
-            # Sum the forecast over the selected horizon weeks for each restaurant and product
-            df_all_rest_prod_forecast_agg = df_all_rest_prod_forecast.groupby(["Ресторан", "Продукт"])[
-                "Прогноз"].sum().reset_index()
-            df_all_rest_prod_forecast_agg["Прогноз"] = df_all_rest_prod_forecast_agg["Прогноз"].round().astype(int)
-
-            # Pivot the table
-            df_pivot = df_all_rest_prod_forecast_agg.pivot(index="Продукт", columns="Ресторан",
-                                                           values="Прогноз").fillna(0)
-            df_pivot = df_pivot.astype(int)
-            df_pivot.reset_index(inplace=True)
-            df_pivot.columns.name = None  # Remove the column hierarchy name
-
-            st.markdown("### Таблица прогноза по продуктам и ресторанам")
-            st.dataframe(df_pivot)
-
-            # Download button for the pivot table
-            buf = io.BytesIO()
-            df_pivot.to_excel(buf, index=False, engine="xlsxwriter")
-            buf.seek(0)
-            st.download_button(
-                label="Скачать таблицу в Excel",
-                data=buf,
-                file_name="forecast_table.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-
-            # Display the aggregated forecast dataframe
-            st.markdown("### Результат прогноза по всем ресторанам (с суммированием по продуктам)")
-            st.dataframe(df_all_rest_prod_forecast_agg)
-
-            # Download button for the aggregated forecast
-            buf_all_rest_prod = io.BytesIO()
-            with pd.ExcelWriter(buf_all_rest_prod, engine="xlsxwriter") as writer:
-                df_all_rest_prod_forecast_agg.to_excel(writer, index=False, sheet_name="Forecast")
-
-            st.download_button(
-                "Скачать общий прогноз по ресторанам (с суммированием по продуктам) в Excel",
-                data=buf_all_rest_prod,
-                file_name="all_restaurants_products_forecast.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-        else:
-            st.warning("Нет данных для прогноза по ресторанам и продуктам.")
+        # Одинаковые запросы из разных сессий подключаются к одной задаче в общей очереди,
+        # а готовый результат сохраняется на диск и переживает перезапуск страницы
+        job_key = derived_version(current_version(df), "all_restaurants", horizon_all_rest_prod, tuple(QUANTILES),
+                                  grain_all, preset, upgraded)
+        df_batch = df if grain_all == "W" else resample(df, grain_all)
+        origin = str(df["Date"].max().date())
+        job = get_job_queue().submit(job_key, run_batch_forecast, df_batch, horizon_all_rest_prod,
+                                     numeric_rest_cols, freq_all, preset, upgraded,
+                                     job_key, dataset_version, grain_all, origin,
+                                     title=f"Прогноз по всем ресторанам и продуктам ({preset_label(preset)})",
+                                     session=session_id())
+        st.session_state[ALL_FORECAST_JOB] = {"id": job.id, "key": job_key, "horizon": horizon_all_rest_prod,
+                                              "grain": grain_all, "preset": preset, "upgraded": upgraded,
+                                              "origin": origin}
+
+    job_info = st.session_state.get(ALL_FORECAST_JOB)
+    job = get_job_queue().get(job_info["id"]) if job_info else None
+    if job is None:
+        return
+    if job.active:
+        _watch_forecast_job(job.id)
+    elif job.finished_ok:
+        # Публикация для HTTP API и архив мониторинга выполнены задачей при завершении
+        show_all_restaurants_forecast(job.result(), job_info["key"], job_info["horizon"])
+    else:
+        job_status(job)
+
+
+@st.fragment(run_every=2)
+def _watch_forecast_job(job_id: str):
+    """Прогресс фоновой задачи; обновляется сам, не перезапуская всю страницу."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return
+    if not job.active:
+        # Задача завершилась — перерисовываем страницу целиком, чтобы показать результат
+        st.rerun()
+    job_status(job)
+    if st.button("Отменить прогноз", key="cancel_forecast_all"):
+        # Задача общая: если её ждут другие сессии, она продолжает считаться, а эта сессия от неё отключается
+        if not job.cancel(session_id()):
+            st.session_state.pop(ALL_FORECAST_JOB, None)
+            st.toast("Этот прогноз ждут другие пользователи: он продолжит считаться, ваша сессия от него отключена.")
+            st.rerun()
+
+
+def run_batch_forecast(job: Job | None, df: pd.DataFrame, horizon: int, restaurants: list[str], freq: str,
+                       preset: str, upgraded: tuple, run_key: str, version: str, grain: str, origin: str):
+    """Пакетный прогноз как задача очереди: по завершении прогноз сразу выдаётся (хранилище, API, архив)."""
+    result = forecast_all_restaurants(job, df, horizon, restaurants, freq, preset, upgraded)
+    if result is not None:
+        issue_forecast(result, run_key, version, grain, horizon, preset, origin, upgraded)
+    return result
+
+
+def show_all_restaurants_forecast(df_all_rest_prod_forecast: pd.DataFrame | None, key: str,
+                                  horizon_all_rest_prod: int):
+    if df_all_rest_prod_forecast is None:
+        st.warning("Нет данных для прогноза по ресторанам и продуктам.")
+        return
+
+    # Квантили хранятся массивом неделя × продукт × ресторан × (P10, P50, P90);
+    # суммы за горизонт и по городам/сети считаются векторно по его осям
+    tensor = forecast_view(df_all_rest_prod_forecast, key)
+    products = tensor.labels("product")
+    restaurants = tensor.labels("restaurant")
+    # Недели одного ряда суммируются как коррелированные, рестораны и города ниже — как независимые
+    horizon_sum = sum_intervals(tensor.data, axis=0, correlated=True)  # продукт × ресторан × квантиль
+    # Выгрузки кэшируются по ключу задачи: он включает версию данных, горизонт, шаг, профиль и ряды с дрейфом
+    params = {"horizon": horizon_all_rest_prod}
+
+    df_pivot = pd.DataFrame(tensor.data[..., 1].sum(axis=0).round().astype(int),
+                            index=pd.Index(products, name="Продукт"), columns=restaurants)
+    df_pivot.reset_index(inplace=True)
+
+    st.markdown("### Таблица прогноза по продуктам и ресторанам (P50)")
+    st.dataframe(df_pivot)
+    download_table(
+        df_pivot, "forecast_table", None, key,
+        label="Скачать таблицу",
+        file_stem="forecast_table",
+        params=params,
+        key="export_forecast_table"
+    )
+
+    # Aggregated forecast with intervals for each restaurant and product
+    df_all_rest_prod_forecast_agg = interval_table(horizon_sum, products, restaurants, "Ресторан")
+    st.markdown("### Результат прогноза по всем ресторанам (с суммированием по продуктам)")
+    st.dataframe(df_all_rest_prod_forecast_agg)
+    download_table(
+        df_all_rest_prod_forecast_agg, "all_restaurants_products_forecast", None, key,
+        label="Скачать общий прогноз по ресторанам (с суммированием по продуктам)",
+        file_stem="all_restaurants_products_forecast",
+        sheet_name="Forecast",
+        params=params,
+        key="export_forecast_agg"
+    )
+
+    # City and network level intervals for procurement
+    city_sum, cities = city_intervals(horizon_sum, restaurants)
+    df_city = interval_table(city_sum, products, cities, "Город")
+    df_network = interval_table(network_intervals(horizon_sum)[:, None, :], products, ["Сеть"], "Уровень")
+    st.markdown("### Прогноз с интервалами по городам и сети")
+    st.dataframe(df_city)
+    download_table(
+        df_city, "forecast_by_city", None, key,
+        label="Скачать прогноз по городам",
+        file_stem="forecast_by_city",
+        sheet_name="Forecast",
+        params=params,
+        key="export_forecast_city"
+    )
+    st.dataframe(df_network)
+    download_table(
+        df_network, "forecast_network", None, key,
+        label="Скачать прогноз по сети",
+        file_stem="forecast_network",
+        sheet_name="Forecast",
+        params=params,
+        key="export_forecast_network"
+    )
+
+    # Full long-format forecast (restaurant × product × date) for ERP import
+    st.markdown("### Полный прогноз по датам (ресторан × продукт × неделя)")
+    download_table(
+        df_all_rest_prod_forecast, "all_restaurants_products_forecast_long", None, key,
+        label="Скачать полный прогноз по датам",
+        file_stem="all_restaurants_products_forecast_long",
+        sheet_name="Forecast",
+        params=params,
+        key="export_forecast_long"
+    )
 
 
 if __name__ == "__main__":
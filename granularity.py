@@ -0,0 +1,132 @@
+import pandas as pd
+import numpy as np
+import functools
+import os
+import pyarrow.parquet as pq
+
+# Каталог дневных данных: <DAILY_DIR>/<версия>.parquet
+DAILY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "daily_store")
+
+# Ключ в DataFrame.attrs: версия загрузки, под которой сохранены дневные данные
+DAILY_KEY = "daily_version"
+
+# Шаги времени: код -> (подпись, частота pandas/Prophet, максимальный горизонт, горизонт по умолчанию)
+GRAINS = {
+    "D": ("День", "D", 56, 14),
+    "W": ("Неделя", "W-MON", 12, 2),
+    "M": ("Месяц", "MS", 6, 1),
+}
+
+DAILY_REQUIRED = ["Date", "Product", "Total"]
+
+
+def grain_label(grain: str) -> str:
+    return GRAINS[grain][0]
+
+
+def is_daily(df: pd.DataFrame) -> bool:
+    """Дневная выгрузка: есть столбец Date и нет пары Year/Week."""
+    return "Date" in df.columns and not {"Year", "Week"}.issubset(df.columns)
+
+
+def compact_daily(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Компактное представление дневных данных: дата без времени, продукт — category,
+    числовые столбцы — float32 (в 2 раза меньше памяти, чем float64).
+    """
+    df = df.copy()
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce").dt.normalize()
+    df = df.dropna(subset=["Date"])
+    df["Product"] = df["Product"].astype(str).str.strip().astype("category")
+    value_cols = [col for col in df.columns if col not in ("Date", "Product")]
+    for col in value_cols:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float32)
+    return df.reset_index(drop=True)
+
+
+def _daily_path(version: str) -> str:
+    return os.path.join(DAILY_DIR, f"{version}.parquet")
+
+
+def save_daily(df: pd.DataFrame, version: str):
+    """Колоночное хранение дневных данных (Parquet, zstd); строки отсортированы по продукту и дате."""
+    os.makedirs(DAILY_DIR, exist_ok=True)
+    path = _daily_path(version)
+    if os.path.exists(path):
+        return
+    tmp_path = f"{path}.tmp"
+    df.sort_values(["Product", "Date"]).to_parquet(tmp_path, index=False, compression="zstd",
+                                                   row_group_size=100_000)
+    os.replace(tmp_path, path)
+
+
+@functools.lru_cache(maxsize=16)
+def daily_columns(version: str) -> tuple[str, ...]:
+    """Столбцы дневной выгрузки (из схемы Parquet, без чтения данных; файл версии не меняется)."""
+    return tuple(pq.read_schema(_daily_path(version)).names)
+
+
+def has_daily(version: str | None, column: str | None = None) -> bool:
+    """Загружены ли дневные данные; при указании column — есть ли в них этот ресторан (или Total)."""
+    if not version or not os.path.exists(_daily_path(version)):
+        return False
+    return column is None or column in daily_columns(version)
+
+
+def load_daily(version: str, columns: list[str] | None = None, product: str | None = None) -> pd.DataFrame:
+    """
+    Чтение дневных данных: только нужные столбцы и (при указании) строки одного продукта —
+    фильтр применяется к группам строк Parquet, вся таблица в память не загружается.
+    """
+    filters = [("Product", "=", product)] if product is not None else None
+    return pd.read_parquet(_daily_path(version), columns=columns, filters=filters)
+
+
+def period_start(dates: pd.Series, grain: str) -> pd.Series:
+    """Начало периода для каждой даты: сама дата, понедельник недели или первое число месяца."""
+    dates = pd.to_datetime(dates).dt.normalize()
+    if grain == "D":
+        return dates
+    if grain == "W":
+        return dates - pd.to_timedelta(dates.dt.dayofweek, unit="D")
+    if grain == "M":
+        return dates.dt.to_period("M").dt.start_time
+    raise ValueError(f"Неизвестный шаг времени: {grain}")
+
+
+def resample(df: pd.DataFrame, grain: str, date_col: str = "Date") -> pd.DataFrame:
+    """Суммы числовых столбцов по (период, Product) одной группировкой."""
+    value_cols = [col for col in df.select_dtypes("number").columns if col != date_col]
+    keys = [period_start(df[date_col], grain).rename(date_col)]
+    if "Product" in df.columns:
+        keys.append(df["Product"])
+    return df[value_cols].groupby(keys, observed=True, sort=True).sum().reset_index()
+
+
+def resample_series(series: pd.DataFrame, grain: str) -> pd.DataFrame:
+    """Ряд (ds, y) -> тот же ряд с другим шагом."""
+    return resample(series, grain, date_col="ds")
+
+
+def to_weekly(daily: pd.DataFrame) -> pd.DataFrame:
+    """
+    Дневные данные -> недельная таблица в формате остального конвейера:
+    Year/Week — ISO-неделя, Month — месяц четверга этой недели (правило ISO).
+    """
+    weekly = resample(daily.drop(columns=["Year", "Week", "Month"], errors="ignore"), "W")
+    value_cols = weekly.columns.drop(["Date", "Product"])
+    weekly[value_cols] = weekly[value_cols].astype(np.float64)
+    iso = weekly["Date"].dt.isocalendar()
+    weekly.insert(0, "Year", iso["year"].astype(np.int64))
+    weekly.insert(1, "Week", iso["week"].astype(np.int64))
+    weekly.insert(2, "Month", (weekly["Date"] + pd.Timedelta(days=3)).dt.month)
+    weekly["Product"] = weekly["Product"].astype(str)
+    return weekly.drop(columns=["Date"])
+
+
+def daily_series(version: str, product: str, restaurant: str | None = None) -> pd.DataFrame:
+    """Дневной ряд продукта (ds, y) по ресторану или по Total — читается один столбец."""
+    column = restaurant or "Total"
+    df = load_daily(version, ["Date", "Product", column], product=product)
+    series = df.groupby("Date", sort=True)[column].sum()
+    return pd.DataFrame({"ds": series.index, "y": series.to_numpy(np.float64)})
@@ -0,0 +1,65 @@
+import pandas as pd
+import numpy as np
+from registry import get_registry
+
+# Квантили пакетного прогноза: P10/P90 — границы 80%-го интервала Prophet, P50 — yhat
+QUANTILES = ["P10", "P50", "P90"]
+INTERVAL_WIDTH = 0.8
+
+# Квантиль стандартного нормального распределения уровня 0.9
+Z_90 = 1.2815515594600038
+
+
+def sigma_from_interval(p10: np.ndarray, p90: np.ndarray) -> np.ndarray:
+    """Стандартное отклонение ряда по ширине интервала P10–P90 (нормальное приближение)."""
+    return np.maximum(p90 - p10, 0) / (2 * Z_90)
+
+
+def _from_moments(center: np.ndarray, variance: np.ndarray) -> np.ndarray:
+    sd = np.sqrt(variance)
+    return np.stack([np.maximum(center - Z_90 * sd, 0), center, center + Z_90 * sd], axis=-1).astype(np.float32)
+
+
+def sum_intervals(tensor: np.ndarray, axis: int, correlated: bool = False) -> np.ndarray:
+    """
+    Сумма квантильного прогноза по оси (последняя ось — P10/P50/P90). Медианы складываются.
+    correlated=False — разные ряды (рестораны, города): дисперсии складываются в предположении независимости,
+    поэтому интервал суммы уже, чем сумма интервалов.
+    correlated=True — недели горизонта одного ряда: неопределённость тренда Prophet у них общая,
+    поэтому σ складываются как у полностью коррелированных величин (интервал суммы — сумма интервалов).
+    """
+    tensor = np.asarray(tensor, dtype=np.float64)
+    # Номер оси задан для массива с осью квантилей; после выбора квантиля отрицательные номера сдвигаются
+    axis = axis % tensor.ndim
+    sigma = sigma_from_interval(tensor[..., 0], tensor[..., 2])
+    variance = sigma.sum(axis=axis) ** 2 if correlated else (sigma ** 2).sum(axis=axis)
+    return _from_moments(tensor[..., 1].sum(axis=axis), variance)
+
+
+def group_intervals(tensor: np.ndarray, onehot: np.ndarray) -> np.ndarray:
+    """Группировка по предпоследней оси (например, рестораны -> города) умножением на матрицу принадлежности."""
+    tensor = np.asarray(tensor, dtype=np.float64)
+    variance = sigma_from_interval(tensor[..., 0], tensor[..., 2]) ** 2
+    return _from_moments(tensor[..., 1] @ onehot, variance @ onehot)
+
+
+def city_intervals(tensor: np.ndarray, restaurants: list[str]) -> tuple[np.ndarray, list[str]]:
+    """Прогноз (… × ресторан × квантиль) -> (… × город × квантиль) и список городов."""
+    layout = get_registry().layout_for(restaurants)
+    return group_intervals(np.take(tensor, layout.positions, axis=-2), layout.city_onehot), layout.cities
+
+
+def network_intervals(tensor: np.ndarray) -> np.ndarray:
+    """Прогноз (… × ресторан × квантиль) -> (… × квантиль) по всей сети."""
+    return sum_intervals(tensor, axis=-2)
+
+
+def interval_table(tensor: np.ndarray, products: list[str], groups: list[str], group_name: str) -> pd.DataFrame:
+    """Массив продукт × группа × квантиль -> таблица (группа, Продукт, P10, P50, P90)."""
+    n_products, n_groups = tensor.shape[:2]
+    table = pd.DataFrame({
+        group_name: np.tile(groups, n_products),
+        "Продукт": np.repeat(products, n_groups),
+    })
+    table[QUANTILES] = tensor.reshape(-1, len(QUANTILES)).round().astype(int)
+    return table.sort_values([group_name, "Продукт"], ignore_index=True)
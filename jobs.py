@@ -0,0 +1,242 @@
+import streamlit as st
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Prophet обучается во внешнем процессе CmdStan, поэтому потоков достаточно
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+# Сколько завершённых задач держать в памяти (результаты при этом остаются на диске)
+MAX_FINISHED = 32
+
+# Каталог, в котором сохраняются результаты задач (по идентификатору задачи)
+JOBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_results")
+
+# Сколько результатов держать на диске: сверх этого удаляются те, что дольше всех не читали
+MAX_RESULTS = 256
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+STATUS_LABELS = {
+    QUEUED: "в очереди",
+    RUNNING: "выполняется",
+    DONE: "готово",
+    FAILED: "ошибка",
+    CANCELLED: "отменено",
+}
+
+
+class JobCancelled(Exception):
+    """Задача остановлена по запросу пользователя."""
+
+
+class Job:
+    """
+    Фоновая задача: статус, прогресс (сделано / всего), отмена и результат на диске.
+    Функция задачи получает объект Job первым аргументом и сообщает о прогрессе
+    через set_total() / advance(); advance() прерывает работу, если задачу отменили.
+    """
+
+    def __init__(self, job_id: str, title: str = ""):
+        self.id = job_id
+        self.title = title
+        self.status = QUEUED
+        self.total = 0
+        self.done = 0
+        self.message = ""
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._cancel = threading.Event()
+        self._result = None
+        self._sessions: set[str] = set()
+
+    # --- API для функции задачи ---
+    def set_total(self, total: int):
+        self.total = int(total)
+
+    def advance(self, message: str = "", step: int = 1):
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.done += step
+        self.message = message
+
+    # --- API для страниц ---
+    @property
+    def progress(self) -> float:
+        if self.status == DONE:
+            return 1.0
+        return min(1.0, self.done / self.total) if self.total else 0.0
+
+    @property
+    def finished_ok(self) -> bool:
+        return self.status == DONE
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def attach(self, session: str | None):
+        """Подключает сессию к задаче (одинаковый запрос из нескольких сессий — одна задача)."""
+        if session:
+            self._sessions.add(session)
+
+    def cancel(self, session: str | None = None) -> bool:
+        """
+        Отмена по запросу сессии: она отключается от задачи, а сама задача останавливается,
+        только если к ней не подключена ни одна другая сессия. Возвращает True, если задача отменена.
+        """
+        self._sessions.discard(session)
+        if self._sessions:
+            return False
+        self._cancel.set()
+        if self.status == QUEUED:
+            self.status = CANCELLED
+        return True
+
+    def result(self):
+        """Результат завершённой задачи (из памяти или с диска)."""
+        if self._result is None and self.status == DONE:
+            self._result = load_result(self.id)
+        return self._result
+
+
+def job_id_for(key: str) -> str:
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _result_path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.pkl")
+
+
+def save_result(job: Job, result):
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = _result_path(job.id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    with open(os.path.join(JOBS_DIR, f"{job.id}.json"), "w", encoding="utf-8") as f:
+        json.dump({"id": job.id, "title": job.title, "created": job.created, "finished": job.finished},
+                  f, ensure_ascii=False)
+    prune_results()
+
+
+def load_result(job_id: str):
+    path = _result_path(job_id)
+    try:
+        with open(path, "rb") as f:
+            result = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    os.utime(path)
+    return result
+
+
+def prune_results(max_results: int = MAX_RESULTS):
+    """Удаляет с диска самые давно читавшиеся результаты задач сверх max_results (вместе с описанием .json)."""
+    try:
+        entries = [e for e in os.scandir(JOBS_DIR) if e.name.endswith(".pkl")]
+    except FileNotFoundError:
+        return
+    if len(entries) <= max_results:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:len(entries) - max_results]:
+        for path in (entry.path, f"{entry.path[:-4]}.json"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class JobQueue:
+    """
+    Общая очередь вычислений с дедупликацией.
+    Задача идентифицируется ключом (например, версия данных + параметры прогноза):
+    одинаковый запрос из другой сессии подключается к уже запущенной задаче
+    (и отменить её может только последняя подключённая сессия),
+    а готовый результат берётся с диска — в том числе после перезапуска процесса.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, max_finished: int = MAX_FINISHED):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self.max_finished = max_finished
+
+    def submit(self, key: str, fn, *args, title: str = "", session: str | None = None, **kwargs) -> Job:
+        job_id = job_id_for(key)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            # Упавшую или отменённую задачу не переиспользуем — повторный запрос запускает её заново
+            if job is None or job.status in (FAILED, CANCELLED):
+                job = Job(job_id, title)
+                self._jobs[job_id] = job
+                if os.path.exists(_result_path(job_id)):
+                    job.status = DONE
+                    job.finished = os.path.getmtime(_result_path(job_id))
+                else:
+                    self._executor.submit(self._run, job, fn, args, kwargs)
+            job.attach(session)
+            self._jobs.move_to_end(job_id)
+            self._trim()
+            return job
+
+    def get(self, job_id: str | None) -> Job | None:
+        if not job_id:
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and os.path.exists(_result_path(job_id)):
+            job = Job(job_id)
+            job.status = DONE
+        return job
+
+    def _run(self, job: Job, fn, args, kwargs):
+        if job._cancel.is_set():
+            job.status = CANCELLED
+            return
+        job.status = RUNNING
+        try:
+            result = fn(job, *args, **kwargs)
+            job.finished = time.time()
+            save_result(job, result)
+            job._result = result
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished = job.finished or time.time()
+
+    def _trim(self):
+        finished = [k for k, j in self._jobs.items() if not j.active]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    """Одна очередь вычислений на процесс."""
+    return JobQueue()
+
+
+def job_status(job: Job):
+    """Прогресс-бар и статус задачи."""
+    label = STATUS_LABELS[job.status]
+    text = f"{job.title}: {label}"
+    if job.total:
+        text += f" ({job.done}/{job.total})"
+    if job.message and job.active:
+        text += f" — {job.message}"
+    st.progress(job.progress, text=text)
+    if job.status == FAILED:
+        st.error(f"Задача завершилась с ошибкой: {job.error}")
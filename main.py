@@ -1,21 +1,138 @@
 import streamlit as st
-import pandas as pd
+import importlib
+import os
+import threading
+import time
+from data_service import session_dataset
+
+# Момент запуска скрипта (Streamlit перезапускает его при каждом взаимодействии)
+_SCRIPT_START = time.perf_counter()
+
+# Страницы приложения: пункт меню -> (заголовок, модуль, функция).
+# Модули (а вместе с ними Prophet, openai, plotly) импортируются только
+# при первом открытии соответствующей страницы.
+PAGES = {
+    "Загрузка данных": ("Шаг 1: Загрузка Excel-файлов", None, None),
+    "Прогнозирование спроса": ("Шаг 2: Прогнозирование спроса", "forecasting", "build_forecast"),
+    "Расчёт порционности": ("Расчёт порционности и оптимизация закупок", "portion_calc", "calculate_portions"),
+    "Сценарное моделирование (Что если?)": ("Модуль, Что если?", "scenario_planning", "scenario_planning"),
+    "Анализ динамики ресторанов": ("Анализ динамики ресторанов", "analysis_restaurants", "analyze_restaurants"),
+    "Анализ сезонных трендов заказов продуктов по классификациям": (
+        "Анализ заказанных продуктов", "behavior_analysis", "analyze_seasonal_trends"
+    ),
+    "Генерация отчётов": ("Формирование отчётов", "reports", "generate_reports"),
+    "Спросите ИИ": ("Чат-бот на естественном языке", "openai_integration", "openai_chat"),
+    "Мониторинг точности прогнозов": ("Прогноз против факта", "monitoring", "show_monitoring"),
+}
+
+# Переменная окружения для прогрева модуля прогнозирования при старте процесса
+PREWARM_ENV = "FORECASTGGW_PREWARM"
+
+
+@st.cache_resource
+def startup_report() -> dict:
+    """Общий для процесса журнал времени запуска: первый рендер и импорт каждого модуля (сек.)."""
+    return {"first_render": None, "imports": {}, "prewarm": None}
+
+
+def import_page(module_name: str):
+    """Импорт модуля страницы с замером времени (повторный импорт берётся из sys.modules)."""
+    report = startup_report()
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if module_name not in report["imports"]:
+        report["imports"][module_name] = time.perf_counter() - start
+    return module
+
+
+def _prewarm_forecasting():
+    """Фоновый прогрев: импорт Prophet и загрузка Stan-модели до открытия страницы прогноза."""
+    report = startup_report()
+    start = time.perf_counter()
+    forecasting = import_page("forecasting")
+    forecasting.Prophet()
+    report["prewarm"] = time.perf_counter() - start
+
+
+@st.cache_resource
+def start_prewarm() -> threading.Thread:
+    """Запускает прогрев один раз на процесс."""
+    thread = threading.Thread(target=_prewarm_forecasting, name="prewarm-forecasting", daemon=True)
+    thread.start()
+    return thread
+
+
+def show_startup_report():
+    report = startup_report()
+    with st.sidebar.expander("Время запуска"):
+        if report["first_render"] is not None:
+            st.write(f"Первый рендер: {report['first_render']:.2f} с")
+        for module_name, seconds in report["imports"].items():
+            st.write(f"Импорт {module_name}: {seconds:.2f} с")
+        if report["prewarm"] is not None:
+            st.write(f"Прогрев прогнозирования: {report['prewarm']:.2f} с")
+
+        if st.checkbox("Прогреть модуль прогнозирования (Prophet) в фоне", key="prewarm_forecasting"):
+            start_prewarm()
+
+
+def load_data_page():
+    from data_loader import load_excel_files
+    from data_preprocessing import preprocess_data
+    from anomalies import POLICIES, cached_anomalies, show_anomalies
+    from validation import reconcile_totals
+    from registry import get_registry, manage_restaurants
+    from catalog import manage_products, update_case_sizes
+    from data_service import set_session_dataset
+    from api_store import publish_dataset
+    from monitoring import evaluate_new_actuals
+    from snapshot import show_snapshots
+    from versioning import attach_version, current_version, derived_version
+
+    with st.expander("Справочник ресторанов"):
+        manage_restaurants()
+    with st.expander("Каталог продуктов"):
+        manage_products()
+    with st.expander("Снимок сессии"):
+        show_snapshots()
+    df = load_excel_files()
+    if df is not None:
+        st.write("Пример загруженных данных (первые строки):")
+        st.dataframe(df.head())
+
+        if st.checkbox("Пересчитать Total как сумму ресторанов в строках с расхождением", key="reconcile_totals"):
+            df = attach_version(reconcile_totals(df), derived_version(current_version(df), "reconciled"))
+
+        with st.expander("Аномалии в недельных продажах"):
+            show_anomalies(cached_anomalies(df, current_version(df), get_registry().fingerprint))
+        policy = st.selectbox("Очистка аномалий", list(POLICIES), format_func=POLICIES.get, key="anomaly_policy")
+
+        st.write("Далее запустим предобработку данных...")
+        # Очищенные данные — отдельная версия: кэши исходного набора к ним неприменимы
+        # (аномалии ищутся по ресторанам справочника, поэтому в версию входит и его fingerprint)
+        version = current_version(df) if policy == "none" else derived_version(current_version(df), "clean", policy,
+                                                                               get_registry().fingerprint)
+        df_clean = attach_version(preprocess_data(df, policy), version)
+        st.write("После предобработки (первые строки):")
+        st.dataframe(df_clean.head())
+
+        # Вес коробки из загруженных данных переносим в каталог продуктов
+        update_case_sizes(df)
+
+        # Публикуем данные в общем сервисе процесса; в session_state хранится только версия
+        df_clean = set_session_dataset(df_clean)
+
+        # Версия публикуется для HTTP API (api_server.py): последняя загруженная отдаётся по умолчанию
+        publish_dataset(df_clean)
+
+        # Архивные прогнозы сверяются с фактом новых недель; флаги дрейфа обновляются
+        matched = evaluate_new_actuals(df_clean)
+        if matched:
+            st.write(f"Сверено с фактом точек архивных прогнозов: {matched}")
+
+        # Заранее собираем пакет отчётов в фоне, чтобы скачивание не ждало Excel
+        import_page("reports").schedule_report_pack(df_clean)
 
-# Импортируем наши внутренние модули (которые будут реализованы далее)
-from data_loader import load_excel_files
-from data_preprocessing import preprocess_data
-from forecasting import build_forecast
-from portion_calc import calculate_portions
-from scenario_planning import scenario_planning
-from analysis_restaurants import analyze_restaurants
-from behavior_analysis import analyze_seasonal_trends
-from openai_integration import openai_chat
-from reports import generate_reports
-
-
-# Визуализация может использоваться в других файлах,
-# поэтому здесь обычно достаточно импортировать plotly или matplotlib при необходимости
-# но если нужна своя функция, то import visualization
 
 def main():
     """Основная функция приложения Streamlit."""
@@ -24,92 +141,31 @@ def main():
 
     st.title("ForecastGGW – Аналитика и прогнозирование для ресторанной сети")
 
-    # Боковая панель навигации
-    option = st.sidebar.selectbox(
-        "Меню приложения",
-        (
-            "Загрузка данных",
-            "Прогнозирование спроса",
-            "Расчёт порционности",
-            "Сценарное моделирование (Что если?)",
-            "Анализ динамики ресторанов",
-            "Анализ сезонных трендов заказов продуктов по классификациям",
-            "Генерация отчётов",
-            "Спросите ИИ"
-        )
-    )
-
-    # Если пользователь не загрузил/не предобработал данные,
-    # мы храним их в st.session_state["df_clean"] после обработки
-    # Поэтому проверяем, доступен ли уже DataFrame
-    if option == "Загрузка данных":
-        st.header("Шаг 1: Загрузка Excel-файлов")
-        df = load_excel_files()
-        if df is not None:
-            st.write("Пример загруженных данных (первые строки):")
-            st.dataframe(df.head())
-
-            st.write("Далее запустим предобработку данных...")
-            df_clean = preprocess_data(df)
-            st.write("После предобработки (первые строки):")
-            st.dataframe(df_clean.head())
-
-            # Сохраняем результат в session_state
-            st.session_state["df_clean"] = df_clean
+    if os.getenv(PREWARM_ENV) == "1":
+        start_prewarm()
 
+    # Боковая панель навигации
+    option = st.sidebar.selectbox("Меню приложения", tuple(PAGES))
+    header, module_name, func_name = PAGES[option]
+    st.header(header)
+
+    # Очищенные данные хранятся в общем сервисе процесса (одна копия на версию),
+    # а в st.session_state — только версия. Поэтому проверяем, доступен ли уже DataFrame
+    df_clean = None if module_name is None else session_dataset()
+    if module_name is None:
+        load_data_page()
+    elif df_clean is not None:
+        page = getattr(import_page(module_name), func_name)
+        page(df_clean)
     elif option == "Прогнозирование спроса":
-        st.header("Шаг 2: Прогнозирование спроса")
-        if "df_clean" in st.session_state:
-            build_forecast(st.session_state["df_clean"])
-        else:
-            st.warning("Пожалуйста, сначала загрузите и предобработайте данные (раздел 'Загрузка данных').")
-
-    elif option == "Расчёт порционности":
-        st.header("Расчёт порционности и оптимизация закупок")
-        if "df_clean" in st.session_state:
-            calculate_portions(st.session_state["df_clean"])
-        else:
-            st.warning("Сначала загрузите и предобработайте данные.")
-
-    elif option == "Сценарное моделирование (Что если?)":
-        st.header("Модуль, Что если?")
-        if "df_clean" in st.session_state:
-            scenario_planning(st.session_state["df_clean"])
-        else:
-            st.warning("Сначала загрузите и предобработайте данные.")
-
-    elif option == "Анализ динамики ресторанов":
-        st.header("Анализ динамики ресторанов")
-        if "df_clean" in st.session_state:
-            analyze_restaurants(st.session_state["df_clean"])
-        else:
-            st.warning("Сначала загрузите и предобработайте данные.")
-
-    elif option == "Анализ сезонных трендов заказов продуктов по классификациям":
-
-        st.header("Анализ заказанных продуктов")
-
-        if "df_clean" in st.session_state:
-
-            analyze_seasonal_trends(st.session_state["df_clean"])  # Убедитесь, что имя функции правильное
-
-        else:
-
-            st.warning("Сначала загрузите и предобработайте данные.")
-
-    elif option == "Генерация отчётов":
-        st.header("Формирование отчётов")
-        if "df_clean" in st.session_state:
-            generate_reports(st.session_state["df_clean"])
-        else:
-            st.warning("Сначала загрузите и предобработайте данные.")
-
-    elif option == "Спросите ИИ":
-        st.header("Чат-бот на естественном языке")
-        if "df_clean" in st.session_state:
-            openai_chat(st.session_state["df_clean"])
-        else:
-            st.warning("Сначала загрузите и предобработайте данные.")
+        st.warning("Пожалуйста, сначала загрузите и предобработайте данные (раздел 'Загрузка данных').")
+    else:
+        st.warning("Сначала загрузите и предобработайте данные.")
+
+    report = startup_report()
+    if report["first_render"] is None:
+        report["first_render"] = time.perf_counter() - _SCRIPT_START
+    show_startup_report()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,384 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import datetime
+import json
+from api_store import publish_forecast
+from array_store import FORECAST, HISTORY, HISTORY_ROWS, forecast_view, get_array_store, history_views
+from charts import frame_key, line_figure, show_figure
+from database import get_connection
+from intervals import INTERVAL_WIDTH
+from registry import get_registry
+from versioning import current_version
+
+# Архив выданных пакетных прогнозов (значения — в хранилище массивов по run_key),
+# сверка с фактом по каждой прогнозной неделе и ряды с дрейфом ошибки
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecast_archive (
+    run_key       TEXT PRIMARY KEY,
+    data_version  TEXT NOT NULL,
+    preset        TEXT NOT NULL,
+    upgraded      TEXT NOT NULL DEFAULT '[]',
+    origin        TEXT NOT NULL,
+    horizon       INTEGER NOT NULL,
+    issued_at     TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS forecast_errors (
+    run_key     TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    product     TEXT NOT NULL,
+    restaurant  TEXT NOT NULL,
+    model       TEXT NOT NULL,
+    p10         REAL NOT NULL,
+    p50         REAL NOT NULL,
+    p90         REAL NOT NULL,
+    actual      REAL NOT NULL,
+    PRIMARY KEY (run_key, date, product, restaurant)
+);
+CREATE TABLE IF NOT EXISTS series_drift (
+    product      TEXT NOT NULL,
+    restaurant   TEXT NOT NULL,
+    wape_recent  REAL,
+    wape_base    REAL,
+    coverage     REAL,
+    bias         REAL,
+    reason       TEXT NOT NULL,
+    flagged_at   TEXT NOT NULL,
+    PRIMARY KEY (product, restaurant)
+);
+"""
+
+# Профиль Prophet, которым пакетный прогноз считает ряды с дрейфом ошибки
+DRIFT_PRESET = "accurate"
+
+# Окно скользящих метрик (недель с фактом)
+ROLLING_WEEKS = 8
+
+# Дрейф: последние RECENT_WEEKS недель сравниваются с предыдущими BASE_WEEKS
+RECENT_WEEKS = 4
+BASE_WEEKS = 12
+MIN_RECENT_POINTS = 4      # минимум сверенных точек ряда в последнем окне
+DRIFT_RATIO = 2.0          # WAPE вырос вдвое относительно базы
+MIN_DRIFT_WAPE = 0.25      # ... и превышает 25% (малые ошибки не считаются дрейфом)
+MIN_COVERAGE = INTERVAL_WIDTH - 0.4  # факт попадает в P10–P90 заметно реже номинала
+MAX_BIAS = 0.3             # систематическое завышение/занижение больше 30%
+
+# Уровни агрегации метрик: название -> столбцы группировки
+LEVELS = {
+    "Ряд (продукт × ресторан)": ["product", "restaurant"],
+    "Город": ["city"],
+    "Модель": ["model"],
+    "Сеть": [],
+}
+
+
+def ensure_monitoring_tables(conn):
+    conn.executescript(SCHEMA)
+    conn.commit()
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def archive_forecast(run_key: str, version: str, preset: str, origin: str, horizon: int, upgraded=()):
+    """
+    Запоминает выданный недельный пакетный прогноз (его массив уже записан в хранилище под run_key
+    и закрепляется там, чтобы очистка хранилища не удалила его до сверки с фактом).
+    origin — последняя неделя истории; upgraded — ряды (продукт, ресторан), посчитанные профилем DRIFT_PRESET.
+    """
+    get_array_store().pin(run_key)
+    conn = get_connection()
+    try:
+        ensure_monitoring_tables(conn)
+        conn.execute(
+            "INSERT OR IGNORE INTO forecast_archive (run_key, data_version, preset, upgraded, origin, horizon, "
+            "issued_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (run_key, version, preset, json.dumps([list(pair) for pair in upgraded], ensure_ascii=False),
+             origin, int(horizon), _now())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def issue_forecast(forecast: pd.DataFrame, run_key: str, version: str, grain: str, horizon: int, preset: str,
+                   origin: str, upgraded=()):
+    """
+    Выдача пакетного прогноза — один раз, когда задача завершилась: массив записывается в хранилище,
+    прогноз публикуется для HTTP API, недельный — архивируется для сверки с фактом.
+    Не зависит от того, откроет ли кто-нибудь результат на странице прогноза.
+    """
+    forecast_view(forecast, run_key)
+    publish_forecast(run_key, version, grain, horizon)
+    if grain == "W":
+        archive_forecast(run_key, version, preset, origin, horizon, upgraded)
+
+
+def load_archive() -> pd.DataFrame:
+    conn = get_connection()
+    try:
+        ensure_monitoring_tables(conn)
+        return pd.read_sql_query("SELECT * FROM forecast_archive ORDER BY issued_at", conn)
+    finally:
+        conn.close()
+
+
+def _positions(labels: list, index: dict) -> np.ndarray:
+    return np.array([index.get(label, -1) for label in labels], dtype=np.int64)
+
+
+def match_actuals(archive: pd.DataFrame, views: dict) -> pd.DataFrame:
+    """
+    Сверка архива с фактом: для каждого прогноза — позиции его недель после origin, продуктов и ресторанов
+    в массиве истории; затем один общий проход выборкой по этим позициям для всех прогнозов сразу.
+    В сверку идут только недели, в которых продукт есть в данных.
+    """
+    history, rows = views[HISTORY], views[HISTORY_ROWS]
+    hist_dates = np.array(history.labels("date"))
+    if not len(hist_dates):
+        return pd.DataFrame()
+    products = {name: i for i, name in enumerate(history.labels("product"))}
+    restaurants = {name: i for i, name in enumerate(history.labels("restaurant"))}
+    store = get_array_store()
+
+    parts = []
+    for run in archive.itertuples(index=False):
+        view = store.open(run.run_key, FORECAST)
+        if view is None:
+            continue
+        dates = np.array(view.labels("date"))
+        pos = np.clip(np.searchsorted(hist_dates, dates), 0, len(hist_dates) - 1)
+        date_ok = (hist_dates[pos] == dates) & (dates > run.origin)
+        product_pos = _positions(view.labels("product"), products)
+        rest_pos = _positions(view.labels("restaurant"), restaurants)
+        di, pi, ri = np.nonzero(date_ok[:, None, None] & (product_pos >= 0)[None, :, None]
+                                & (rest_pos >= 0)[None, None, :])
+        if not len(di):
+            continue
+        upgraded = {tuple(pair) for pair in json.loads(run.upgraded)}
+        product_names = np.array(view.labels("product"), dtype=object)[pi]
+        rest_names = np.array(view.labels("restaurant"), dtype=object)[ri]
+        models = np.array([DRIFT_PRESET if (p, r) in upgraded else run.preset
+                           for p, r in zip(product_names, rest_names)], dtype=object)
+        parts.append(pd.DataFrame({
+            "run_key": run.run_key,
+            "date": dates[di],
+            "product": product_names,
+            "restaurant": rest_names,
+            "model": models,
+            "hd": pos[di], "hp": product_pos[pi], "hr": rest_pos[ri],
+            **dict(zip(["p10", "p50", "p90"], np.asarray(view.data[di, pi, ri], dtype=np.float64).T)),
+        }))
+    if not parts:
+        return pd.DataFrame()
+
+    matched = pd.concat(parts, ignore_index=True)
+    hd, hp, hr = (matched.pop(col).to_numpy() for col in ("hd", "hp", "hr"))
+    matched["actual"] = np.asarray(history.data[hd, hp, hr], dtype=np.float64)
+    return matched[np.asarray(rows.data[hd, hp]) > 0].reset_index(drop=True)
+
+
+def evaluate_forecasts(df: pd.DataFrame) -> int:
+    """
+    Сверяет все архивные прогнозы с фактом набора df (вызывается при загрузке новых данных),
+    сохраняет ошибки и обновляет флаги дрейфа. Возвращает число сверенных точек.
+    """
+    archive = load_archive()
+    if archive.empty:
+        return 0
+    matched = match_actuals(archive, history_views(df))
+    if matched.empty:
+        return 0
+    conn = get_connection()
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO forecast_errors (run_key, date, product, restaurant, model, p10, p50, p90, "
+            "actual) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            matched[["run_key", "date", "product", "restaurant", "model", "p10", "p50", "p90", "actual"]]
+            .itertuples(index=False, name=None)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    update_drift(load_errors())
+    return len(matched)
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _evaluate_once(_df: pd.DataFrame, version: str, archived: int) -> int:
+    return evaluate_forecasts(_df)
+
+
+def evaluate_new_actuals(df: pd.DataFrame) -> int:
+    """Сверка при загрузке: один раз на (версию данных, размер архива), а не на каждый перезапуск страницы."""
+    return _evaluate_once(df, current_version(df), len(load_archive()))
+
+
+def load_errors() -> pd.DataFrame:
+    """Сверенные точки с городом ресторана и составляющими метрик."""
+    conn = get_connection()
+    try:
+        ensure_monitoring_tables(conn)
+        errors = pd.read_sql_query("SELECT * FROM forecast_errors", conn)
+    finally:
+        conn.close()
+    errors["city"] = errors["restaurant"].map(get_registry().city_of).fillna("—")
+    errors["abs_error"] = (errors["actual"] - errors["p50"]).abs()
+    errors["error"] = errors["p50"] - errors["actual"]
+    errors["covered"] = ((errors["actual"] >= errors["p10"]) & (errors["actual"] <= errors["p90"])).astype(float)
+    return errors
+
+
+def _metrics(sums: pd.DataFrame) -> pd.DataFrame:
+    """WAPE = Σ|факт − P50| / Σ факт, смещение = Σ(P50 − факт) / Σ факт, покрытие — доля факта в P10–P90."""
+    actual = sums["actual"].where(sums["actual"] > 0)
+    return pd.DataFrame({
+        "wape": sums["abs_error"] / actual,
+        "bias": sums["error"] / actual,
+        "coverage": sums["covered"] / sums["points"],
+        "points": sums["points"],
+    }, index=sums.index)
+
+
+def rolling_metrics(errors: pd.DataFrame, keys: list[str], window: int = ROLLING_WEEKS) -> pd.DataFrame:
+    """Скользящие метрики по группам keys: на каждую неделю — по последним window неделям с фактом."""
+    weekly = (errors.assign(points=1.0)
+              .groupby(keys + ["date"])[["abs_error", "error", "actual", "covered", "points"]].sum())
+    # Скользящая сумма без цикла по группам: накопленная сумма минус она же window недель назад
+    if keys:
+        cumulative = weekly.groupby(level=keys).cumsum()
+        rolled = cumulative - cumulative.groupby(level=keys).shift(window).fillna(0)
+    else:
+        rolled = weekly.rolling(window, min_periods=1).sum()
+    return _metrics(rolled).reset_index()
+
+
+def latest_metrics(errors: pd.DataFrame, keys: list[str], window: int = ROLLING_WEEKS) -> pd.DataFrame:
+    """Скользящие метрики на последнюю неделю с фактом каждой группы."""
+    rolled = rolling_metrics(errors, keys, window)
+    return rolled.groupby(keys).tail(1) if keys else rolled.tail(1)
+
+
+def drift_flags(errors: pd.DataFrame) -> pd.DataFrame:
+    """
+    Ряды с дрейфом: в последних RECENT_WEEKS неделях WAPE вырос в DRIFT_RATIO раз относительно
+    предыдущих BASE_WEEKS недель (и превысил MIN_DRIFT_WAPE), факт редко попадает в интервал
+    или прогноз систематически смещён.
+    """
+    dates = np.sort(errors["date"].unique())
+    recent, base = dates[-RECENT_WEEKS:], dates[-RECENT_WEEKS - BASE_WEEKS:-RECENT_WEEKS]
+    keys = ["product", "restaurant"]
+    window = np.where(errors["date"].isin(recent), "recent", np.where(errors["date"].isin(base), "base", ""))
+    sums = (errors.assign(points=1.0, window=window)[window != ""]
+            .groupby(keys + ["window"])[["abs_error", "error", "actual", "covered", "points"]].sum())
+    metrics = _metrics(sums).unstack("window")
+    if "recent" not in metrics.columns.get_level_values("window"):
+        return pd.DataFrame(columns=keys + ["wape_recent", "wape_base", "coverage", "bias", "reason"])
+    recent_m = metrics.xs("recent", axis=1, level="window")
+    base_wape = (metrics.xs("base", axis=1, level="window")["wape"]
+                 if "base" in metrics.columns.get_level_values("window") else pd.Series(np.nan, index=metrics.index))
+    enough = recent_m["points"] >= MIN_RECENT_POINTS
+    rules = {
+        "рост ошибки": enough & (recent_m["wape"] > MIN_DRIFT_WAPE) & (recent_m["wape"] > DRIFT_RATIO * base_wape),
+        "факт вне интервала": enough & (recent_m["coverage"] < MIN_COVERAGE),
+        "смещение": enough & (recent_m["bias"].abs() > MAX_BIAS),
+    }
+    flags = pd.DataFrame(rules)
+    reason = flags.apply(lambda row: ", ".join(name for name, hit in row.items() if hit), axis=1)
+    table = pd.DataFrame({
+        "wape_recent": recent_m["wape"], "wape_base": base_wape,
+        "coverage": recent_m["coverage"], "bias": recent_m["bias"], "reason": reason,
+    })
+    return table[flags.any(axis=1)].reset_index()
+
+
+def update_drift(errors: pd.DataFrame):
+    flags = drift_flags(errors) if not errors.empty else pd.DataFrame()
+    conn = get_connection()
+    try:
+        ensure_monitoring_tables(conn)
+        conn.execute("DELETE FROM series_drift")
+        if not flags.empty:
+            flags = flags.astype({col: object for col in ("wape_recent", "wape_base", "coverage", "bias")})
+            flags = flags.where(flags.notna(), None)
+            conn.executemany(
+                "INSERT INTO series_drift (product, restaurant, wape_recent, wape_base, coverage, bias, reason, "
+                "flagged_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(*row, _now()) for row in flags[["product", "restaurant", "wape_recent", "wape_base", "coverage",
+                                                  "bias", "reason"]].itertuples(index=False, name=None)]
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_drift() -> pd.DataFrame:
+    conn = get_connection()
+    try:
+        ensure_monitoring_tables(conn)
+        return pd.read_sql_query("SELECT * FROM series_drift ORDER BY wape_recent DESC", conn)
+    finally:
+        conn.close()
+
+
+def drifted_series() -> list[tuple[str, str]]:
+    """Ряды (продукт, ресторан) с дрейфом — пакетный прогноз может посчитать их профилем DRIFT_PRESET."""
+    drift = load_drift()
+    return sorted(zip(drift["product"], drift["restaurant"]))
+
+
+def _percent_table(metrics: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    table = metrics[keys + ["date", "wape", "bias", "coverage", "points"]].copy()
+    for col in ("wape", "bias", "coverage"):
+        table[col] = (table[col] * 100).round(1)
+    return table.rename(columns={
+        "product": "Продукт", "restaurant": "Ресторан", "city": "Город", "model": "Модель", "date": "Неделя",
+        "wape": "WAPE, %", "bias": "Смещение, %", "coverage": "Покрытие P10–P90, %", "points": "Точек",
+    })
+
+
+def show_monitoring(df: pd.DataFrame):
+    """Страница мониторинга: сверка архива прогнозов с фактом, скользящие метрики и ряды с дрейфом."""
+    # Подписи профилей — из модуля Prophet, он нужен только на этой странице
+    from prophet_config import PRESETS, preset_label
+
+    archive = load_archive()
+    st.write(f"В архиве прогнозов: {len(archive)}. Сверка выполняется при каждой загрузке данных.")
+    if st.button("Сверить с фактом текущих данных"):
+        st.success(f"Сверено точек: {evaluate_forecasts(df)}")
+
+    errors = load_errors()
+    if errors.empty:
+        st.info("Сверенных прогнозов пока нет: нужен недельный пакетный прогноз и данные с фактом за его недели.")
+        return
+    errors["model"] = errors["model"].map(lambda p: preset_label(p) if p in PRESETS else p)
+
+    st.subheader(f"Скользящие метрики (окно {ROLLING_WEEKS} недель с фактом)")
+    level = st.selectbox("Уровень", list(LEVELS), index=2, key="monitoring_level")
+    keys = LEVELS[level]
+    latest = latest_metrics(errors, keys)
+    st.dataframe(_percent_table(latest, keys).sort_values("WAPE, %", ascending=False), hide_index=True)
+
+    # Динамика — по городам или моделям; для рядов и сети — общий WAPE сети
+    trend_keys = keys if len(keys) == 1 else []
+    trend = rolling_metrics(errors, trend_keys)
+    trend["WAPE, %"] = (trend["wape"] * 100).round(1)
+    trend["Неделя"] = pd.to_datetime(trend["date"])
+    show_figure("monitoring_trend", str(frame_key(trend)), lambda: line_figure(
+        trend, x="Неделя", y="WAPE, %", color=trend_keys[0] if trend_keys else None, title="Скользящий WAPE"
+    ))
+
+    st.subheader("Ряды с дрейфом ошибки")
+    drift = load_drift()
+    if drift.empty:
+        st.success("Дрейфа не обнаружено.")
+    else:
+        st.caption(f"В пакетном прогнозе эти ряды можно посчитать профилем «{preset_label(DRIFT_PRESET)}».")
+        for col in ("wape_recent", "wape_base", "coverage", "bias"):
+            drift[col] = (drift[col] * 100).round(1)
+        st.dataframe(drift.rename(columns={
+            "product": "Продукт", "restaurant": "Ресторан", "wape_recent": "WAPE сейчас, %",
+            "wape_base": "WAPE база, %", "coverage": "Покрытие, %", "bias": "Смещение, %",
+            "reason": "Причина", "flagged_at": "Отмечено",
+        }), hide_index=True)
@@ -3,8 +3,11 @@ import pandas as pd
 import openai
 from dotenv import load_dotenv
 import os
-from forecasting import build_forecast  # Импортируем функцию обработки данных из модуля "Прогнозирование спроса"
 import datetime
+from catalog import product_codes, get_catalog
+from query_cache import get_query_cache
+from registry import get_registry
+from versioning import current_version, derived_version
 
 # Загружаем переменные из .env
 load_dotenv()
@@ -23,6 +26,8 @@ def preprocess_data(df: pd.DataFrame) -> pd.DataFrame:
         df = df[df["Product"].notnull()]  # Убираем строки без продукта
 
         # Вызов функции build_forecast для дополнительной обработки данных
+        # (импорт внутри функции: модуль прогнозирования тянет Prophet, он нужен только здесь)
+        from forecasting import build_forecast
         forecasted_data = build_forecast(df)
         return forecasted_data
     except Exception as e:
@@ -30,6 +35,43 @@ def preprocess_data(df: pd.DataFrame) -> pd.DataFrame:
         return pd.DataFrame()
 
 
+@st.cache_data(show_spinner=False, max_entries=256)
+def ask_model(_df_text: str, question: str, key: str) -> str:
+    """
+    Ответ модели, закэшированный по (версия данных + фильтры, вопрос):
+    повторный вопрос к тем же данным не отправляется в API заново.
+    """
+    response = openai.ChatCompletion.create(
+        model="gpt-4o-mini",  # Используем указанную модель
+        messages=[
+            {"role": "system",
+             "content": "Ты - аналитик, помогай отвечать на вопросы по данным ресторана. Предоставляй "
+                        "аналитику и прогнозы на основе доступных данных."},
+            {"role": "user", "content": f"Вот данные ресторана: {_df_text}. Вопрос: {question}"},
+        ],
+        temperature=0.2,
+        max_tokens=1000  # Ограничение на количество токенов
+    )
+    return response.choices[0].message["content"]
+
+
+def tips_summary(df: pd.DataFrame, restaurant: str, filters: dict) -> tuple:
+    """
+    Подсказки (топ-продукт, сумма, среднее) по продуктам из набора assistant с фильтрами filters.
+    Суммы и число значений по продуктам берутся из кэша запросов.
+    """
+    cache = get_query_cache()
+    sums = cache.aggregate(df, ["Product"], [restaurant], filters, scope="assistant")
+    counts = cache.aggregate(df, ["Product"], [restaurant], filters, scope="assistant", agg="count")
+    # Самый популярный продукт из списка включенных товаров
+    top_product = sums.set_index("Product")[restaurant].idxmax()
+    # Общий объем продаж в выбранном ресторане по включенным продуктам
+    restaurant_sales = sums[restaurant].sum()
+    # Среднее количество заказов
+    average_orders = restaurant_sales / counts[restaurant].sum()
+    return top_product, restaurant_sales, average_orders
+
+
 def openai_chat(df: pd.DataFrame):
     """
     Чат-бот с использованием OpenAI API.
@@ -50,37 +92,12 @@ def openai_chat(df: pd.DataFrame):
 
     openai.api_key = openai_api_key
 
-    # --- Список ресторанов ---
-    restaurant_list = [
-        "Samara Cosmoport", "Samara Mega", "Nijniy Novgorod Mega", "Nijniy Novgorod 7 Nebo",
-        "Nijniy Novgorod Fantastika", "Nijniy Novgorod Nebo", "Kazan Mall", "Kazan Tandem",
-        "Kazan Mega", "Kazan Koltso", "Kazan Yujniy", "Kazan Park House", "Moscow Metropolis",
-        "Moscow Gagarinskiy", "Moscow Erevan Plaza", "Moscow Mega Tyopliy Stan", "Moscow Aviapark",
-        "Moscow Afimall", "Khimki Mega", "Moscow RIO", "Moscow Fillion", "Moscow Columbus",
-        "Moscow Kashirskoye Plaza", "Moscow Kaleydoscop", "Moscow Europolis", "Zelenograd Zelenopark",
-        "Moscow Vegas", "Moscow Vodniy", "Moscow Mozaika", "Moscow Gorod", "Moscow Kuzminki Mall",
-        "Moscow Mega Kotelniki", "Moscow Mega Kommunarka", "Moscow Salaris", "Nijnevartovsk GreenPark",
-        "Ufa Mega", "Chelny Kvartal", "Ekaterinburg Veer Mall", "Ekaterinburg Greenvich",
-        "Voronej Galereya Chijova", "Voronej Grad"
-    ]
-
-    # --- Список включенных товаров для подсказок ---
-    included_products = [
-        "П/Ф Говядина", "П/Ф Гагава", "П/Ф Курица в соусе", "П/Ф Лакомство от шефа", "П/Ф Цезарь", "П/Ф Чили",
-        "П/Ф Кекиклим", "П/Ф Курица на суп", "П/Ф Картофель Фри 2,5 кг", "П/Ф Луковые кольца 1 кг",
-        "Мозаика", "Пюре из баклажанов", "Соус Баффало", "Соус Песто", "Соус Сладкий перец",
-        "Соус Тайский сладкий чили",
-        "Торт манго-маракуйя", "Торт медовик", "Десерт фруктовый 'Сорбет' манго", "Мороженое 'Пломбир-ваниль'",
-        "Мороженое с клубникой", "Мороженое шоколаденое с кус.шоколада", "Соус Балканский",
-        "Makaroma Penne (Турция)", "Паста Bavette Barilla (Россия), 450г", "Паста Filini Barilla (Россия), 450г"
-    ]
-
     # --- Выбор года (опционально) ---
     available_years = sorted(df['Year'].unique())
     selected_year = st.selectbox("Выберите год (необязательно):", ["Все годы"] + available_years)
 
     # --- Выбор ресторана (обязательно) ---
-    available_restaurants = [col for col in restaurant_list if col in df.columns]
+    available_restaurants = get_registry().restaurant_columns(df, numeric_only=False)
     if not available_restaurants:
         st.error("В датафрейме не найдено ни одного столбца с данными о ресторанах.")
         return
@@ -91,16 +108,20 @@ def openai_chat(df: pd.DataFrame):
         return
 
     # --- Фильтрация данных ---
-    filtered_df = df.copy()
+    # Коды продуктов считаются один раз на версию данных; фильтры — булевы маски по ним
+    catalog = get_catalog()
+    codes = product_codes(df, current_version(df))
+    row_mask = catalog.mask_from_codes(codes, "assistant")
     if selected_year != "Все годы":
-        filtered_df = filtered_df[filtered_df['Year'] == selected_year]
+        row_mask &= (df['Year'] == selected_year).to_numpy()
+    filtered_df = df
 
     if selected_restaurant not in filtered_df.columns:
         st.error(f"Данные для ресторана {selected_restaurant} отсутствуют.")
         return
 
     # Убираем из анализа продукты, не входящие в включенный список
-    filtered_for_tips = filtered_df[filtered_df['Product'].isin(included_products)]
+    filtered_for_tips = filtered_df[row_mask]
 
     # --- Выбор продукта (опционально) ---
     available_products = filtered_for_tips['Product'].unique()
@@ -109,6 +130,9 @@ def openai_chat(df: pd.DataFrame):
     if selected_product != "Все продукты":
         filtered_for_tips = filtered_for_tips[filtered_for_tips['Product'] == selected_product]
 
+    # Ключ кэша производных результатов: версия данных + выбранные фильтры
+    summary_key = derived_version(current_version(df), selected_year, selected_restaurant, selected_product)
+
     # --- Поле ввода для пользовательского вопроса ---
     user_question = st.text_area(
         "Ваш вопрос к модели (например, 'Сумма заказов П/Ф Чили' или 'Прогноз продаж П/Ф Цезарь'):", height=100)
@@ -119,19 +143,7 @@ def openai_chat(df: pd.DataFrame):
                 # Преобразование отфильтрованных данных в текстовый формат для анализа
                 df_text = filtered_for_tips.to_csv(index=False)
 
-                response = openai.ChatCompletion.create(
-                    model="gpt-4o-mini",  # Используем указанную модель
-                    messages=[
-                        {"role": "system",
-                         "content": "Ты - аналитик, помогай отвечать на вопросы по данным ресторана. Предоставляй "
-                                    "аналитику и прогнозы на основе доступных данных."},
-                        {"role": "user", "content": f"Вот данные ресторана: {df_text}. Вопрос: {user_question}"},
-                    ],
-                    temperature=0.2,
-                    max_tokens=1000  # Ограничение на количество токенов
-                )
-
-                chat_answer = response.choices[0].message["content"]
+                chat_answer = ask_model(df_text, user_question.strip(), summary_key)
 
                 # Вывод результата
                 st.write("### Ответ:")
@@ -144,12 +156,12 @@ def openai_chat(df: pd.DataFrame):
     # --- Подсказки на основе отфильтрованных данных ---
     if not filtered_for_tips.empty:
         try:
-            # Самый популярный продукт из списка включенных товаров
-            top_product = filtered_for_tips.groupby('Product')[selected_restaurant].sum().idxmax()
-            # Общий объем продаж в выбранном ресторане по включенным продуктам
-            restaurant_sales = filtered_for_tips[selected_restaurant].sum()
-            # Среднее количество заказов
-            average_orders = filtered_for_tips[selected_restaurant].mean()
+            tip_filters = {}
+            if selected_year != "Все годы":
+                tip_filters["Year"] = [selected_year]
+            if selected_product != "Все продукты":
+                tip_filters["Product"] = [selected_product]
+            top_product, restaurant_sales, average_orders = tips_summary(df, selected_restaurant, tip_filters)
 
             st.info(f"Самый популярный продукт (производимые продукты) — {top_product}.")
             st.info(
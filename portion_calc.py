@@ -1,7 +1,13 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import io
+import numpy as np
+from api_store import publish_portions
+from catalog import get_catalog, product_codes
+from charts import bar_figure, frame_key, show_figure
+from exporters import download_table
+from procurement import order_planning
+from snapshot import PORTION_KEY
+from versioning import current_version
 
 
 def calculate_portions(df: pd.DataFrame):
@@ -9,28 +15,12 @@ def calculate_portions(df: pd.DataFrame):
     Расчёт количества порций и рекомендации по закупкам.
     Предполагается, что:
       - df содержит столбцы Product, Total, Year, Week.
-      - у нас есть справочник (dict) с весом одной порции для каждого продукта.
+      - вес одной порции каждого продукта хранится в каталоге продуктов (catalog.py).
     """
     st.subheader("Расчёт порционности и оптимизация закупок")
 
-    # Шаг 1. Справочник весов порций (kg на одну порцию)
-    portion_dict = {
-        "П/Ф Говядина": 0.2,
-        "П/Ф Гагава": 0.2,
-        "П/Ф Курица в соусе": 0.2,
-        "П/Ф Лакомство от шефа": 0.2,
-        "П/Ф Цезарь": 0.2,
-        "П/Ф Чили": 0.2,
-        "П/Ф Кекиклим": 0.2,
-        "П/Ф Курица на суп": 0.25,
-        "П/Ф Картофель Фри 2,5 кг": 0.1,
-        "П/Ф Луковые кольца 1 кг": 0.1,
-        "Мозаика": 0.09,
-        "Пюре из баклажанов": 0.1,
-        "Соус Баффало": 0.02,
-        "Соус Песто": 0.04,
-        "Соус Сладкий перец": 0.02
-    }
+    # Шаг 1. Справочник весов порций (kg на одну порцию) — из каталога продуктов
+    catalog = get_catalog()
 
     # Шаг 2. Проверка наличия необходимых столбцов
     required_columns = {"Year", "Week", "Product", "Total"}
@@ -38,6 +28,13 @@ def calculate_portions(df: pd.DataFrame):
         st.error(f"Необходимые столбцы отсутствуют в данных: {required_columns - set(df.columns)}")
         return
 
+    # План порций по всем неделям публикуется для HTTP API (один раз на версию данных)
+    publish_portions(df)
+
+    # Заказ на следующие недели считается по пакетному прогнозу, а не по фактическим продажам
+    with st.expander("Оптимизация заказа по прогнозу (коробки, сроки годности, минимальные заказы)"):
+        order_planning(df)
+
     # Шаг 3. Выбор года и недели для анализа
     years = df["Year"].unique()
     selected_year = st.selectbox("Выберите год для анализа", years)
@@ -46,29 +43,31 @@ def calculate_portions(df: pd.DataFrame):
     selected_week = st.selectbox("Выберите неделю для анализа", sorted(weeks))
 
     # Фильтруем данные за выбранный год и неделю
-    df_selected_period = df[(df["Year"] == selected_year) & (df["Week"] == selected_week)]
-    if df_selected_period.empty:
+    period_mask = ((df["Year"] == selected_year) & (df["Week"] == selected_week)).to_numpy()
+    if not period_mask.any():
         st.warning(f"Нет данных за выбранный период: год {selected_year}, неделя {selected_week}.")
         return
 
-    # Шаг 4. Фильтруем продукты, указанные в справочнике порций
-    df_selected_period = df_selected_period[df_selected_period["Product"].isin(portion_dict.keys())]
-    if df_selected_period.empty:
+    # Шаг 4. Фильтруем продукты, указанные в справочнике порций (маска по кодам каталога)
+    codes = product_codes(df, current_version(df))
+    mask = period_mask & catalog.mask_from_codes(codes, "portion")
+    if not mask.any():
         st.warning("Нет продуктов из справочника порций в данных за выбранный период.")
         return
 
-    # Шаг 5. Расчёт порций для каждого продукта
+    # Шаг 5. Расчёт порций для каждого продукта (суммы по кодам продуктов одним проходом)
     st.write(f"Результаты расчёта для выбранного периода: год **{selected_year}**, неделя **{selected_week}**")
+    total_kg = np.bincount(codes[mask], weights=df["Total"].to_numpy(dtype=float)[mask],
+                           minlength=len(catalog.names))
+    present = np.unique(codes[mask])
     results = []
-    for product in df_selected_period["Product"].unique():
-        total_kg = df_selected_period[df_selected_period["Product"] == product]["Total"].sum()
-        weight_per_portion = portion_dict[product]
-        portion_count = total_kg / weight_per_portion
+    for code in present:
+        weight_per_portion = catalog.portion_kg[code]
         results.append({
-            "Продукт": product,
-            "Общий вес (кг)": int(total_kg),  # Приводим к целому числу
+            "Продукт": catalog.names[code],
+            "Общий вес (кг)": int(total_kg[code]),  # Приводим к целому числу
             "Вес одной порции (кг)": weight_per_portion,
-            "Количество порций": int(portion_count)  # Убираем дробную часть
+            "Количество порций": int(total_kg[code] / weight_per_portion)  # Убираем дробную часть
         })
 
     # Создание DataFrame с форматированием
@@ -79,34 +78,29 @@ def calculate_portions(df: pd.DataFrame):
 
     # Визуализация с помощью Plotly
     st.write("### Визуализация данных:")
-    fig = px.bar(
-        results_df,
+    show_figure("portions", current_version(df), lambda: bar_figure(
+        results_df.astype({"Количество порций": int}),
         x="Продукт",
         y="Количество порций",
         title=f"Количество порций по каждому продукту ({selected_year}, неделя {selected_week})",
         labels={"Количество порций": "Количество порций", "Продукт": "Продукт"}
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    ), params=(selected_year, selected_week, frame_key(results_df)))
 
     # Вывод таблицы
     st.write("### Таблица результатов:")
     st.dataframe(results_df)
 
-    # Кнопка для скачивания Excel-отчёта
+    # Кнопка для скачивания отчёта (Excel / Parquet / Arrow / CSV)
     st.write("### Скачивание отчёта")
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        results_df.to_excel(writer, index=False, sheet_name="Portions Report")
-    excel_data = output.getvalue()
-
-    st.download_button(
-        label="Скачать отчёт в формате Excel",
-        data=excel_data,
-        file_name=f"Portions_Report_{selected_year}_Week_{selected_week}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    download_table(
+        results_df, "Portions Report", selected_year, current_version(df),
+        label="Скачать отчёт",
+        file_stem=f"Portions_Report_{selected_year}_Week_{selected_week}",
+        sheet_name="Portions Report",
+        params={"week": selected_week}
     )
 
     # Сохранение данных в session_state для возможного экспорта
-    st.session_state["portion_results"] = results_df
+    st.session_state[PORTION_KEY] = results_df
 
     st.success("Расчёт завершён!")
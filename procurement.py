@@ -0,0 +1,271 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import math
+from scipy.special import ndtr, ndtri
+from array_store import ALL_FORECAST_JOB, session_forecast
+from catalog import get_catalog
+from database import get_connection
+from exporters import download_table
+from intervals import sigma_from_interval
+from registry import get_registry
+from versioning import derived_version
+
+# Параметры по умолчанию для продуктов без сохранённых настроек
+DEFAULT_UNIT_COST = 1.0     # закупочная цена за кг
+DEFAULT_UNIT_PRICE = 2.5    # выручка за кг
+DEFAULT_SALVAGE = 0.0       # доля закупочной цены, которая возвращается за непроданный остаток
+DEFAULT_SHELF_WEEKS = 2     # срок годности: заказ не покрывает больше недель, чем продукт хранится
+DEFAULT_MIN_CASES = 0       # минимальный заказ ресторана по продукту (коробок)
+
+# Границы критического отношения: при 0 или 1 квантиль нормального распределения бесконечен
+MIN_RATIO = 0.01
+MAX_RATIO = 0.99
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS procurement_params (
+    product      TEXT PRIMARY KEY,
+    unit_cost    REAL NOT NULL,
+    unit_price   REAL NOT NULL,
+    salvage      REAL NOT NULL,
+    shelf_weeks  INTEGER NOT NULL,
+    min_cases    INTEGER NOT NULL
+)
+"""
+
+# Столбцы таблицы параметров -> подписи в редакторе
+PARAM_LABELS = {
+    "product": "Продукт",
+    "unit_cost": "Закупочная цена (за кг)",
+    "unit_price": "Выручка (за кг)",
+    "salvage": "Возврат за остаток (доля)",
+    "shelf_weeks": "Срок годности (недель)",
+    "min_cases": "Мин. заказ (коробок)",
+}
+
+PARAM_DEFAULTS = {
+    "unit_cost": DEFAULT_UNIT_COST,
+    "unit_price": DEFAULT_UNIT_PRICE,
+    "salvage": DEFAULT_SALVAGE,
+    "shelf_weeks": DEFAULT_SHELF_WEEKS,
+    "min_cases": DEFAULT_MIN_CASES,
+}
+
+
+def ensure_params_table(conn):
+    conn.execute(SCHEMA)
+    conn.commit()
+
+
+def load_params(products: list[str]) -> pd.DataFrame:
+    """Параметры закупки для списка продуктов (в его порядке); отсутствующие заполняются значениями по умолчанию."""
+    conn = get_connection()
+    try:
+        ensure_params_table(conn)
+        stored = pd.read_sql_query("SELECT * FROM procurement_params", conn).set_index("product")
+    finally:
+        conn.close()
+    params = stored.reindex(pd.Index(products, name="product")).astype(float).fillna(PARAM_DEFAULTS)
+    return params.astype({"shelf_weeks": int, "min_cases": int}).reset_index()
+
+
+def save_params(params: pd.DataFrame):
+    conn = get_connection()
+    try:
+        ensure_params_table(conn)
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO procurement_params (product, unit_cost, unit_price, salvage, shelf_weeks, min_cases)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            params[list(PARAM_LABELS)].astype({"shelf_weeks": int, "min_cases": int})
+            .itertuples(index=False, name=None)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def case_sizes(products: list[str], df: pd.DataFrame | None = None) -> np.ndarray:
+    """Вес коробки по продуктам: из каталога, иначе из столбца 'Case kg' данных; NaN — коробка неизвестна."""
+    catalog = get_catalog()
+    codes = catalog.encode(pd.Series(products))
+    sizes = np.where(codes >= 0, catalog.case_kg[np.clip(codes, 0, None)], np.nan)
+    if df is not None and "Case kg" in df.columns:
+        from_data = pd.to_numeric(df["Case kg"], errors="coerce").groupby(df["Product"].astype(str)).max()
+        fallback = from_data.reindex(products).to_numpy(dtype=float)
+        sizes = np.where(np.isnan(sizes), fallback, sizes)
+    return np.where(sizes > 0, sizes, np.nan)
+
+
+def _normal_pdf(z: np.ndarray) -> np.ndarray:
+    return np.exp(-0.5 * z * z) / math.sqrt(2.0 * math.pi)
+
+
+def expected_cost(order: np.ndarray, mean: np.ndarray, sigma: np.ndarray,
+                  underage: np.ndarray, overage: np.ndarray) -> np.ndarray:
+    """
+    Ожидаемые потери заказа при нормальном спросе: недостача × упущенная маржа + остаток × потери на остатке.
+    Ожидаемая недостача — σ·L(z), L(z) = φ(z) − z·(1 − Φ(z)); при σ = 0 спрос детерминирован.
+    """
+    safe_sigma = np.where(sigma > 0, sigma, 1.0)
+    z = (order - mean) / safe_sigma
+    shortage = np.where(sigma > 0, safe_sigma * (_normal_pdf(z) - z * (1.0 - ndtr(z))),
+                        np.maximum(mean - order, 0.0))
+    leftover = order - mean + shortage
+    return underage * shortage + overage * leftover
+
+
+def covered_demand(tensor: np.ndarray, weeks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Спрос за период покрытия заказа: тензор неделя × продукт × ресторан × (P10, P50, P90),
+    weeks — число недель покрытия по каждому продукту. Медианы и σ недель накапливаются одним cumsum
+    (σ недель одного ряда складываются: неопределённость тренда Prophet у них общая, как в sum_intervals),
+    для каждого продукта берётся срез своей длины. Возвращает (среднее, σ): продукт × ресторан.
+    """
+    tensor = np.asarray(tensor, dtype=np.float64)
+    mean = np.cumsum(tensor[..., 1], axis=0)
+    sigma = np.cumsum(sigma_from_interval(tensor[..., 0], tensor[..., 2]), axis=0)
+    index = (weeks - 1)[None, :, None]
+    return np.take_along_axis(mean, index, axis=0)[0], np.take_along_axis(sigma, index, axis=0)[0]
+
+
+class OrderPlan:
+    """Оптимальные заказы (продукт × ресторан) и промежуточные величины расчёта."""
+
+    def __init__(self, products: list[str], restaurants: list[str], mean: np.ndarray, sigma: np.ndarray,
+                 ratio: np.ndarray, weeks: np.ndarray, optimal_kg: np.ndarray, case_kg: np.ndarray,
+                 cases: np.ndarray):
+        self.products = products
+        self.restaurants = restaurants
+        self.mean = mean
+        self.sigma = sigma
+        self.ratio = ratio
+        self.weeks = weeks
+        self.optimal_kg = optimal_kg
+        self.case_kg = case_kg
+        self.cases = cases
+        self.order_kg = cases * case_kg[:, None]
+
+    def store_table(self) -> pd.DataFrame:
+        """Заказ по ресторанам: строки только с ненулевым количеством."""
+        n_products, n_restaurants = self.cases.shape
+        city_of = get_registry().city_of
+        table = pd.DataFrame({
+            "Ресторан": np.tile(self.restaurants, n_products),
+            "Город": np.tile([city_of.get(name, "") for name in self.restaurants], n_products),
+            "Продукт": np.repeat(self.products, n_restaurants),
+            "Недель покрытия": np.repeat(self.weeks, n_restaurants),
+            "Спрос P50 (кг)": self.mean.ravel().round(1),
+            "σ спроса (кг)": self.sigma.ravel().round(1),
+            "Уровень сервиса": np.repeat(self.ratio, n_restaurants).round(2),
+            "Оптимальный заказ (кг)": self.optimal_kg.ravel().round(1),
+            "Коробка (кг)": np.repeat(self.case_kg, n_restaurants),
+            "Коробок": self.cases.ravel().astype(int),
+            "Заказ (кг)": self.order_kg.ravel().round(1),
+        })
+        return table[table["Коробок"] > 0].sort_values(["Ресторан", "Продукт"], ignore_index=True)
+
+    def network_table(self) -> pd.DataFrame:
+        """Итог по сети для поставщика: суммы по всем ресторанам."""
+        table = pd.DataFrame({
+            "Продукт": self.products,
+            "Коробка (кг)": self.case_kg,
+            "Коробок": self.cases.sum(axis=1).astype(int),
+            "Заказ (кг)": self.order_kg.sum(axis=1).round(1),
+            "Спрос P50 (кг)": self.mean.sum(axis=1).round(1),
+        })
+        return table[table["Коробок"] > 0].reset_index(drop=True)
+
+
+def optimize_orders(tensor: np.ndarray, params: pd.DataFrame, case_kg: np.ndarray, cycle_weeks: int,
+                    products: list[str], restaurants: list[str]) -> OrderPlan:
+    """
+    Заказ «газетчика» сразу для всех ресторанов и продуктов.
+    Критическое отношение Cu / (Cu + Co): Cu — упущенная маржа за кг, Co — потери на непроданном кг.
+    Непрерывный оптимум Q* = μ + z·σ округляется до коробок: из двух соседних количеств коробок
+    выбирается то, у которого ниже ожидаемые потери; затем применяется минимальный заказ.
+    Продукты без веса коробки заказываются в килограммах (коробка = 1 кг).
+    """
+    horizon = tensor.shape[0]
+    unit_cost = params["unit_cost"].to_numpy(dtype=float)
+    underage = np.maximum(params["unit_price"].to_numpy(dtype=float) - unit_cost, 0.0)
+    overage = np.maximum(unit_cost * (1.0 - params["salvage"].to_numpy(dtype=float)), 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.clip(np.nan_to_num(underage / (underage + overage), nan=0.5), MIN_RATIO, MAX_RATIO)
+    z = ndtri(ratio)
+
+    # Заказ покрывает период до следующей поставки, но не дольше срока годности
+    weeks = np.clip(np.minimum(cycle_weeks, params["shelf_weeks"].to_numpy(dtype=int)), 1, horizon)
+    mean, sigma = covered_demand(tensor, weeks)
+    optimal_kg = np.maximum(mean + z[:, None] * sigma, 0.0)
+
+    case = np.nan_to_num(case_kg, nan=1.0)[:, None]
+    cu, co = underage[:, None], overage[:, None]
+    lower = np.floor(optimal_kg / case)
+    upper = lower + 1
+    cases = np.where(expected_cost(lower * case, mean, sigma, cu, co)
+                     <= expected_cost(upper * case, mean, sigma, cu, co), lower, upper)
+    min_cases = params["min_cases"].to_numpy(dtype=float)[:, None]
+    cases = np.where(mean > 0, np.maximum(cases, min_cases), cases)
+    return OrderPlan(products, restaurants, mean, sigma, ratio, weeks, optimal_kg, case[:, 0], cases)
+
+
+def order_planning(df: pd.DataFrame):
+    """Оптимизация заказа поставщику по квантилям пакетного прогноза, весам коробок и стоимостям."""
+    forecast = session_forecast("W")
+    if forecast is None:
+        st.info("Сначала постройте недельный прогноз по всем ресторанам на странице «Прогнозирование»: "
+                "заказ рассчитывается по его квантилям P10/P50/P90.")
+        return
+
+    products = forecast.labels("product")
+    restaurants = forecast.labels("restaurant")
+    dates = forecast.dates
+    cycle = st.number_input("Период между поставками (недель)", min_value=1, max_value=len(dates), value=1,
+                            key="procurement_cycle")
+
+    st.write("Параметры продуктов (уровень сервиса = маржа / (маржа + потери на остатке)):")
+    edited = st.data_editor(load_params(products).rename(columns=PARAM_LABELS), disabled=[PARAM_LABELS["product"]],
+                            hide_index=True, key="procurement_params_editor")
+    # Очищенная в редакторе ячейка приходит как NaN — подставляем значение по умолчанию
+    params = (edited.rename(columns={label: column for column, label in PARAM_LABELS.items()})
+              .fillna(PARAM_DEFAULTS).astype({"shelf_weeks": int, "min_cases": int}))
+    if st.button("Сохранить параметры закупок"):
+        save_params(params)
+        st.success("Параметры закупок сохранены.")
+
+    case_kg = case_sizes(products, df)
+    if np.isnan(case_kg).any():
+        st.caption(f"Без веса коробки (заказ в кг): {int(np.isnan(case_kg).sum())} продуктов — "
+                   "вес задаётся в каталоге продуктов или столбцом 'Case kg' загрузки.")
+
+    plan = optimize_orders(np.asarray(forecast.data), params, case_kg, int(cycle), products, restaurants)
+    store_orders = plan.store_table()
+    network_orders = plan.network_table()
+
+    st.write(f"### Заказ на поставку с {dates[0].date()}")
+    st.write(f"Итого по сети: **{int(network_orders['Коробок'].sum())}** коробок, "
+             f"**{network_orders['Заказ (кг)'].sum():.0f}** кг")
+    st.dataframe(network_orders, hide_index=True)
+    st.write("#### По ресторанам")
+    st.dataframe(store_orders, hide_index=True)
+
+    # Файл для поставщика: заказ по ресторанам (ключ — пакетный прогноз и параметры расчёта)
+    key = derived_version(st.session_state[ALL_FORECAST_JOB]["key"], "orders", int(cycle),
+                          pd.util.hash_pandas_object(params, index=False).sum(), case_kg.tobytes())
+    download_table(
+        store_orders[["Ресторан", "Город", "Продукт", "Коробка (кг)", "Коробок", "Заказ (кг)"]],
+        "Supplier Order", dates[0].year, key,
+        label="Скачать заказ поставщику",
+        file_stem=f"Supplier_Order_{dates[0].date()}",
+        sheet_name="Supplier Order",
+        key="export_supplier_order"
+    )
+    download_table(
+        network_orders, "Supplier Order Network", dates[0].year, key,
+        label="Скачать итог по сети",
+        file_stem=f"Supplier_Order_Network_{dates[0].date()}",
+        sheet_name="Network Total",
+        key="export_supplier_order_network"
+    )
@@ -0,0 +1,234 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import datetime
+import logging
+import time
+from prophet import Prophet
+from array_store import HISTORY, history_series, history_views
+from database import get_connection
+from intervals import INTERVAL_WIDTH
+from jobs import Job, get_job_queue, job_status
+from versioning import VERSION_KEY, current_version, derived_version
+
+# Профили модели: сезонность, число точек излома тренда, оптимизатор Stan и число сэмплов для интервалов.
+# Сезонность — порядок ряда Фурье; недельная сезонность включается только для дневного шага.
+PRESETS = {
+    "fast": {
+        "label": "Быстрый",
+        "yearly_seasonality": 5,
+        "weekly_seasonality": 3,
+        "seasonality_mode": "additive",
+        "n_changepoints": 8,
+        "changepoint_range": 0.8,
+        "algorithm": "LBFGS",
+        "iter": 1000,
+        "uncertainty_samples": 200,
+    },
+    "balanced": {
+        "label": "Сбалансированный",
+        "yearly_seasonality": 10,
+        "weekly_seasonality": 3,
+        "seasonality_mode": "additive",
+        "n_changepoints": 25,
+        "changepoint_range": 0.8,
+        "algorithm": "LBFGS",
+        "iter": 3000,
+        "uncertainty_samples": 500,
+    },
+    "accurate": {
+        "label": "Точный",
+        "yearly_seasonality": 20,
+        "weekly_seasonality": 6,
+        "seasonality_mode": "multiplicative",
+        "n_changepoints": 25,
+        "changepoint_range": 0.9,
+        "algorithm": "Newton",
+        "iter": 10000,
+        "uncertainty_samples": 1000,
+    },
+}
+DEFAULT_PRESET = "balanced"
+
+# Годовая сезонность оценивается только на истории не короче двух лет (как правило auto у Prophet)
+MIN_YEARLY_DAYS = 730
+
+# Сравнение профилей: число рядов в выборке и длина отложенного периода (в неделях)
+BENCHMARK_SERIES = 12
+HOLDOUT_WEEKS = 8
+
+# Ключ session_state с идентификатором задачи сравнения профилей
+BENCHMARK_JOB = "prophet_benchmark_job"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prophet_runs (
+    run_id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    preset            TEXT NOT NULL,
+    grain             TEXT NOT NULL,
+    kind              TEXT NOT NULL,
+    series            INTEGER NOT NULL,
+    fit_seconds       REAL NOT NULL,
+    mean_fit_seconds  REAL NOT NULL,
+    wape              REAL,
+    data_version      TEXT,
+    recorded_at       TEXT NOT NULL
+)
+"""
+
+# Логгеры, через которые Prophet и CmdStan пишут сообщения о каждом обучении
+STAN_LOGGERS = ("cmdstanpy", "prophet", "prophet.models")
+
+
+def preset_label(preset: str) -> str:
+    return PRESETS[preset]["label"]
+
+
+def silence_stan():
+    """Отключает сообщения CmdStan/Prophet уровня INFO (в пакетном режиме они печатаются на каждый ряд)."""
+    for name in STAN_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def make_model(history: pd.DataFrame, preset: str = DEFAULT_PRESET, holidays: pd.DataFrame | None = None,
+               freq: str = "W-MON") -> Prophet:
+    """Prophet с параметрами профиля; сезонности заданы явно, без автоматических проверок на каждом ряду."""
+    config = PRESETS[preset]
+    dates = pd.to_datetime(history["ds"])
+    span_days = (dates.max() - dates.min()).days if len(dates) else 0
+    return Prophet(
+        holidays=holidays,
+        interval_width=INTERVAL_WIDTH,
+        yearly_seasonality=config["yearly_seasonality"] if span_days >= MIN_YEARLY_DAYS else False,
+        weekly_seasonality=config["weekly_seasonality"] if freq == "D" else False,
+        daily_seasonality=False,
+        seasonality_mode=config["seasonality_mode"],
+        n_changepoints=config["n_changepoints"],
+        changepoint_range=config["changepoint_range"],
+        uncertainty_samples=config["uncertainty_samples"],
+    )
+
+
+def fit_model(model: Prophet, history: pd.DataFrame, preset: str = DEFAULT_PRESET) -> float:
+    """Обучение с оптимизатором и лимитом итераций профиля; возвращает время обучения в секундах."""
+    config = PRESETS[preset]
+    start = time.perf_counter()
+    model.fit(history, algorithm=config["algorithm"], iter=config["iter"])
+    return time.perf_counter() - start
+
+
+def ensure_runs_table(conn):
+    conn.execute(SCHEMA)
+    conn.commit()
+
+
+def record_run(preset: str, grain: str, kind: str, fit_times: list[float], wape: float | None = None,
+               version: str | None = None):
+    """Сохраняет статистику запуска: kind — 'batch' (пакетный прогноз) или 'benchmark' (сравнение профилей)."""
+    if not fit_times:
+        return
+    conn = get_connection()
+    try:
+        ensure_runs_table(conn)
+        conn.execute(
+            """
+            INSERT INTO prophet_runs (preset, grain, kind, series, fit_seconds, mean_fit_seconds, wape,
+                                      data_version, recorded_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (preset, grain, kind, len(fit_times), float(np.sum(fit_times)), float(np.mean(fit_times)),
+             None if wape is None else float(wape), version,
+             datetime.datetime.now().isoformat(timespec="seconds"))
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_runs() -> pd.DataFrame:
+    conn = get_connection()
+    try:
+        ensure_runs_table(conn)
+        return pd.read_sql_query("SELECT * FROM prophet_runs ORDER BY run_id", conn)
+    finally:
+        conn.close()
+
+
+def preset_summary(runs: pd.DataFrame) -> pd.DataFrame:
+    """Сводка по профилям: среднее время обучения ряда (взвешенно по числу рядов) и последняя ошибка WAPE."""
+    if runs.empty:
+        return pd.DataFrame()
+    runs = runs.assign(weighted=runs["mean_fit_seconds"] * runs["series"])
+    summary = runs.groupby(["preset", "grain"]).agg(
+        Запусков=("run_id", "count"), Рядов=("series", "sum"), weighted=("weighted", "sum"))
+    summary["Среднее время ряда, с"] = (summary.pop("weighted") / summary["Рядов"]).round(3)
+    last_wape = runs.dropna(subset=["wape"]).groupby(["preset", "grain"])["wape"].last()
+    summary["WAPE (последнее сравнение), %"] = (last_wape * 100).round(1)
+    summary = summary.reset_index()
+    summary["preset"] = summary["preset"].map(lambda p: PRESETS[p]["label"] if p in PRESETS else p)
+    return summary.rename(columns={"preset": "Профиль", "grain": "Шаг"})
+
+
+def benchmark_series(df: pd.DataFrame, count: int = BENCHMARK_SERIES) -> list[pd.DataFrame]:
+    """Воспроизводимая выборка недельных рядов (ресторан, продукт) из хранилища массивов."""
+    views = history_views(df)
+    view = views[HISTORY]
+    pairs = [(product, restaurant) for product in view.labels("product") for restaurant in view.labels("restaurant")]
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(pairs), size=min(count, len(pairs)), replace=False)
+    series = [history_series(views, *pairs[i]) for i in sorted(picks)]
+    return [s for s in series if len(s) > 2 * HOLDOUT_WEEKS]
+
+
+def benchmark_presets(job: Job | None, series: list[pd.DataFrame], holidays: pd.DataFrame | None,
+                      version: str | None = None, holdout: int = HOLDOUT_WEEKS) -> pd.DataFrame:
+    """
+    Сравнение профилей на одной выборке рядов: обучение без последних holdout недель,
+    прогноз на них, WAPE = Σ|факт − прогноз| / Σ|факт| и время обучения. Результат пишется в prophet_runs.
+    """
+    silence_stan()
+    if job is not None:
+        job.set_total(len(PRESETS) * len(series))
+    rows = []
+    for preset in PRESETS:
+        fit_times, errors, actual = [], 0.0, 0.0
+        for history in series:
+            if job is not None:
+                job.advance(f"{preset_label(preset)}: ряд {len(fit_times) + 1} из {len(series)}")
+            train, test = history.iloc[:-holdout], history.iloc[-holdout:]
+            model = make_model(train, preset, holidays)
+            fit_times.append(fit_model(model, train, preset))
+            predicted = model.predict(test[["ds"]])["yhat"].clip(lower=0).to_numpy()
+            errors += float(np.abs(test["y"].to_numpy() - predicted).sum())
+            actual += float(np.abs(test["y"].to_numpy()).sum())
+        wape = errors / actual if actual > 0 else None
+        record_run(preset, "W", "benchmark", fit_times, wape, version)
+        rows.append({"Профиль": preset_label(preset), "Рядов": len(fit_times),
+                     "Среднее время ряда, с": round(float(np.mean(fit_times)), 3) if fit_times else None,
+                     "WAPE, %": None if wape is None else round(wape * 100, 1)})
+    return pd.DataFrame(rows)
+
+
+def show_presets(df: pd.DataFrame, holidays_builder):
+    """
+    Параметры профилей, накопленная статистика запусков и сравнение профилей в фоне.
+    holidays_builder() строит таблицу праздников — только при запуске сравнения.
+    """
+    st.dataframe(pd.DataFrame(PRESETS).T.set_index("label").rename_axis("Профиль"))
+    summary = preset_summary(load_runs())
+    if summary.empty:
+        st.info("Статистики запусков пока нет: она копится при пакетных прогнозах и сравнении профилей.")
+    else:
+        st.dataframe(summary, hide_index=True)
+
+    st.caption(f"Сравнение: {BENCHMARK_SERIES} случайных рядов, отложенные последние {HOLDOUT_WEEKS} недель.")
+    if st.button("Сравнить профили"):
+        key = derived_version(current_version(df), "prophet_benchmark", BENCHMARK_SERIES, HOLDOUT_WEEKS, PRESETS)
+        job = get_job_queue().submit(key, benchmark_presets, benchmark_series(df), holidays_builder(),
+                                     df.attrs.get(VERSION_KEY), title="Сравнение профилей Prophet")
+        st.session_state[BENCHMARK_JOB] = job.id
+
+    job = get_job_queue().get(st.session_state.get(BENCHMARK_JOB))
+    if job is not None:
+        job_status(job)
+        if job.finished_ok:
+            st.dataframe(job.result(), hide_index=True)
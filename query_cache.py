@@ -0,0 +1,250 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from catalog import get_catalog, product_mask
+from versioning import current_version
+
+# Каталог дискового уровня кэша: <QUERY_DIR>/<ключ>.parquet
+QUERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_cache")
+
+# Размер уровней кэша (в результатах запросов); на диске вытесняются давно не читавшиеся файлы
+MAX_MEMORY_ENTRIES = 512
+MAX_DISK_ENTRIES = 8192
+
+# Очистка диска выполняется раз в столько записей, а не на каждую
+PRUNE_EVERY = 64
+
+AGGREGATIONS = ("sum", "count", "mean", "min", "max")
+
+
+# Столбцы, которые входят в хэш каждой строки вместе со столбцами запроса
+ROW_KEYS = ("Year", "Week", "Product")
+
+
+class WeekFingerprints:
+    """
+    Отпечатки данных по неделям: для каждой (год, неделя) и набора столбцов запроса — сумма хэшей строк
+    (по модулю 2^64) и число строк. Хэш строки берётся по всем столбцам запроса вместе с год/неделя/продукт,
+    поэтому перенос значения между строками одной недели меняет отпечаток. Дописанные к выгрузке недели
+    не меняют отпечатков прежних недель, поэтому запрос, который касается только прежних недель,
+    после обновления данных получает тот же ключ. Суммы считаются при первом запросе с этим набором столбцов.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+        years = pd.to_numeric(df["Year"], errors="coerce").fillna(-1).to_numpy(np.int64)
+        weeks = pd.to_numeric(df["Week"], errors="coerce").fillna(-1).to_numpy(np.int64)
+        self.keys, inverse = np.unique(years * 100 + weeks, return_inverse=True)
+        self.years, self.weeks = self.keys // 100, self.keys % 100
+        self.counts = np.bincount(inverse, minlength=len(self.keys)).astype(np.int64)
+        self._order = np.argsort(inverse, kind="stable")
+        self._starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]]).astype(np.int64)
+        self._row_keys = [name for name in ROW_KEYS if name in df.columns]
+        self._sums: dict[tuple, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def week_sums(self, columns: tuple) -> np.ndarray:
+        """Суммы хэшей строк по неделям для набора столбцов (отсортированного, с ключами строк)."""
+        with self._lock:
+            sums = self._sums.get(columns)
+        if sums is None:
+            hashes = pd.util.hash_pandas_object(self._df[list(columns)], index=False).to_numpy(np.uint64)
+            hashes = hashes[self._order]
+            sums = np.add.reduceat(hashes, self._starts) if len(hashes) else np.zeros(0, dtype=np.uint64)
+            with self._lock:
+                self._sums[columns] = sums
+        return sums
+
+    def fingerprint(self, columns, years=None, weeks=None) -> str:
+        """Отпечаток столбцов columns в неделях, которые попадают под фильтры по году и неделе."""
+        rows = np.ones(len(self.keys), dtype=bool)
+        if years is not None:
+            rows &= np.isin(self.years, pd.to_numeric(pd.Series(list(years)), errors="coerce").to_numpy())
+        if weeks is not None:
+            rows &= np.isin(self.weeks, pd.to_numeric(pd.Series(list(weeks)), errors="coerce").to_numpy())
+        columns = tuple(sorted(set(columns) | set(self._row_keys)))
+        digest = hashlib.sha1(self.keys[rows].tobytes())
+        digest.update(self.counts[rows].tobytes())
+        digest.update(json.dumps(columns, ensure_ascii=False).encode("utf-8"))
+        digest.update(self.week_sums(columns)[rows].tobytes())
+        return digest.hexdigest()[:20]
+
+
+@st.cache_resource(max_entries=4)
+def week_fingerprints(_df: pd.DataFrame, version: str) -> WeekFingerprints:
+    """Отпечатки недель на версию данных (общие для сессий: хэши столбцов копятся в одном объекте)."""
+    return WeekFingerprints(_df)
+
+
+def _plain(value):
+    """Значение фильтра в виде, пригодном для JSON-ключа (скаляры numpy -> Python)."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def normalize_query(dims, measures, filters: dict | None = None, scope: str | None = None,
+                    agg: str = "sum") -> dict:
+    """
+    Нормализованное описание запроса: порядок измерений, мер, фильтров и значений в фильтре
+    не влияет на ключ. Набор продуктов scope раскрывается в список продуктов каталога,
+    чтобы правка каталога меняла ключ.
+    """
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"Неизвестная агрегация {agg}: одна из {', '.join(AGGREGATIONS)}")
+    return {
+        "dims": sorted(map(str, dims)),
+        "measures": sorted(map(str, measures)),
+        "filters": {str(col): sorted((_plain(v) for v in values), key=repr)
+                    for col, values in sorted((filters or {}).items())},
+        "scope": scope,
+        "scope_products": get_catalog().names_in(scope) if scope else None,
+        "agg": agg,
+    }
+
+
+def compute_aggregate(df: pd.DataFrame, query: dict, version: str) -> pd.DataFrame:
+    """Выполнение нормализованного запроса: маска фильтров, затем одна группировка."""
+    mask = np.ones(len(df), dtype=bool)
+    if query["scope"]:
+        mask &= product_mask(df, query["scope"], version)
+    for col, values in query["filters"].items():
+        mask &= df[col].isin(values).to_numpy()
+    dims, measures = query["dims"], query["measures"]
+    data = df.loc[mask, dims + measures]
+    data[measures] = data[measures].apply(pd.to_numeric, errors="coerce")
+    if not dims:
+        return data[measures].agg(query["agg"]).to_frame().T.reset_index(drop=True)
+    return data.groupby(dims, observed=True, dropna=False)[measures].agg(query["agg"]).reset_index()
+
+
+class QueryCache:
+    """
+    Кэш результатов агрегатных запросов (измерения, фильтры, мера): ограниченный LRU в памяти
+    поверх файлов Parquet на диске, общий для сессий и переживающий перезапуск приложения.
+    Ключ — нормализованный запрос и отпечаток только тех недель и столбцов, которых он касается:
+    при обновлении данных «промахиваются» лишь запросы по изменившимся неделям,
+    а их прежние результаты вытесняются как давно не использовавшиеся.
+    """
+
+    def __init__(self, root: str = QUERY_DIR, max_entries: int = MAX_MEMORY_ENTRIES,
+                 max_disk_entries: int = MAX_DISK_ENTRIES):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: OrderedDict[str, pd.DataFrame] = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {"memory": 0, "disk": 0, "miss": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.parquet")
+
+    def key(self, df: pd.DataFrame, query: dict) -> str:
+        columns = set(query["dims"]) | set(query["measures"]) | set(query["filters"])
+        if query["scope"]:
+            columns.add("Product")
+        filters = query["filters"]
+        fingerprint = week_fingerprints(df, current_version(df)).fingerprint(
+            columns, filters.get("Year"), filters.get("Week"))
+        payload = json.dumps([query, fingerprint], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:24]
+
+    def get(self, key: str) -> pd.DataFrame | None:
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory"] += 1
+                return result
+        path = self._path(key)
+        try:
+            result = pd.read_parquet(path)
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        self._remember(key, result)
+        with self._lock:
+            self.stats["disk"] += 1
+        return result
+
+    def put(self, key: str, result: pd.DataFrame):
+        self._remember(key, result)
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        result.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def _remember(self, key: str, result: pd.DataFrame):
+        with self._lock:
+            self._memory[key] = result
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def prune(self):
+        """Удаляет с диска самые давно читавшиеся результаты сверх max_disk_entries."""
+        try:
+            entries = [e for e in os.scandir(self.root) if e.name.endswith(".parquet")]
+        except FileNotFoundError:
+            return
+        if len(entries) <= self.max_disk_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_disk_entries]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def aggregate(self, df: pd.DataFrame, dims, measures, filters: dict | None = None, scope: str | None = None,
+                  agg: str = "sum") -> pd.DataFrame:
+        """
+        Агрегат measures по dims среди строк, прошедших filters (столбец -> допустимые значения)
+        и набор продуктов каталога scope. Без dims — одна строка с итогами.
+        Столбцы результата идут в запрошенном порядке, строки отсортированы по dims.
+        """
+        dims, measures = list(dims), list(measures)
+        query = normalize_query(dims, measures, filters, scope, agg)
+        key = self.key(df, query)
+        result = self.get(key)
+        if result is None:
+            with self._lock:
+                self.stats["miss"] += 1
+            result = compute_aggregate(df, query, current_version(df))
+            self.put(key, result)
+        result = result[dims + measures]
+        return result.sort_values(dims, ignore_index=True) if dims and dims != query["dims"] else result
+
+    def aggregate_years(self, df: pd.DataFrame, dims, measures, filters: dict | None = None,
+                        scope: str | None = None, agg: str = "sum") -> pd.DataFrame:
+        """
+        Тот же агрегат, собранный из отдельных запросов по годам (Year добавляется в dims):
+        когда к выгрузке дописываются недели, пересчитывается только год, в который они попали.
+        """
+        dims = ["Year"] + [d for d in dims if d != "Year"]
+        filters = dict(filters or {})
+        years = filters.pop("Year", None)
+        if years is None:
+            years = pd.unique(df["Year"].dropna())
+        parts = [self.aggregate(df, dims, measures, {**filters, "Year": [year]}, scope, agg)
+                 for year in sorted(years)]
+        if not parts:
+            return pd.DataFrame(columns=dims + list(measures))
+        return pd.concat(parts, ignore_index=True)
+
+
+@st.cache_resource
+def get_query_cache() -> QueryCache:
+    """Один кэш запросов на процесс."""
+    return QueryCache()
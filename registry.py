@@ -0,0 +1,217 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+from functools import lru_cache
+from database import get_connection
+from versioning import version_from_frame
+
+# Исходный состав сети: (ресторан, город, регион). Используется только для
+# первичного заполнения таблицы restaurants — дальше справочник живёт в БД.
+DEFAULT_RESTAURANTS = [
+    ("Samara Cosmoport", "Samara", "Самарская область"),
+    ("Samara Mega", "Samara", "Самарская область"),
+    ("Nijniy Novgorod Mega", "Nijniy Novgorod", "Нижегородская область"),
+    ("Nijniy Novgorod 7 Nebo", "Nijniy Novgorod", "Нижегородская область"),
+    ("Nijniy Novgorod Fantastika", "Nijniy Novgorod", "Нижегородская область"),
+    ("Nijniy Novgorod Nebo", "Nijniy Novgorod", "Нижегородская область"),
+    ("Kazan Mall", "Kazan", "Республика Татарстан"),
+    ("Kazan Tandem", "Kazan", "Республика Татарстан"),
+    ("Kazan Mega", "Kazan", "Республика Татарстан"),
+    ("Kazan Koltso", "Kazan", "Республика Татарстан"),
+    ("Kazan Yujniy", "Kazan", "Республика Татарстан"),
+    ("Kazan Park House", "Kazan", "Республика Татарстан"),
+    ("Moscow Metropolis", "Moscow", "Москва"),
+    ("Moscow Gagarinskiy", "Moscow", "Москва"),
+    ("Moscow Erevan Plaza", "Moscow", "Москва"),
+    ("Moscow Mega Tyopliy Stan", "Moscow", "Москва"),
+    ("Moscow Aviapark", "Moscow", "Москва"),
+    ("Moscow Afimall", "Moscow", "Москва"),
+    ("Khimki Mega", "Khimki", "Московская область"),
+    ("Moscow RIO", "Moscow", "Москва"),
+    ("Moscow Fillion", "Moscow", "Москва"),
+    ("Moscow Columbus", "Moscow", "Москва"),
+    ("Moscow Kashirskoye Plaza", "Moscow", "Москва"),
+    ("Moscow Kaleydoscop", "Moscow", "Москва"),
+    ("Moscow Europolis", "Moscow", "Москва"),
+    ("Zelenograd Zelenopark", "Zelenograd", "Москва"),
+    ("Moscow Vegas", "Moscow", "Москва"),
+    ("Moscow Vodniy", "Moscow", "Москва"),
+    ("Moscow Mozaika", "Moscow", "Москва"),
+    ("Moscow Gorod", "Moscow", "Москва"),
+    ("Moscow Kuzminki Mall", "Moscow", "Москва"),
+    ("Moscow Mega Kotelniki", "Moscow", "Москва"),
+    ("Moscow Mega Kommunarka", "Moscow", "Москва"),
+    ("Moscow Salaris", "Moscow", "Москва"),
+    ("Nijnevartovsk GreenPark", "Nijnevartovsk", "ХМАО – Югра"),
+    ("Ufa Mega", "Ufa", "Республика Башкортостан"),
+    ("Chelny Kvartal", "Chelny", "Республика Татарстан"),
+    ("Ekaterinburg Veer Mall", "Ekaterinburg", "Свердловская область"),
+    ("Ekaterinburg Greenvich", "Ekaterinburg", "Свердловская область"),
+    ("Voronej Galereya Chijova", "Voronej", "Воронежская область"),
+    ("Voronej Grad", "Voronej", "Воронежская область"),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS restaurants (
+    restaurant_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name          TEXT NOT NULL UNIQUE,
+    city          TEXT NOT NULL,
+    region        TEXT,
+    opening_date  TEXT,
+    active        INTEGER NOT NULL DEFAULT 1
+)
+"""
+
+
+def ensure_restaurants_table(conn):
+    """Создаёт таблицу restaurants и заполняет её исходным составом сети, если она пуста."""
+    conn.execute(SCHEMA)
+    if conn.execute("SELECT COUNT(*) FROM restaurants").fetchone()[0] == 0:
+        conn.executemany(
+            "INSERT INTO restaurants (name, city, region) VALUES (?, ?, ?)",
+            DEFAULT_RESTAURANTS
+        )
+    conn.commit()
+
+
+class ColumnLayout:
+    """
+    Карта ресторанных столбцов конкретного набора столбцов DataFrame.
+    positions[i] — номер столбца ресторана names[i] в df.columns,
+    city_codes[i] — код города (индекс в cities).
+    Срез и группировка по городу сводятся к индексированию массивов.
+    """
+
+    def __init__(self, columns: tuple, registry: "RestaurantRegistry"):
+        col_pos = {col: i for i, col in enumerate(columns)}
+        self.names = [name for name in registry.names if name in col_pos]
+        self.positions = np.array([col_pos[name] for name in self.names], dtype=np.int64)
+        self.cities = sorted({registry.city_of[name] for name in self.names})
+        city_pos = {city: i for i, city in enumerate(self.cities)}
+        self.city_codes = np.array([city_pos[registry.city_of[name]] for name in self.names], dtype=np.int64)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        # Матрица принадлежности ресторан -> город для группировки умножением матриц
+        self.city_onehot = np.zeros((len(self.names), len(self.cities)))
+        self.city_onehot[np.arange(len(self.names)), self.city_codes] = 1.0
+
+    def city_columns(self, city: str) -> list[str]:
+        if city not in self.cities:
+            return []
+        code = self.cities.index(city)
+        return [name for name, c in zip(self.names, self.city_codes) if c == code]
+
+    def values(self, df: pd.DataFrame, dtype=np.float64) -> np.ndarray:
+        """Матрица (строки × рестораны) без копирования имён столбцов."""
+        return df.iloc[:, self.positions].to_numpy(dtype=dtype, na_value=0)
+
+    def sum_by_city(self, values: np.ndarray) -> np.ndarray:
+        """Суммы (строки × города) для матрицы из values()."""
+        return values @ self.city_onehot
+
+
+class RestaurantRegistry:
+    """
+    Справочник ресторанов из таблицы restaurants.
+    Индексы (город -> рестораны, ресторан -> город) строятся один раз при загрузке справочника.
+    Закрытые (неактивные) рестораны остаются столбцами данных — их история видна на всех страницах;
+    флаг active ограничивает только выбор ресторана и новые прогнозы (active_columns).
+    fingerprint — отпечаток содержимого справочника, входит в ключи кэшей, зависящих от него.
+    """
+
+    def __init__(self, table: pd.DataFrame):
+        self.table = table.reset_index(drop=True)
+        self.fingerprint = version_from_frame(self.table)
+        self.names = self.table["name"].tolist()
+        self.ids = dict(zip(self.table["name"], self.table["restaurant_id"]))
+        self.city_of = dict(zip(self.table["name"], self.table["city"]))
+        self.region_of = dict(zip(self.table["name"], self.table["region"]))
+        self.cities = sorted(set(self.city_of.values()))
+        self.city_index = {city: [n for n in self.names if self.city_of[n] == city] for city in self.cities}
+        self.active = set(self.table.loc[self.table["active"] == 1, "name"])
+        self._names = set(self.names)
+
+    def is_restaurant(self, column) -> bool:
+        return column in self._names
+
+    def layout(self, df: pd.DataFrame) -> ColumnLayout:
+        """Карта столбцов для df (кэшируется по набору имён столбцов)."""
+        return self.layout_for(df.columns)
+
+    def layout_for(self, columns) -> ColumnLayout:
+        """Карта для произвольного списка имён (например, оси ресторанов в массиве прогноза)."""
+        return _layout_for(tuple(columns), self)
+
+    def restaurant_columns(self, df: pd.DataFrame, numeric_only: bool = True) -> list[str]:
+        """Ресторанные столбцы df в порядке справочника (по умолчанию только числовые)."""
+        names = self.layout(df).names
+        if not numeric_only:
+            return list(names)
+        return [name for name in names if pd.api.types.is_numeric_dtype(df[name])]
+
+    def active_columns(self, df: pd.DataFrame) -> list[str]:
+        """Числовые столбцы действующих ресторанов — для выбора ресторана и новых прогнозов."""
+        return [name for name in self.restaurant_columns(df) if name in self.active]
+
+
+@lru_cache(maxsize=32)
+def _layout_for(columns: tuple, registry: RestaurantRegistry) -> ColumnLayout:
+    return ColumnLayout(columns, registry)
+
+
+def load_restaurants() -> pd.DataFrame:
+    conn = get_connection()
+    try:
+        ensure_restaurants_table(conn)
+        return pd.read_sql_query("SELECT * FROM restaurants ORDER BY restaurant_id", conn)
+    finally:
+        conn.close()
+
+
+@st.cache_resource
+def get_registry() -> RestaurantRegistry:
+    """Справочник ресторанов, общий для всех страниц и сессий."""
+    return RestaurantRegistry(load_restaurants())
+
+
+def save_restaurants(table: pd.DataFrame):
+    """
+    Сохраняет отредактированный справочник (строки, удалённые в редакторе, удаляются и из таблицы)
+    и сбрасывает закэшированные индексы. Кэши, зависящие от справочника, учитывают его fingerprint.
+    """
+    conn = get_connection()
+    try:
+        ensure_restaurants_table(conn)
+        kept = table["name"].tolist()
+        conn.execute(f"DELETE FROM restaurants WHERE name NOT IN ({', '.join('?' * len(kept))})", kept)
+        for row in table.itertuples(index=False):
+            conn.execute(
+                """
+                INSERT INTO restaurants (name, city, region, opening_date, active)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    city = excluded.city, region = excluded.region,
+                    opening_date = excluded.opening_date, active = excluded.active
+                """,
+                (row.name, row.city, row.region, row.opening_date, int(bool(row.active)))
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    get_registry.clear()
+    _layout_for.cache_clear()
+
+
+def manage_restaurants():
+    """Редактор справочника ресторанов: новые точки добавляются без изменения кода."""
+    registry = get_registry()
+    edited = st.data_editor(
+        registry.table[["name", "city", "region", "opening_date", "active"]],
+        num_rows="dynamic",
+        use_container_width=True,
+        key="restaurants_editor"
+    )
+    if st.button("Сохранить справочник ресторанов"):
+        edited = edited.dropna(subset=["name", "city"])
+        edited["active"] = edited["active"].fillna(1)
+        save_restaurants(edited)
+        st.success("Справочник ресторанов сохранён.")
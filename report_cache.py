@@ -0,0 +1,151 @@
+import streamlit as st
+import pandas as pd
+import hashlib
+import io
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Каталог, в котором хранятся готовые файлы отчётов
+ARTIFACT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts")
+
+# Сколько файлов отчётов держать на диске (самые давно запрашивавшиеся удаляются) и как часто проверять
+MAX_ARTIFACTS = 2048
+PRUNE_EVERY = 32
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def to_excel_bytes(df: pd.DataFrame, sheet_name: str = "Sheet1") -> bytes:
+    """Сериализация таблицы в XLSX (в памяти)."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False, sheet_name=sheet_name)
+    return output.getvalue()
+
+
+class ArtifactCache:
+    """
+    Дисковый кэш готовых отчётов.
+    Ключ артефакта — (тип отчёта, год, версия данных) и, при необходимости,
+    дополнительные параметры отчёта (неделя, ресторан, настройки сценария).
+    Файлы создаются лениво при первом запросе либо заранее в фоновом пуле;
+    сверх max_files удаляются файлы, которые дольше всех не запрашивали.
+    """
+
+    def __init__(self, root: str = ARTIFACT_DIR, max_workers: int = 2, max_files: int = MAX_ARTIFACTS):
+        self.root = root
+        self.max_files = max_files
+        self._builds = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report")
+        self._lock = threading.Lock()
+        self._pending: dict[str, Future] = {}
+
+    def path(self, report_type: str, year, version: str, params: dict | None = None, ext: str = "xlsx") -> str:
+        key = json.dumps([report_type, str(year), params or {}], sort_keys=True, ensure_ascii=False, default=str)
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.root, version, f"{name}.{ext}")
+
+    def exists(self, report_type: str, year, version: str, params: dict | None = None, ext: str = "xlsx") -> bool:
+        return os.path.exists(self.path(report_type, year, version, params, ext))
+
+    def _build(self, path: str, writer) -> str:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Атомарная запись: читатели никогда не увидят недописанный файл
+        # (расширение сохраняем — по нему некоторые писатели, например ExcelWriter, выбирают формат)
+        base, ext = os.path.splitext(path)
+        tmp_path = f"{base}.{threading.get_ident()}.tmp{ext}"
+        writer(tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._builds += 1
+            prune = self._builds % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+        return path
+
+    def prune(self):
+        """Удаляет самые давно запрашивавшиеся артефакты сверх max_files и опустевшие каталоги версий."""
+        entries = []
+        try:
+            folders = [e for e in os.scandir(self.root) if e.is_dir()]
+        except FileNotFoundError:
+            return
+        for folder in folders:
+            entries.extend(e for e in os.scandir(folder.path) if e.is_file() and ".tmp" not in e.name)
+        if len(entries) > self.max_files:
+            with self._lock:
+                pending = set(self._pending)
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for entry in entries[:len(entries) - self.max_files]:
+                if entry.path in pending:
+                    continue
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+        for folder in folders:
+            try:
+                os.rmdir(folder.path)
+            except OSError:
+                pass
+
+    def _submit(self, path: str, writer) -> Future:
+        with self._lock:
+            future = self._pending.get(path)
+            if future is None:
+                future = self._executor.submit(self._build, path, writer)
+                self._pending[path] = future
+                future.add_done_callback(lambda _f, p=path: self._forget(p))
+            return future
+
+    def _forget(self, path: str):
+        with self._lock:
+            self._pending.pop(path, None)
+
+    def get_path(self, report_type: str, year, version: str, writer, params: dict | None = None,
+                 ext: str = "xlsx") -> str:
+        """
+        Возвращает путь к готовому артефакту. Если файла ещё нет — создаёт его
+        функцией writer(path), которая пишет данные прямо в файл (без буфера в памяти).
+        """
+        path = self.path(report_type, year, version, params, ext)
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            return self._submit(path, writer).result()
+
+    def get(self, report_type: str, year, version: str, builder, params: dict | None = None,
+            ext: str = "xlsx") -> bytes:
+        """
+        Возвращает содержимое артефакта. Если файла ещё нет — строит его
+        (или дожидается уже запущенной фоновой сборки того же артефакта).
+        """
+        path = self.get_path(report_type, year, version, _bytes_writer(builder), params, ext)
+        with open(path, "rb") as f:
+            return f.read()
+
+    def schedule(self, report_type: str, year, version: str, builder, params: dict | None = None,
+                 ext: str = "xlsx") -> Future | None:
+        """Ставит сборку артефакта в фоновый пул (если файла ещё нет)."""
+        path = self.path(report_type, year, version, params, ext)
+        if os.path.exists(path):
+            return None
+        return self._submit(path, _bytes_writer(builder))
+
+
+def _bytes_writer(builder):
+    """Адаптер: функция, возвращающая bytes, превращается в функцию записи в файл."""
+    def writer(path: str):
+        with open(path, "wb") as f:
+            f.write(builder())
+    return writer
+
+
+@st.cache_resource
+def get_artifact_cache() -> ArtifactCache:
+    """Один кэш артефактов на процесс Streamlit."""
+    return ArtifactCache()
+
@@ -1,7 +1,92 @@
 import streamlit as st
 import pandas as pd
-import io
-import plotly.express as px
+from catalog import get_catalog
+from charts import bar_figure, frame_key, show_figure
+from exporters import download_table
+from query_cache import get_query_cache
+from registry import get_registry
+from report_cache import get_artifact_cache, to_excel_bytes
+from versioning import current_version
+
+REPORT_TYPES = [
+    "Итоговый отчёт по всей сети",
+    "Топ-10 продуктов",
+    "Рейтинги ресторанов"
+]
+
+
+def report_sums(df: pd.DataFrame, report_type: str, year) -> pd.DataFrame:
+    """
+    Агрегат для отчёта за год по продуктам из набора reports — из кэша запросов:
+    суммы Total по продуктам или (для рейтингов) итоги ресторанных столбцов одной строкой.
+    """
+    cache = get_query_cache()
+    if report_type == "Рейтинги ресторанов":
+        restaurant_cols = get_registry().restaurant_columns(df)
+        if not restaurant_cols:
+            return pd.DataFrame()
+        return cache.aggregate(df, [], restaurant_cols, {"Year": [year]}, scope="reports")
+    return cache.aggregate(df, ["Product"], ["Total"], {"Year": [year]}, scope="reports")
+
+
+def build_report(df: pd.DataFrame, report_type: str, year) -> pd.DataFrame:
+    """
+    Построение таблицы отчёта выбранного типа по данным одного года.
+    Возвращает пустой DataFrame, если отчёт построить невозможно.
+    """
+    if report_type not in REPORT_TYPES:
+        return pd.DataFrame()
+    sums = report_sums(df, report_type, year)
+    if sums.empty:
+        return pd.DataFrame()
+
+    if report_type == "Итоговый отчёт по всей сети":
+        summary = sums.copy()
+        summary['Total'] = summary['Total'].astype(int).apply(lambda x: f"{x:,}".replace(",", " "))
+        summary = summary.sort_values("Total", ascending=False)
+        return summary
+
+    if report_type == "Топ-10 продуктов":
+        product_sales = sums.set_index("Product")['Total'].sort_values(ascending=False).head(10)
+        top10_df = product_sales.reset_index()
+        top10_df['Total'] = top10_df['Total'].astype(int).apply(lambda x: f"{x:,}".replace(",", " "))
+        return top10_df
+
+    rest_sums = sums.iloc[0].sort_values(ascending=False)
+    rest_df = rest_sums.reset_index()
+    rest_df.columns = ["Ресторан", "Продажи"]
+    rest_df['Продажи'] = rest_df['Продажи'].astype(int).apply(lambda x: f"{x:,}".replace(",", " "))
+    return rest_df
+
+
+def report_params() -> dict:
+    """
+    Параметры файла отчёта помимо типа, года и версии данных: состав отчётов задают каталог продуктов
+    (набор reports) и справочник ресторанов, поэтому после их правки файл собирается заново.
+    """
+    return {"catalog": get_catalog().fingerprint, "registry": get_registry().fingerprint}
+
+
+def schedule_report_pack(df: pd.DataFrame, version: str | None = None):
+    """
+    Фоновая сборка всех отчётов (каждый тип × каждый год) для новой версии данных.
+    Вызывается после загрузки данных, чтобы к моменту открытия страницы файлы уже лежали на диске.
+    """
+    version = version or current_version(df)
+    cache = get_artifact_cache()
+    params = report_params()
+    for year in report_years(df):
+        for report_type in REPORT_TYPES:
+            cache.schedule(
+                report_type, year, version,
+                builder=lambda y=year, t=report_type: to_excel_bytes(build_report(df, t, y), "Отчёт"),
+                params=params
+            )
+
+
+def report_years(df: pd.DataFrame) -> list:
+    """Годы, в которых есть продажи продуктов из набора reports."""
+    return sorted(get_query_cache().aggregate(df, ["Year"], ["Total"], scope="reports", agg="count")["Year"])
 
 
 def generate_reports(df: pd.DataFrame):
@@ -10,112 +95,47 @@ def generate_reports(df: pd.DataFrame):
     """
     st.subheader("Формирование отчётов")
 
-    # Разрешённые продукты
-    allowed_products = [
-        "П/Ф Говядина",
-        "П/Ф Гагава",
-        "П/Ф Курица в соусе",
-        "П/Ф Лакомство от шефа",
-        "П/Ф Цезарь",
-        "П/Ф Чили",
-        "П/Ф Кекиклим",
-        "П/Ф Курица на суп",
-        "П/Ф Картофель Фри 2,5 кг",
-        "П/Ф Луковые кольца 1 кг",
-        "Мозаика",
-        "Пюре из баклажанов",
-        "Соус Баффало",
-        "Соус Песто",
-        "Соус Сладкий перец",
-        "Соус Тайский сладкий чили",
-        "Сироп малина",
-        "Сироп грейпфрут",
-        "Сироп карамельный",
-        "Сироп ванильный",
-        "Торт манго-маракуйя",
-        "Торт медовик",
-        "Десерт фруктовый \"Сорбет\" манго",
-        "Мороженое \"Пломбир-ваниль\"",
-        "Мороженое с клубникой",
-        "Мороженое шоколаденое с кус.шоколада",
-        "Соус Балканский",
-        "Кофе",
-        "Чечевица",
-        "Makaroma Penne (Турция)",
-        "Паста Bavette Barilla (Россия), 450г",
-        "Паста Filini Barilla (Россия), 450г"
-    ]
-
-    # Фильтрация данных
-    df = df[df['Product'].isin(allowed_products)]
-
-    # Фильтр по году
-    available_years = df['Year'].unique()
-    selected_year = st.selectbox("Выберите год для анализа", sorted(available_years))
-    df = df[df['Year'] == selected_year]
+    version = current_version(df)
+
+    # Фильтр по году (разрешённые продукты — по каталогу)
+    selected_year = st.selectbox("Выберите год для анализа", report_years(df))
 
     # Выбор типа отчёта
-    report_type = st.selectbox("Выберите тип отчёта", [
-        "Итоговый отчёт по всей сети",
-        "Топ-10 продуктов",
-        "Рейтинги ресторанов"
-    ])
+    report_type = st.selectbox("Выберите тип отчёта", REPORT_TYPES)
 
-    report_df = pd.DataFrame()
+    # Суммы берутся из кэша запросов: смена года или типа отчёта не пересчитывает группировки
+    report_df = build_report(df, report_type, selected_year)
 
     if report_type == "Итоговый отчёт по всей сети":
         st.write("Сформируем сводный отчёт по столбцу 'Total' (общие продажи).")
-        summary = df.groupby("Product")['Total'].sum().reset_index()
-        summary['Total'] = summary['Total'].astype(int).apply(lambda x: f"{x:,}".replace(",", " "))
-        summary = summary.sort_values("Total", ascending=False)
-        st.dataframe(summary)
-        report_df = summary
+        st.dataframe(report_df)
 
     elif report_type == "Топ-10 продуктов":
         st.write("Определим топ-10 продуктов по объёму продаж (Total).")
-        product_sales = df.groupby("Product")['Total'].sum().sort_values(ascending=False).head(10)
-        top10_df = product_sales.reset_index()
-        top10_df['Total'] = top10_df['Total'].astype(int).apply(lambda x: f"{x:,}".replace(",", " "))
-        st.dataframe(top10_df)
-        report_df = top10_df
+        st.dataframe(report_df)
 
     elif report_type == "Рейтинги ресторанов":
         st.write("Покажем рейтинги ресторанов по продажам.")
-        restaurant_cols = []
-        for col in df.columns:
-            if col not in {"Week", "Year", "Month", "Product", "Total", "SeasonFlag", "HolidayFlag", "Case kg"}:
-                restaurant_cols.append(col)
-
-        if restaurant_cols:
-            rest_sums = df[restaurant_cols].sum().sort_values(ascending=False)
-            rest_df = rest_sums.reset_index()
-            rest_df.columns = ["Ресторан", "Продажи"]
-            rest_df['Продажи'] = rest_df['Продажи'].astype(int).apply(lambda x: f"{x:,}".replace(",", " "))
-            st.dataframe(rest_df)
+        if not report_df.empty:
+            st.dataframe(report_df)
 
             # График
-            fig = px.bar(rest_df, x="Ресторан", y="Продажи", title="Рейтинги ресторанов по продажам")
-            st.plotly_chart(fig)
-
-            report_df = rest_df
+            show_figure("restaurant_ranking", version, lambda: bar_figure(
+                report_df, x="Ресторан", y="Продажи", title="Рейтинги ресторанов по продажам"
+            ), params=(selected_year, frame_key(report_df)), use_container_width=False)
         else:
             st.warning("Ресторанные столбцы не найдены. Рейтинг невозможен.")
 
-    # Кнопка для экспорта отчёта в Excel
+    # Кнопка для экспорта отчёта (файл берётся из кэша артефактов)
     if not report_df.empty:
         st.write("---")
-        st.write("Скачать отчёт в Excel:")
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-            report_df.to_excel(writer, index=False, sheet_name="Отчёт")
-        output.seek(0)  # Перемещение курсора в начало BytesIO
-        excel_data = output.read()
-
-        st.download_button(
-            label="Скачать Excel",
-            data=excel_data,
-            file_name=f"report_{selected_year}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        st.write("Скачать отчёт:")
+        download_table(
+            report_df, report_type, selected_year, version,
+            label="Скачать отчёт",
+            file_stem=f"report_{selected_year}",
+            sheet_name="Отчёт",
+            params=report_params()
         )
 
-    st.info("Отчёт сгенерирован! Выберите тип отчёта и скачайте Excel-файл при необходимости.")
+    st.info("Отчёт сгенерирован! Выберите тип отчёта и скачайте файл при необходимости.")
@@ -1,8 +1,48 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
-import io
+from catalog import get_catalog, product_mask
+from charts import bar_figure, frame_key, show_figure
+from cold_start import DEFAULT_NEIGHBOURS, cold_start_forecast, demand_source, store_index
+from elasticity import ElasticityBook, load_elasticities, manage_elasticities
+from exporters import download_table
+from registry import get_registry
+from snapshot import SCENARIO_KEY
+from versioning import current_version
+
+
+# Пункт списка городов для точки в городе, где сети ещё нет
+OTHER_CITY = "Другой город"
+
+
+def new_store_demand(df: pd.DataFrame) -> pd.Series:
+    """
+    Спрос одной новой точки по продуктам (в неделю) по аналогам среди действующих ресторанов.
+    Поиск аналогов — одно умножение матрицы профилей на вектор, поэтому параметры можно менять свободно.
+    """
+    index = store_index(df, current_version(df), get_registry().fingerprint)
+    city = st.selectbox("Город новых ресторанов", index.cities + [OTHER_CITY])
+    references = st.multiselect("Рестораны-ориентиры по формату (необязательно)", index.restaurants)
+    k = st.slider("Число ресторанов-аналогов", 1, min(10, len(index.restaurants)),
+                  min(DEFAULT_NEIGHBOURS, len(index.restaurants)))
+    scale = st.slider("Масштаб новой точки относительно аналогов, %", min_value=50, max_value=150, value=100, step=5)
+
+    top, similarity, weights = index.neighbours(index.query(city, references), k)
+    demand, source = demand_source(index)
+    st.dataframe(pd.DataFrame({
+        "Ресторан-аналог": [index.restaurants[i] for i in top],
+        "Город": [index.city_of[i] for i in top],
+        "Сходство": similarity.round(3),
+        "Вес": weights.round(3),
+    }), hide_index=True)
+    st.caption(f"Спрос аналогов: {source}.")
+    return cold_start_forecast(index, demand, top, weights, scale / 100.0)
+
+
+def _option_index(options, value) -> int:
+    """Позиция сохранённого значения в списке вариантов (первый вариант, если значения нет)."""
+    options = list(options)
+    return options.index(value) if value in options else 0
 
 
 def scenario_planning(df: pd.DataFrame):
@@ -16,35 +56,22 @@ def scenario_planning(df: pd.DataFrame):
     st.subheader("Сценарное моделирование")
 
     # Список продуктов для анализа
-    selected_products = [
-        "П/Ф Говядина",
-        "П/Ф Гагава",
-        "П/Ф Курица в соусе",
-        "П/Ф Лакомство от шефа",
-        "П/Ф Цезарь",
-        "П/Ф Чили",
-        "П/Ф Кекиклим",
-        "П/Ф Курица на суп",
-        "П/Ф Картофель Фри 2,5 кг",
-        "П/Ф Луковые кольца 1 кг",
-        "Мозаика",
-        "Пюре из баклажанов",
-        "Соус Баффало",
-        "Соус Песто",
-        "Соус Сладкий перец"
-    ]
-
-    # Фильтруем данные только по указанным продуктам
-    df_filtered = df[df["Product"].isin(selected_products)]
+    selected_products = get_catalog().names_in("portion")
+
+    # Фильтруем данные только по указанным продуктам (маска по кодам каталога)
+    df_filtered = df[product_mask(df, "portion", current_version(df))].copy()
     if df_filtered.empty:
         st.warning("Нет данных по указанным продуктам.")
         return
 
+    # Параметры прошлого расчёта (в том числе восстановленные из снимка сессии) — значения по умолчанию
+    saved = st.session_state.get(SCENARIO_KEY, {})
+
     # Шаг 1. Выбор ресторана или общих показателей
-    restaurant_cols = [col for col in df.columns if
-                       col not in {"Year", "Month", "Case kg", "Week", "Product", "Total", "SeasonFlag"}]
-    restaurant_selection = st.selectbox("Выберите ресторан или общий показатель:",
-                                        ["Общие показатели"] + restaurant_cols)
+    restaurant_cols = get_registry().restaurant_columns(df)
+    restaurant_options = ["Общие показатели"] + restaurant_cols
+    restaurant_selection = st.selectbox("Выберите ресторан или общий показатель:", restaurant_options,
+                                        index=_option_index(restaurant_options, saved.get("restaurant")))
 
     if restaurant_selection == "Общие показатели":
         # Рассчитываем среднее значение продаж за неделю по всем годам и ресторанам
@@ -56,7 +83,7 @@ def scenario_planning(df: pd.DataFrame):
         if restaurant_selection not in df.columns:
             st.error("Выбранный ресторан отсутствует в данных.")
             return
-        df_filtered = df_filtered[df_filtered[restaurant_selection] > 0]
+        df_filtered = df_filtered[df_filtered[restaurant_selection] > 0].copy()
         df_filtered["Base Sales"] = df_filtered[restaurant_selection]
         overall_base_sales = df_filtered.groupby("Product")["Base Sales"].mean().reset_index()
         overall_base_sales.columns = ["Продукт", "Базовые продажи"]
@@ -65,102 +92,131 @@ def scenario_planning(df: pd.DataFrame):
     st.write("1) Изменение цены на каждый продукт (или общее изменение для всех продуктов).")
 
     # Вариант изменения цен: индивидуально или для всех
-    price_change_type = st.radio("Выберите способ изменения цен:",
-                                 ("Индивидуально по каждому продукту", "Общее изменение для всех продуктов"))
+    price_change_types = ("Индивидуально по каждому продукту", "Общее изменение для всех продуктов")
+    price_change_type = st.radio("Выберите способ изменения цен:", price_change_types,
+                                 index=_option_index(price_change_types, saved.get("price_change_type")))
 
     # Словарь для хранения изменений цены
     price_changes = {}
+    global_price_change = saved.get("global_price", 0)
 
     if price_change_type == "Индивидуально по каждому продукту":
         for product in selected_products:
             price_changes[product] = st.slider(f"Изменение цены для {product} (%)", min_value=-50, max_value=100,
-                                               value=0, step=5)
+                                               value=saved.get("prices", {}).get(product, 0), step=5)
     else:
         global_price_change = st.slider("Общее изменение цены для всех продуктов (%)", min_value=-50, max_value=100,
-                                        value=0, step=5)
+                                        value=saved.get("global_price", 0), step=5)
         for product in selected_products:
             price_changes[product] = global_price_change
 
     st.write("2) Изменение нормы порции (если мы хотим увеличить/уменьшить размер).")
-    portion_change_percent = st.slider("Изменение нормы порции, %", min_value=-50, max_value=50, value=0, step=5)
+    portion_change_percent = st.slider("Изменение нормы порции, %", min_value=-50, max_value=50,
+                                       value=saved.get("portion", 0), step=5)
 
     st.write("3) Количество новых ресторанов, которые планируется открыть.")
-    new_restaurants_count = st.number_input("Число новых ресторанов", min_value=0, max_value=50, value=0, step=1)
+    new_restaurants_count = st.number_input("Число новых ресторанов", min_value=0, max_value=50,
+                                            value=saved.get("new_restaurants", 0), step=1)
+    new_store = new_store_demand(df) if new_restaurants_count else pd.Series(dtype=float)
 
     st.write("4) Прочие факторы (например, планируемая акция).")
     promo_change_percent = st.slider("Укажите процент повышения спроса при акции (%)", min_value=0, max_value=100,
-                                     value=20, step=5)
+                                     value=saved.get("promo", 20), step=5)
+
+    # Текущие параметры сценария сохраняются в сессии (и попадают в снимок сессии)
+    st.session_state[SCENARIO_KEY] = {
+        "restaurant": restaurant_selection,
+        "price_change_type": price_change_type,
+        "prices": price_changes,
+        "global_price": global_price_change,
+        "portion": portion_change_percent,
+        "new_restaurants": int(new_restaurants_count),
+        "promo": promo_change_percent,
+    }
+
+    # Эластичности оцениваются пакетной задачей по истории цен; здесь только читаются сохранённые оценки
+    with st.expander("Эластичность спроса по цене"):
+        manage_elasticities(df)
+    elasticities = ElasticityBook(load_elasticities(current_version(df)))
+    city = None if restaurant_selection == "Общие показатели" else get_registry().city_of.get(restaurant_selection)
 
     # Шаг 3. Расчёт сценарных продаж для каждого продукта
     scenario_sales = []
-    elasticity = -1.0  # Эластичность цены
     for _, row in overall_base_sales.iterrows():
         product = row["Продукт"]
         base_sales = row["Базовые продажи"]
 
-        # Изменение цены
-        price_factor = 1.0 + (price_changes[product] / 100.0) * elasticity
+        # Изменение цены: модель постоянной эластичности (та же, что при оценке в логарифмах)
+        elasticity, elasticity_source = elasticities.get(str(product), city)
+        price_factor = (1.0 + price_changes.get(product, 0) / 100.0) ** elasticity
         new_sales = base_sales * price_factor
 
         # Изменение нормы порции
         portion_factor = 1.0 + (portion_change_percent / 100.0)
         new_sales *= portion_factor
 
-        # Учёт новых ресторанов
-        new_restaurant_factor = 0.05  # Каждый новый ресторан даёт 5% от базовых продаж
-        new_sales += new_restaurants_count * (base_sales * new_restaurant_factor)
+        # Учёт новых ресторанов: спрос каждой новой точки оценивается по ресторанам-аналогам
+        new_sales += new_restaurants_count * new_store.get(str(product), 0.0)
 
         # Промо-акция
         new_sales *= 1.0 + (promo_change_percent / 100.0)
 
         # Добавляем результат в список
-        scenario_sales.append({"Продукт": product, "Базовые продажи": base_sales, "Сценарные продажи": new_sales})
+        scenario_sales.append({"Продукт": product, "Базовые продажи": base_sales, "Сценарные продажи": new_sales,
+                               "Эластичность": round(elasticity, 3), "Источник эластичности": elasticity_source})
 
     # Шаг 4. Создание DataFrame для отображения результатов
     scenario_df = pd.DataFrame(scenario_sales)
     scenario_df["Изменение (%)"] = ((scenario_df["Сценарные продажи"] - scenario_df["Базовые продажи"]) /
                                     scenario_df["Базовые продажи"] * 100).round(2)
 
+    # Отпечаток расчётной таблицы: в неё входят и эластичности с источником, которые меняются
+    # после переоценки без смены версии данных, — по нему кэшируются выгрузка и графики
+    scenario_key = (frame_key(scenario_df),)
+
     # Вывод таблицы
     st.write("### Таблица результатов:")
     st.dataframe(scenario_df)
 
-    # Кнопка для скачивания отчёта в формате Excel
+    # Кнопка для скачивания отчёта (Excel / Parquet / Arrow / CSV)
     st.write("### Скачивание отчёта:")
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        scenario_df.to_excel(writer, index=False, sheet_name="Scenario Report")
-    excel_data = output.getvalue()
-
-    st.download_button(
-        label="Скачать отчёт в формате Excel",
-        data=excel_data,
-        file_name="Сценарное_моделирование.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    download_table(
+        scenario_df, "Scenario Report", None, current_version(df),
+        label="Скачать отчёт",
+        file_stem="Сценарное_моделирование",
+        sheet_name="Scenario Report",
+        params={
+            "restaurant": restaurant_selection,
+            "prices": price_changes,
+            "portion": portion_change_percent,
+            "new_restaurants": new_restaurants_count,
+            "new_store": new_store.round(3).to_dict(),
+            "promo": promo_change_percent,
+            "table": scenario_key[0]
+        }
     )
 
     # Шаг 5. Построение графиков
     st.write("### Визуализация данных:")
 
     # График сравнения базовых и сценарных продаж
-    fig = px.bar(
+    # Графики зависят от параметров сценария — ключ кэша включает отпечаток расчётной таблицы
+    show_figure("scenario_sales", current_version(df), lambda: bar_figure(
         scenario_df,
         x="Продукт",
         y=["Базовые продажи", "Сценарные продажи"],
         title="Сравнение базовых и сценарных продаж",
         labels={"value": "Продажи", "Продукт": "Продукт"},
         barmode="group"
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    ), params=scenario_key)
 
     # График изменения продаж в процентах
-    fig_change = px.bar(
+    show_figure("scenario_change", current_version(df), lambda: bar_figure(
         scenario_df,
         x="Продукт",
         y="Изменение (%)",
         title="Изменение продаж в процентах",
         labels={"Изменение (%)": "Изменение (%)", "Продукт": "Продукт"}
-    )
-    st.plotly_chart(fig_change, use_container_width=True)
+    ), params=scenario_key)
 
     st.success("Сценарий рассчитан! Можете менять параметры и смотреть результат.")
@@ -0,0 +1,199 @@
+import streamlit as st
+import pandas as pd
+import datetime
+import io
+import json
+import os
+import time
+import uuid
+import zipfile
+from array_store import ALL_FORECAST_JOB
+from data_service import session_dataset, set_session_dataset
+from jobs import Job, get_job_queue, job_id_for, save_result
+from monitoring import issue_forecast
+from versioning import attach_version, current_version, derived_version, version_from_frame
+
+# Каталог снимков на сервере: <SNAPSHOT_DIR>/<версия данных>_<время>_<случайный суффикс>.zip
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots")
+
+# Версия формата снимка: при несовместимых изменениях старые снимки не восстанавливаются
+SNAPSHOT_FORMAT = 1
+
+# Ключи session_state, которые попадают в снимок вместе с данными
+PORTION_KEY = "portion_results"
+SCENARIO_KEY = "scenario_settings"
+
+# Ключ session_state с путём к последнему сохранённому снимку сессии
+SAVED_KEY = "snapshot_path"
+
+# Файлы внутри снимка
+MANIFEST = "manifest.json"
+DATA_FILE = "data.parquet"
+FORECAST_FILE = "forecast.parquet"
+PORTION_FILE = "portion_results.parquet"
+
+
+def _parquet_bytes(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False, engine="pyarrow", compression="zstd")
+    return buffer.getvalue()
+
+
+def build_snapshot(df: pd.DataFrame) -> bytes:
+    """
+    Снимок сессии одним zip-файлом: очищенные данные, пакетный прогноз и результаты порционности — Parquet (zstd),
+    параметры прогноза и сценария — manifest.json. Parquet уже сжат, поэтому в архив он кладётся без сжатия.
+    """
+    forecast_info = st.session_state.get(ALL_FORECAST_JOB)
+    job = get_job_queue().get(forecast_info["id"]) if forecast_info else None
+    forecast = job.result() if job is not None and job.finished_ok else None
+    portions = st.session_state.get(PORTION_KEY)
+
+    files = {DATA_FILE: _parquet_bytes(df)}
+    if isinstance(forecast, pd.DataFrame):
+        files[FORECAST_FILE] = _parquet_bytes(forecast)
+    if isinstance(portions, pd.DataFrame):
+        files[PORTION_FILE] = _parquet_bytes(portions)
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": current_version(df),
+        "content": version_from_frame(df),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "rows": len(df),
+        "files": sorted(files),
+        "forecast": {k: v for k, v in forecast_info.items() if k != "id"} if FORECAST_FILE in files else None,
+        "scenario": st.session_state.get(SCENARIO_KEY),
+    }
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=1, default=str),
+                         compress_type=zipfile.ZIP_DEFLATED)
+        for name, data in files.items():
+            archive.writestr(name, data, compress_type=zipfile.ZIP_STORED)
+    return buffer.getvalue()
+
+
+def save_snapshot(df: pd.DataFrame) -> str:
+    """
+    Записывает снимок текущей сессии в SNAPSHOT_DIR (атомарно) и возвращает путь к файлу.
+    Имя уникально (время + случайный суффикс): снимки разных пользователей одной версии данных не перезаписываются.
+    """
+    data = build_snapshot(df)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(SNAPSHOT_DIR, f"{current_version(df)}_{stamp}_{uuid.uuid4().hex[:8]}.zip")
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_manifest(source) -> dict:
+    with zipfile.ZipFile(source) as archive:
+        return json.loads(archive.read(MANIFEST))
+
+
+def list_snapshots() -> list[dict]:
+    """Снимки на сервере, новые первыми: манифест + путь к файлу."""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    snapshots = []
+    for entry in os.scandir(SNAPSHOT_DIR):
+        if not entry.name.endswith(".zip"):
+            continue
+        try:
+            snapshots.append({**read_manifest(entry.path), "path": entry.path})
+        except (zipfile.BadZipFile, KeyError, ValueError):
+            continue
+    return sorted(snapshots, key=lambda s: s["created"], reverse=True)
+
+
+def restore_snapshot(data: bytes) -> dict:
+    """
+    Восстанавливает сессию из снимка: данные публикуются в общем сервисе,
+    прогноз регистрируется как готовый результат задачи (страница прогноза покажет его без пересчёта)
+    и выдаётся так же, как при её завершении; результаты порционности и параметры сценария
+    возвращаются в session_state. Возвращает манифест.
+
+    Версиям из манифеста загруженного файла не доверяем: версия данных пересчитывается по восстановленной
+    таблице (и сверяется с отпечатком в манифесте), ключ прогноза — по этой версии и содержимому прогноза.
+    Поэтому файл снимка не может подменить данные, кэши, API или архив мониторинга чужой версии.
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        manifest = json.loads(archive.read(MANIFEST))
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Неподдерживаемый формат снимка: {manifest.get('format')}")
+        df = pd.read_parquet(io.BytesIO(archive.read(DATA_FILE)))
+        forecast = (pd.read_parquet(io.BytesIO(archive.read(FORECAST_FILE)))
+                    if manifest.get("forecast") and FORECAST_FILE in archive.namelist() else None)
+        portions = (pd.read_parquet(io.BytesIO(archive.read(PORTION_FILE)))
+                    if PORTION_FILE in archive.namelist() else None)
+
+    version = version_from_frame(df)
+    if manifest.get("content", version) != version:
+        raise ValueError("Данные снимка не совпадают с его манифестом (файл повреждён или изменён)")
+    set_session_dataset(attach_version(df, version))
+    if forecast is not None:
+        info = dict(manifest["forecast"])
+        info["key"] = derived_version(version, "snapshot", info["key"], version_from_frame(forecast))
+        info["id"] = job_id_for(info["key"])
+        info["upgraded"] = tuple(tuple(pair) for pair in info.get("upgraded", ()))
+        if get_job_queue().get(info["id"]) is None:
+            save_result(Job(info["id"], "Прогноз по всем ресторанам и продуктам (из снимка)"), forecast)
+            # Прогноз из снимка выдаётся так же, как завершённая задача: хранилище, API, архив
+            issue_forecast(forecast, info["key"], version, info.get("grain", "W"), info["horizon"],
+                           info["preset"], info["origin"], info["upgraded"])
+        st.session_state[ALL_FORECAST_JOB] = info
+    if portions is not None:
+        st.session_state[PORTION_KEY] = portions
+    if manifest.get("scenario"):
+        st.session_state[SCENARIO_KEY] = manifest["scenario"]
+    return manifest
+
+
+def _describe(manifest: dict) -> str:
+    parts = [f"{manifest['created']}", f"версия {manifest['version']}", f"строк: {manifest['rows']}"]
+    if manifest.get("forecast"):
+        parts.append("прогноз")
+    if PORTION_FILE in manifest.get("files", []):
+        parts.append("порции")
+    if manifest.get("scenario"):
+        parts.append("сценарий")
+    return ", ".join(parts)
+
+
+def show_snapshots():
+    """Сохранение снимка текущей сессии и восстановление из файла или из снимков на сервере."""
+    df = session_dataset()
+    if df is not None:
+        if st.button("Сохранить снимок текущей сессии"):
+            path = save_snapshot(df)
+            st.session_state[SAVED_KEY] = path
+            st.success(f"Снимок сохранён: {os.path.basename(path)}")
+        path = st.session_state.get(SAVED_KEY)
+        if path and os.path.basename(path).startswith(f"{current_version(df)}_") and os.path.exists(path):
+            with open(path, "rb") as f:
+                st.download_button("Скачать снимок (для коллег)", f.read(),
+                                   file_name=f"forecastggw_{current_version(df)}.zip", mime="application/zip")
+
+    uploaded = st.file_uploader("Восстановить из файла снимка", type=["zip"], key="snapshot_upload")
+    saved = list_snapshots()
+    choice = st.selectbox("Или из снимков на сервере", [None] + saved, key="snapshot_choice",
+                          format_func=lambda s: "—" if s is None else _describe(s))
+
+    if st.button("Восстановить", disabled=uploaded is None and choice is None):
+        start = time.perf_counter()
+        try:
+            if uploaded is not None:
+                data = uploaded.getvalue()
+            else:
+                with open(choice["path"], "rb") as f:
+                    data = f.read()
+            manifest = restore_snapshot(data)
+        except (zipfile.BadZipFile, KeyError, ValueError) as e:
+            st.error(f"Не удалось восстановить снимок: {e}")
+            return
+        st.success(f"Сессия восстановлена за {time.perf_counter() - start:.2f} с: {_describe(manifest)}. "
+                   "Можно переходить к разделам приложения.")
@@ -0,0 +1,179 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import datetime
+import json
+from anomalies import total_mismatch, total_residual
+from database import get_connection
+from registry import get_registry
+from versioning import current_version, derived_version
+
+# Обязательные и известные служебные столбцы выгрузки (всё остальное должно быть рестораном из справочника)
+REQUIRED_COLUMNS = ["Year", "Week", "Month", "Product", "Total"]
+KNOWN_COLUMNS = {"Case kg", "Date", "SeasonFlag", "HolidayFlag", "PromoFlag"}
+
+# Сколько примеров расхождений сохранять в отчёте
+MAX_EXAMPLES = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS validation_reports (
+    version  TEXT PRIMARY KEY,
+    created  TEXT NOT NULL,
+    report   TEXT NOT NULL
+)
+"""
+
+
+def week_ordinals(years: pd.Series, weeks: pd.Series) -> np.ndarray:
+    """Порядковый номер ISO-недели (сквозной счёт недель): соседние недели отличаются на 1."""
+    years = pd.to_numeric(years, errors="coerce").fillna(0).to_numpy(np.int64)
+    weeks = pd.to_numeric(weeks, errors="coerce").fillna(0).to_numpy(np.int64)
+    # Понедельник ISO-недели 1 каждого года: 4 января минус номер его дня недели
+    uniq = np.unique(years)
+    first_monday = {}
+    for year in uniq.tolist():
+        if year > 0:
+            jan4 = datetime.date(year, 1, 4)
+            first_monday[year] = (jan4 - datetime.timedelta(days=jan4.weekday())).toordinal() // 7
+    base = np.array([first_monday.get(year, 0) for year in uniq.tolist()], dtype=np.int64)
+    return base[np.searchsorted(uniq, years)] + weeks - 1
+
+
+def week_gaps(df: pd.DataFrame) -> pd.DataFrame:
+    """Пропущенные недели по каждому продукту между его первой и последней неделей."""
+    ordinals = week_ordinals(df["Year"], df["Week"])
+    stats = (
+        pd.DataFrame({"Product": df["Product"].astype(str).to_numpy(), "week": ordinals})
+        .groupby("Product")
+        .agg(first=("week", "min"), last=("week", "max"), weeks=("week", "nunique"))
+    )
+    stats["missing"] = stats["last"] - stats["first"] + 1 - stats["weeks"]
+    return stats[stats["missing"] > 0].sort_values("missing", ascending=False)
+
+
+def validate_dataset(df: pd.DataFrame) -> dict:
+    """
+    Проверка выгрузки при загрузке: схема столбцов по справочнику ресторанов,
+    совпадение Total с суммой ресторанов по каждой строке, непрерывность недель по продуктам.
+    Возвращает компактный отчёт (словарь, сериализуемый в JSON).
+    """
+    registry = get_registry()
+    restaurants = registry.restaurant_columns(df)
+    non_numeric = [name for name in registry.restaurant_columns(df, numeric_only=False) if name not in restaurants]
+    unknown = [str(col) for col in df.columns
+               if col not in REQUIRED_COLUMNS and col not in KNOWN_COLUMNS and not registry.is_restaurant(col)]
+    missing_restaurants = [name for name in registry.names if name not in df.columns]
+
+    residual = total_residual(df, restaurants)
+    mismatch = total_mismatch(df, restaurants, residual)
+    examples = df.loc[mismatch, ["Year", "Week", "Product", "Total"]].head(MAX_EXAMPLES).assign(
+        Сумма_ресторанов=(df.loc[mismatch, "Total"].to_numpy()[:MAX_EXAMPLES]
+                          - residual[mismatch][:MAX_EXAMPLES])
+    )
+
+    gaps = week_gaps(df)
+    report = {
+        "version": current_version(df),
+        "registry": registry.fingerprint,
+        "rows": int(len(df)),
+        "products": int(df["Product"].nunique()),
+        "restaurants": len(restaurants),
+        "missing_restaurants": missing_restaurants,
+        "unknown_columns": unknown,
+        "non_numeric_restaurants": non_numeric,
+        "total_mismatch_rows": int(mismatch.sum()),
+        "total_mismatch_share": float(mismatch.mean()) if len(df) else 0.0,
+        "max_abs_residual": float(np.abs(residual).max()) if len(df) else 0.0,
+        "mismatch_examples": json.loads(examples.to_json(orient="records", force_ascii=False)),
+        "products_with_gaps": int(len(gaps)),
+        "missing_weeks": int(gaps["missing"].sum()),
+        "week_gaps": [
+            {"product": product, "missing": int(row.missing)}
+            for product, row in gaps.head(MAX_EXAMPLES).iterrows()
+        ],
+    }
+    report["status"] = "ok" if not (report["total_mismatch_rows"] or unknown or non_numeric
+                                    or report["missing_weeks"]) else "warning"
+    return report
+
+
+def ensure_reports_table(conn):
+    conn.execute(SCHEMA)
+    conn.commit()
+
+
+def _report_key(version: str, registry: str) -> str:
+    return derived_version(version, "validation", registry)
+
+
+def save_report(report: dict):
+    """Сохраняет отчёт под версией набора данных и справочника ресторанов (отчёт проверяет столбцы по нему)."""
+    conn = get_connection()
+    try:
+        ensure_reports_table(conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO validation_reports (version, created, report) VALUES (?, ?, ?)",
+            (_report_key(report["version"], report["registry"]), datetime.datetime.now().isoformat(timespec="seconds"),
+             json.dumps(report, ensure_ascii=False))
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_report(version: str, registry: str) -> dict | None:
+    conn = get_connection()
+    try:
+        ensure_reports_table(conn)
+        row = conn.execute("SELECT report FROM validation_reports WHERE version = ?",
+                           (_report_key(version, registry),)).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row["report"]) if row else None
+
+
+def validation_report(df: pd.DataFrame) -> dict:
+    """
+    Отчёт проверки для версии df и текущего справочника ресторанов: берётся из БД,
+    при первом обращении строится и сохраняется. Страницы используют его вместо собственных повторных проверок.
+    """
+    report = load_report(current_version(df), get_registry().fingerprint)
+    if report is None:
+        report = validate_dataset(df)
+        save_report(report)
+    return report
+
+
+def reconcile_totals(df: pd.DataFrame) -> pd.DataFrame:
+    """Пересчитывает Total как сумму ресторанных столбцов в строках с расхождением."""
+    restaurants = get_registry().restaurant_columns(df)
+    residual = total_residual(df, restaurants)
+    mismatch = total_mismatch(df, restaurants, residual)
+    if not mismatch.any():
+        return df
+    total = pd.to_numeric(df["Total"], errors="coerce").to_numpy(np.float64, na_value=0)
+    return df.assign(Total=np.where(mismatch, total - residual, total))
+
+
+def show_validation(report: dict):
+    """Компактный отчёт проверки на странице загрузки."""
+    if report["status"] == "ok":
+        st.success(f"Проверка данных пройдена: {report['rows']} строк, {report['products']} продуктов, "
+                   f"{report['restaurants']} ресторанов.")
+    else:
+        st.warning("Проверка данных выявила проблемы — подробности ниже.")
+
+    if report["total_mismatch_rows"]:
+        st.write(f"Строк, где Total ≠ сумме ресторанов: {report['total_mismatch_rows']} "
+                 f"({report['total_mismatch_share']:.1%}), макс. расхождение {report['max_abs_residual']:.1f}")
+        st.dataframe(pd.DataFrame(report["mismatch_examples"]), hide_index=True)
+    if report["unknown_columns"]:
+        st.write(f"Столбцы вне справочника ресторанов: {', '.join(report['unknown_columns'])}")
+    if report["non_numeric_restaurants"]:
+        st.write(f"Нечисловые столбцы ресторанов: {', '.join(report['non_numeric_restaurants'])}")
+    if report["missing_restaurants"]:
+        st.write(f"Рестораны справочника без данных: {', '.join(report['missing_restaurants'])}")
+    if report["missing_weeks"]:
+        st.write(f"Пропущено недель: {report['missing_weeks']} у {report['products_with_gaps']} продуктов")
+        st.dataframe(pd.DataFrame(report["week_gaps"]).rename(
+            columns={"product": "Продукт", "missing": "Пропущено недель"}), hide_index=True)
@@ -0,0 +1,50 @@
+import pandas as pd
+import hashlib
+
+# Ключ в DataFrame.attrs и в session_state, под которым хранится версия набора данных
+VERSION_KEY = "data_version"
+
+
+def version_from_files(files) -> str:
+    """
+    Версия набора данных по содержимому загруженных файлов.
+    Считается один раз при загрузке: хэшируются байты файлов, а не DataFrame.
+    """
+    digest = hashlib.sha1()
+    for name, data in sorted((f.name, f.getvalue()) for f in files):
+        digest.update(name.encode("utf-8"))
+        digest.update(hashlib.sha1(data).digest())
+    return digest.hexdigest()[:16]
+
+
+def version_from_frame(df: pd.DataFrame) -> str:
+    """Версия по содержимому DataFrame (запасной вариант — полный проход по данным)."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values
+    digest = hashlib.sha1(row_hashes.tobytes())
+    digest.update(",".join(map(str, df.columns)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def attach_version(df: pd.DataFrame, version: str) -> pd.DataFrame:
+    """Сохраняет версию вместе с очищенными данными."""
+    df.attrs[VERSION_KEY] = version
+    return df
+
+
+def current_version(df: pd.DataFrame) -> str:
+    """
+    Версия набора данных, с которым работает страница.
+    Берётся из df.attrs (проставляется при загрузке и сохраняется в общем сервисе данных);
+    если её нет — вычисляется хэш содержимого и запоминается в attrs.
+    """
+    version = df.attrs.get(VERSION_KEY)
+    if version:
+        return version
+    return attach_version(df, version_from_frame(df)).attrs[VERSION_KEY]
+
+
+def derived_version(version: str, *parts) -> str:
+    """Ключ производного артефакта: версия данных + параметры построения."""
+    if not parts:
+        return version
+    return f"{version}-" + hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:8]